@@ -0,0 +1,239 @@
+"""Microbenchmarks of Jumbo core operations on synthetic clusters.
+
+The clusters are created in a temporary JUMBO_HOME, without Vagrant:
+
+    python benchmarks/core.py --sizes 10,100,1000 --output results.json
+
+For each cluster size, the time of each operation is measured and reported
+as JSON, with the scaling exponent of each operation (1 for linear, 2 for
+quadratic...). With `--baseline`, the results are compared to a previous
+run and the script fails if an operation got slower than the tolerance.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = [10, 50, 100, 500, 1000, 5000]
+
+# Nodes that are not workers in the synthetic clusters
+TOPOLOGY = [
+    ('master', ['master']),
+    ('sidemaster', ['sidemaster']),
+    ('edge', ['edge']),
+    ('ldap', ['ldap'])
+]
+
+
+def node_ip(index):
+    return '10.%d.%d.%d' % (index // 62500 % 250 + 1, index // 250 % 250,
+                            index % 250 + 1)
+
+
+class Timer:
+    """Accumulate the duration and the number of calls of an operation.
+    """
+
+    def __init__(self):
+        self.results = {}
+
+    def call(self, operation, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds, ops = self.results.get(operation, (0, 0))
+            self.results[operation] = (
+                seconds + time.perf_counter() - start, ops + 1)
+
+
+def bench_cluster(size, repeat):
+    """Build a synthetic cluster and time the core operations.
+
+    :param size: Number of nodes
+    :type size: int
+    :param repeat: Number of calls of the read-only operations
+    :type repeat: int
+    :return: The duration and number of calls of each operation
+    :rtype: dict
+    """
+
+    from jumbo.core import clusters, nodes, services
+    from jumbo.utils import artifacts, session as ss
+    from jumbo.utils.settings import JUMBODIR
+
+    timer = Timer()
+    cluster = 'bench%d' % size
+    ss.clear()
+    clusters.create_cluster(domain=None, cluster=cluster)
+
+    for i in range(size):
+        if i < len(TOPOLOGY):
+            name, types = TOPOLOGY[i]
+        else:
+            name, types = 'worker%d' % i, ['worker']
+        timer.call('nodes.add_node', nodes.add_node, name, node_ip(i),
+                   1024, types, cluster=cluster)
+
+    # Reverse order: the last services pull the others as dependencies
+    for s in reversed(services.get_available_services()):
+        if s in ss.svars['services']:
+            continue
+        dependencies = services.get_service_dependencies(
+            name=s, first=True, cluster=cluster)
+        timer.call('services.install_dependencies',
+                   services.install_dependencies,
+                   dependencies=dependencies, cluster=cluster)
+        timer.call('services.add_service', services.add_service,
+                   name=s, cluster=cluster)
+        timer.call('services.auto_assign', services.auto_assign,
+                   service=s, ha=False, cluster=cluster)
+
+    for _ in range(repeat):
+        for s in ss.svars['services']:
+            timer.call('services.check_ha', services.check_ha, s)
+        timer.call('services.get_services_components_hosts',
+                   services.get_services_components_hosts)
+
+    scm = services.get_services_components_hosts()
+    for _ in range(repeat):
+        timer.call('session.dump_config (unchanged)', ss.dump_config, scm)
+    for _ in range(repeat):
+        # Without manifest, all the artifacts are generated again
+        os.remove(JUMBODIR + cluster + '/' + artifacts.MANIFEST)
+        timer.call('session.dump_config', ss.dump_config, scm)
+
+    shutil.rmtree(JUMBODIR + cluster)
+    return timer.results
+
+
+def scaling(points):
+    """Return the exponent of the best power law fitting some timings.
+
+    :param points: (size, seconds per call) points
+    :type points: list
+    :return: The least squares slope in log-log scale, None with less than
+             2 points
+    :rtype: float
+    """
+
+    points = [(math.log(n), math.log(t)) for n, t in points if t > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var
+
+
+def run(sizes, repeat):
+    """Run the benchmarks at each cluster size.
+
+    :param sizes: Numbers of nodes
+    :type sizes: list
+    :param repeat: Number of calls of the read-only operations
+    :type repeat: int
+    :return: The report
+    :rtype: dict
+    """
+
+    operations = {}
+    for size in sizes:
+        print('Benchmarking a cluster of %d nodes...' % size,
+              file=sys.stderr)
+        for name, (seconds, ops) in bench_cluster(size, repeat).items():
+            operations.setdefault(name, []).append({
+                'nodes': size,
+                'calls': ops,
+                'seconds': seconds,
+                'per_call': seconds / ops
+            })
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'sizes': sizes,
+        'operations': operations,
+        'scaling': {name: scaling([(p['nodes'], p['per_call'])
+                                   for p in points])
+                    for name, points in operations.items()}
+    }
+
+
+def regressions(report, baseline, tolerance):
+    """List the operations slower than in a baseline report.
+
+    :param report: Report returned by `run`
+    :type report: dict
+    :param baseline: Previous report
+    :type baseline: dict
+    :param tolerance: Maximum ratio between the new and the old timings
+    :type tolerance: float
+    :return: (operation, nodes, old, new) of the regressions
+    :rtype: list
+    """
+
+    res = []
+    for name, points in report['operations'].items():
+        old = {p['nodes']: p['per_call']
+               for p in baseline['operations'].get(name, [])}
+        for p in points:
+            if p['nodes'] in old \
+                    and p['per_call'] > old[p['nodes']] * tolerance:
+                res.append((name, p['nodes'], old[p['nodes']],
+                            p['per_call']))
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Comma-separated numbers of nodes')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of calls of the read-only operations')
+    parser.add_argument('--output', help='JSON report file (default: stdout)')
+    parser.add_argument('--baseline', help='Previous JSON report to compare')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Maximum slowdown ratio against the baseline')
+    args = parser.parse_args()
+
+    sizes = sorted(int(s) for s in args.sizes.split(','))
+    if sizes[0] < len(TOPOLOGY) + 1:
+        parser.error('Clusters need at least %d nodes' % (len(TOPOLOGY) + 1))
+
+    # JUMBO_HOME must be set before importing Jumbo
+    home = tempfile.mkdtemp(prefix='jumbo-bench-')
+    os.environ['JUMBO_HOME'] = home
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+    try:
+        report = run(sizes, max(1, args.repeat))
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as of:
+            json.dump(report, of, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as bf:
+            slower = regressions(report, json.load(bf), args.tolerance)
+        for name, nodes, old, new in slower:
+            print('Regression: %s with %d nodes: %.6fs -> %.6fs per call'
+                  % (name, nodes, old, new), file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
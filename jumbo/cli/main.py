@@ -1,11 +1,13 @@
 import click
-from click_shell.core import Shell
 import ipaddress as ipadd
-from prettytable import PrettyTable
+import shlex
+import subprocess
+import time
 
-from jumbo.core import clusters, nodes, services, vagrant
+from jumbo.core import clusters, nodes, services, specs, vagrant
+from jumbo.core import bake, mirror, prefetch, profile, store
 from jumbo.utils import session as ss, exceptions as ex, checks
-from jumbo.cli import printlogo
+from jumbo.cli import printlogo, startup
 from jumbo.utils.settings import OS
 
 
@@ -16,8 +18,19 @@ def print_with_color(message, color):
         click.echo(message)
 
 
+def startup_profile_cb(ctx, param, value):
+    if not value or ctx.resilient_parsing:
+        return
+
+    startup.print_startup_profile()
+    ctx.exit()
+
+
 @click.group(invoke_without_command=True)
 @click.option('--cluster', '-c')
+@click.option('--startup-profile', is_flag=True, is_eager=True,
+              expose_value=False, callback=startup_profile_cb,
+              help='Report the import time of each module and exit')
 @click.pass_context
 def jumbo(ctx, cluster):
     """
@@ -25,39 +38,50 @@ def jumbo(ctx, cluster):
     If no command is passed, start the Jumbo shell interactive mode.
     """
 
-    # Create the shell
-    sh = Shell(prompt=click.style('jumbo > ', fg='green') if OS != 'Windows'
-               else 'jumbo > ',
-               intro=printlogo.jumbo_ascii() +
-               '\nJumbo Shell. Enter "help" for list of supported commands.' +
-               ' Type "quit" to leave the Jumbo Shell.' +
-               click.style('\nJumbo v0.4.4',
-                           fg='cyan'))
-    # Save the shell in the click context (to modify its prompt later on)
-    ctx.meta['jumbo_shell'] = sh.shell
-    # Register commands that can be used in the shell
-    sh.add_command(create)
-    sh.add_command(exit)
-    sh.add_command(delete)
-    sh.add_command(use)
-    sh.add_command(addnode)
-    sh.add_command(rmnode)
-    sh.add_command(editnode)
-    sh.add_command(listclusters)
-    sh.add_command(listnodes)
-    sh.add_command(repair)
-    sh.add_command(addservice)
-    sh.add_command(addcomponent)
-    sh.add_command(listcomponents)
-    sh.add_command(rmservice)
-    sh.add_command(rmcomponent)
-    sh.add_command(checkservice)
-    sh.add_command(listservices)
-    sh.add_command(start)
-    sh.add_command(stop)
-    sh.add_command(status)
-    sh.add_command(provision)
-    sh.add_command(restart)
+    # The shell is only needed in interactive mode
+    sh = None
+    if not ctx.invoked_subcommand:
+        from click_shell.core import Shell
+
+        # Create the shell
+        sh = Shell(prompt=click.style('jumbo > ', fg='green')
+                   if OS != 'Windows' else 'jumbo > ',
+                   intro=printlogo.jumbo_ascii() +
+                   '\nJumbo Shell. Enter "help" for list of supported '
+                   'commands. Type "quit" to leave the Jumbo Shell.' +
+                   click.style('\nJumbo v0.4.4',
+                               fg='cyan'))
+        # Save the shell in the click context (to modify its prompt later on)
+        ctx.meta['jumbo_shell'] = sh.shell
+        # Register commands that can be used in the shell
+        sh.add_command(create)
+        sh.add_command(exit)
+        sh.add_command(delete)
+        sh.add_command(use)
+        sh.add_command(addnode)
+        sh.add_command(rmnode)
+        sh.add_command(editnode)
+        sh.add_command(listclusters)
+        sh.add_command(listnodes)
+        sh.add_command(repair)
+        sh.add_command(apply)
+        sh.add_command(run)
+        sh.add_command(addservice)
+        sh.add_command(addcomponent)
+        sh.add_command(listcomponents)
+        sh.add_command(rmservice)
+        sh.add_command(rmcomponent)
+        sh.add_command(checkservice)
+        sh.add_command(listservices)
+        sh.add_command(start)
+        sh.add_command(stop)
+        sh.add_command(status)
+        sh.add_command(provision)
+        sh.add_command(restart)
+        sh.add_command(mirror_cmd)
+        sh.add_command(prefetch_cmd)
+        sh.add_command(bake_cmd)
+        sh.add_command(profile_cmd)
 
     # If cluster exists, call manage command (saves the shell in session
     #  variable svars and adapts the shell prompt)
@@ -68,8 +92,9 @@ def jumbo(ctx, cluster):
         else:
             ctx.invoke(use, name=cluster)
 
-    # Run the command, or the shell if no command is passed
-    sh.invoke(ctx)
+    # Run the shell if no command is passed
+    if sh:
+        sh.invoke(ctx)
 
 
 @jumbo.command()
@@ -82,7 +107,7 @@ def exit(ctx):
 
     if ss.svars.get('cluster'):
         ss.svars['cluster'] = None
-        ctx.meta['jumbo_shell'].prompt = click.style('jumbo > ', fg='green')
+        set_prompt(ctx, 'jumbo > ')
     else:
         click.echo('Use "quit" to quit the shell. Exit only removes context.')
 
@@ -91,12 +116,18 @@ def exit(ctx):
 # cluster commands #
 ####################
 
-def set_context(ctx, name):
-    to_print = 'jumbo (%s) > ' % name
+def set_prompt(ctx, to_print):
+    if 'jumbo_shell' not in ctx.meta:
+        return
+
     ctx.meta['jumbo_shell'].prompt = click.style(
         to_print, fg='green') if OS != 'Windows' else to_print
 
 
+def set_context(ctx, name):
+    set_prompt(ctx, 'jumbo (%s) > ' % name)
+
+
 def validate_cluster_name_cb(ctx, param, value):
     if not value:
         return value
@@ -178,54 +209,217 @@ def delete(ctx, name, force):
     else:
         click.echo('Cluster "%s" deleted.' % name)
         ss.clear()
-        ctx.meta['jumbo_shell'].prompt = click.style('jumbo > ', fg='green')
+        set_prompt(ctx, 'jumbo > ')
 
 
 @jumbo.command()
 @click.option('--full', is_flag=True, help='Force full display')
 def listclusters(full):
     """List clusters managed by Jumbo."""
-    try:
-        limit = 40
-        if full:
-            limit = 1000
-        cluster_table = PrettyTable(['Name', 'Domain Name', 'VMs',
-                                     'Services'])
-        cluster_table.align['Name'] = 'l'
-        cluster_table.align['Domain Name'] = 'l'
-        cluster_table.align['Services'] = 'l'
-        for cluster in clusters.list_clusters():
-            cluster_table.add_row([cluster['cluster'],
-                                   cluster['domain'],
-                                   len(cluster['nodes']),
-                                   '\n'.join(cluster['services'])])
-    except ex.LoadError as e:
-        print_with_color(e.message, 'red')
-        if e.type == 'NoConfFile':
-            click.echo('Use "repair" to regenerate "jumbo_config".')
-    else:
-        cluster_table.sortby = 'Name'
-        click.echo(cluster_table)
+    from prettytable import PrettyTable
+
+    limit = 40
+    if full:
+        limit = 1000
+    cluster_table = PrettyTable(['Name', 'Domain Name', 'VMs',
+                                 'Services'])
+    cluster_table.align['Name'] = 'l'
+    cluster_table.align['Domain Name'] = 'l'
+    cluster_table.align['Services'] = 'l'
+    summaries, broken = clusters.summarize_clusters()
+    for cluster in summaries:
+        cluster_table.add_row([cluster['cluster'],
+                               cluster['domain'],
+                               cluster['nodes'],
+                               '\n'.join(cluster['services'])])
+    cluster_table.sortby = 'Name'
+    click.echo(cluster_table)
+
+    for name, error in sorted(broken.items()):
+        if error == 'NoConfFile':
+            print_with_color(ex.LoadError('cluster', name, error).message,
+                             'red')
+        else:
+            print_with_color('Cluster "%s" can\'t be read: %s'
+                             % (name, error), 'red')
+    if broken:
+        click.echo('Use "repair" to regenerate "jumbo_config".')
 
 
 @jumbo.command()
 @click.argument('name')
 @click.option('--domain', '-d', help='Domain name of the cluster')
-def repair(name, domain):
+@click.option('--playbooks', is_flag=True,
+              help='Upgrade the playbooks to this version of Jumbo')
+def repair(name, domain, playbooks):
     """Recreate "jumbo_config" if it doesn't exist.
 
     :param name: Cluster name
     """
 
+    if playbooks:
+        if not checks.check_cluster(name):
+            print_with_color(ex.LoadError('cluster', name, 'NotExist')
+                             .message, 'red')
+            return
+        switched = store.link_cluster(name)
+        click.echo('Upgraded {} playbook files of cluster "{}".'
+                   .format(len(switched), name))
+
     if clusters.repair_cluster(cluster=name,
                                domain=domain):
         click.echo('Recreated "jumbo_config" from scratch '
                    'for cluster "{}" (domain name = "{}").'
                    .format(name, domain if domain else '%s.local' % name))
-    else:
+    elif not playbooks:
         click.echo('Nothing to repair in cluster "%s".' % name)
 
 
+@jumbo.command()
+@click.argument('spec', type=click.Path(exists=True, dir_okay=False))
+@click.option('--cluster', '-c', help='Cluster name (overrides the spec)')
+@click.option('--dry-run', is_flag=True, help='Only print the changes')
+@click.pass_context
+def apply(ctx, spec, cluster, dry_run):
+    """Bring a cluster to the state described by a spec file (JSON or YAML).
+    The cluster is created if it doesn't exist.
+
+    :param spec: Path of the spec file
+    """
+
+    try:
+        spec_conf = specs.load_spec(spec)
+        diff = specs.apply_spec(spec_conf, cluster=cluster, dry_run=dry_run)
+    except (ex.LoadError, ex.CreationError) as e:
+        print_with_color(e.message, 'red')
+        return
+
+    name = cluster if cluster else spec_conf.get('cluster')
+    if specs.is_empty(diff):
+        click.echo('Cluster "%s" is up to date.' % name)
+        return
+
+    changes = []
+    if diff['domain']:
+        changes.append('~ domain: {} -> {}'.format(*diff['domain']))
+    for s in diff['services']['add']:
+        changes.append('+ service %s' % s)
+    for s in diff['services']['remove']:
+        changes.append('- service %s' % s)
+    for m in diff['nodes']['add']:
+        changes.append('+ node %s' % m)
+    for m in diff['nodes']['remove']:
+        changes.append('- node %s' % m)
+    for m, changed in diff['nodes']['edit']:
+        changes.append('~ node {} ({})'.format(m, ', '.join(
+            '{}: {} -> {}'.format(*c) for c in changed)))
+    for m, c in diff['components']['add']:
+        changes.append('+ component {}/{}'.format(m, c))
+    for m, c in diff['components']['remove']:
+        changes.append('- component {}/{}'.format(m, c))
+
+    click.echo('\n'.join(changes))
+    if dry_run:
+        click.echo('Dry run: cluster "%s" not modified.' % name)
+    else:
+        click.echo('Cluster "%s" updated.' % name)
+        set_context(ctx, name)
+
+
+# Commands working on the session only, that can be used in a script
+SCRIPT_COMMANDS = ['addnode', 'rmnode', 'editnode', 'listnodes',
+                   'addservice', 'rmservice', 'checkservice', 'listservices',
+                   'addcomponent', 'rmcomponent', 'listcomponents']
+
+
+@jumbo.command()
+@click.argument('script', type=click.File('r'), default='-')
+@click.option('--cluster', '-c')
+@click.pass_context
+def run(ctx, script, cluster):
+    """Run a script of Jumbo commands (one per line, "-" for stdin) on a
+    cluster. The cluster is saved at the end of the script and on each
+    "checkpoint" line. If a command fails, the changes made since the last
+    checkpoint are rolled back.
+
+    :param script: Path of the script
+    """
+
+    switched = True if cluster else False
+    if not cluster:
+        cluster = ss.svars['cluster']
+
+    try:
+        if not cluster:
+            raise ex.LoadError('cluster', None, 'NoContext')
+        if ss.svars['cluster'] and cluster != ss.svars['cluster']:
+            raise ex.LoadError('cluster', ss.svars['cluster'], 'MustExit')
+        ss.load_config(cluster)
+    except ex.LoadError as e:
+        print_with_color(e.message, 'red')
+        return
+
+    lines = script.read().splitlines()
+
+    ss.begin()
+    try:
+        failed = run_script(ctx, lines)
+    except Exception:
+        ss.rollback()
+        raise
+
+    if failed:
+        ss.rollback()
+        print_with_color('Line {}: "{}" failed. The changes since the last '
+                         'checkpoint have been rolled back.'
+                         .format(failed, lines[failed - 1].strip()), 'red')
+        ctx.exit(1)
+
+    ss.commit()
+    click.echo('Script applied to cluster "%s".' % cluster)
+    if switched:
+        set_context(ctx, cluster)
+
+
+def run_script(ctx, lines):
+    """Run the commands of a script until one of them fails.
+
+    :param ctx: Click context
+    :param lines: Lines of the script
+    :type lines: list
+    :return: The number of the line that failed, None on success
+    """
+
+    for number, line in enumerate(lines, 1):
+        args = shlex.split(line, comments=True)
+        if not args:
+            continue
+        if args == ['checkpoint']:
+            ss.checkpoint()
+            continue
+
+        failed = True
+        if args[0] not in SCRIPT_COMMANDS:
+            print_with_color('The command "%s" can\'t be used in a script.'
+                             % args[0], 'red')
+        else:
+            cmd = jumbo.get_command(ctx, args[0])
+            try:
+                with cmd.make_context(args[0], args[1:], parent=ctx) \
+                        as sub_ctx:
+                    # The commands return False when they fail
+                    failed = cmd.invoke(sub_ctx) is False
+            except click.ClickException as e:
+                print_with_color(e.format_message(), 'red')
+            except click.Abort:
+                print_with_color('Aborted. Use "--force" in scripts.', 'red')
+
+        if failed:
+            return number
+
+    return None
+
+
 ###############
 # VM commands #
 ###############
@@ -241,10 +435,24 @@ def validate_ip_cb(ctx, param, value):
     return value
 
 
+class LazyChoice(click.Choice):
+    """A `click.Choice` whose choices are loaded when the option is used or
+    its help displayed, not when the CLI is imported.
+    """
+
+    def __init__(self, get_choices, case_sensitive=True):
+        self.get_choices = get_choices
+        self.case_sensitive = case_sensitive
+
+    @property
+    def choices(self):
+        return tuple(self.get_choices())
+
+
 @jumbo.command()
 @click.argument('name')
 @click.option('--types', '-t', multiple=True,
-              type=click.Choice(services.get_available_types()),
+              type=LazyChoice(services.get_available_types),
               required=True, help='VM host type(s)')
 @click.option('--ip', '-i', callback=validate_ip_cb, prompt='IP',
               help='VM IP address')
@@ -273,6 +481,7 @@ def addnode(ctx, name, types, ip, ram, cpus, cluster):
         if e.type == 'NoConfFile':
             click.echo('Use "repair" to regenerate `jumbo_config`.')
         switched = False
+        return False
     else:
         click.echo('Machine "{}" added to cluster "{}". {}'
                    .format(name, cluster,
@@ -310,6 +519,7 @@ def rmnode(ctx, name, cluster, force):
         if e.type == 'NoConfFile':
             click.echo('Use "repair" to regenerate `jumbo_config`')
         switched = False
+        return False
     else:
         click.echo('Machine "{}" removed of cluster "{}".'
                    .format(name, cluster))
@@ -353,6 +563,7 @@ def editnode(ctx, name, ip, ram, cpus, cluster):
                 )
         except (ex.LoadError, ex.CreationError) as e:
             print_with_color(e.message, 'red')
+            return False
     else:
         click.echo('Nothing to do. Type "help editnode" for usage.')
 
@@ -367,6 +578,8 @@ def listnodes(cluster):
     List VMs in the cluster being managed.
     Another cluster can be specified with "--cluster".
     """
+    from prettytable import PrettyTable
+
     if not cluster:
         cluster = ss.svars['cluster']
 
@@ -379,6 +592,7 @@ def listnodes(cluster):
                                 m['ram'], m['cpus']])
     except ex.LoadError as e:
         print_with_color(e.message, 'red')
+        return False
     else:
         print_colorized_table(node_table)
 
@@ -394,16 +608,21 @@ def listnodes(cluster):
 @click.option('--ha', '-h', is_flag=True, help='High Availability mode')
 @click.option('--recursive', '-r', is_flag=True,
               help='Also auto-install all other services needed')
+@click.option('--explain', '-e', is_flag=True,
+              help='Explain the choice of the hosts of the components')
 @click.pass_context
-def addservice(ctx, name, cluster, no_auto, ha, recursive):
+def addservice(ctx, name, cluster, no_auto, ha, recursive, explain):
     """
     Add a service to a cluster and auto-install its components
     on the best fitting hosts.
     """
+    from jumbo.core import placement
+
     switched = True if cluster else False
     if not cluster:
         cluster = ss.svars['cluster']
 
+    placement.clear()
     try:
         msg = ''
         auto_installed_count = 0
@@ -455,12 +674,22 @@ def addservice(ctx, name, cluster, no_auto, ha, recursive):
         if e.type == 'NotExist':
             click.echo('Available services:\n - %s'
                        % '\n - '.join(services.get_available_services()))
+        return False
     except ex.CreationError as e:
         print_with_color(e.message, 'red')
+        return False
     else:
         click.echo('Service "{}" and related clients added to cluster "{}".\n'
                    .format(name, cluster) + msg)
     finally:
+        for d in placement.decisions:
+            if d['overcommitted']:
+                print_with_color('{} installed on "{}" without enough free '
+                                 'RAM.'.format(d['component'], d['node']),
+                                 'yellow')
+            if explain:
+                click.echo('{} on "{}": {}'.format(d['component'], d['node'],
+                                                   d['reason']))
         if switched:
             set_context(ctx, cluster)
 
@@ -488,9 +717,11 @@ def rmservice(ctx, service, cluster, force):
         services.remove_service(service, cluster=cluster)
     except ex.LoadError as e:
         print_with_color(e.message, 'red')
+        return False
     except ex.CreationError as e:
         print_with_color(e.message, 'red')
         switched = True
+        return False
     else:
         click.echo('Service "{}" and its components removed from cluster "{}".'
                    .format(service, cluster))
@@ -517,8 +748,10 @@ def addcomponent(ctx, name, node, cluster):
     except ex.LoadError as e:
         print_with_color(e.message, 'red')
         switched = False
+        return False
     except ex.CreationError as e:
         print_with_color(e.message, 'red')
+        return False
     else:
         click.echo('Component "{}" added to node "{}/{}".'
                    .format(name, cluster, node))
@@ -554,8 +787,10 @@ def rmcomponent(ctx, name, node, cluster, force):
     except ex.LoadError as e:
         print_with_color(e.message, 'red')
         switched = False
+        return False
     except ex.CreationError as e:
         print_with_color(e.message, 'red')
+        return False
     else:
         click.echo('Component "{}" removed of node "{}/{}"'
                    .format(name, cluster, node))
@@ -574,50 +809,37 @@ def listcomponents(node, cluster, all, abbr):
     """
     List compononents on a given node.
     """
+    from prettytable import PrettyTable
+
     if not cluster:
         cluster = ss.svars['cluster']
 
-    if all:
-        for m in ss.svars['nodes']:
-            comp_table = PrettyTable(['Component', 'Service'])
-            comp_table.align['Component'] = 'l'
-            comp_table.align['Service'] = 'l'
-            click.echo('\n' + m['name'] + ':')
-            try:
-                for c in services.list_components(node=m['name'],
-                                                  cluster=cluster):
-                    service = services.check_component(c)
-                    comp_table.add_row([
-                        c if not abbr else services.get_abbr(c, service),
-                        service
-                    ])
-                    comp_table.sortby = 'Service'
-            except ex.LoadError as e:
-                print_with_color(e.message, 'red')
-            else:
-                print_colorized_table(comp_table)
+    if not all and node is None:
+        click.secho('You need to specify a node name. Use --all to list'
+                    ' all nodes', fg='red', err=True)
+        return False
 
-    else:
-        if node is None:
-            click.secho('You need to specify a node name. Use --all to list'
-                        ' all nodes', fg='red', err=True)
-            return
-        try:
-            comp_table = PrettyTable(['Component', 'Service'])
-            comp_table.align['Component'] = 'l'
-            comp_table.align['Service'] = 'l'
-            for c in services.list_components(node=node,
-                                              cluster=cluster):
-                service = services.check_component(c)
-                comp_table.add_row([
-                    c if not abbr else services.get_abbr(c, service),
-                    service
-                ])
-                comp_table.sortby = 'Service'
-        except ex.LoadError as e:
-            print_with_color(e.message, 'red')
-        else:
-            print_colorized_table(comp_table)
+    try:
+        nodes_components = services.list_cluster_components(cluster=cluster)
+        if not all and node not in nodes_components:
+            raise ex.LoadError('node', node, 'NotExist')
+    except ex.LoadError as e:
+        print_with_color(e.message, 'red')
+        return False
+
+    for name, components in nodes_components.items():
+        if not all and name != node:
+            continue
+        comp_table = PrettyTable(['Component', 'Service'])
+        comp_table.align['Component'] = 'l'
+        comp_table.align['Service'] = 'l'
+        comp_table.sortby = 'Service'
+        if all:
+            click.echo('\n' + name + ':')
+        for c, desc in components.items():
+            comp_table.add_row([desc['abbr'] if abbr else c,
+                                desc['service']])
+        print_colorized_table(comp_table)
 
 
 @jumbo.command()
@@ -637,6 +859,7 @@ def checkservice(name, cluster):
                                                        cluster=cluster)
     except (ex.LoadError, ex.CreationError) as e:
         print_with_color(e.message, 'red')
+        return False
     else:
         if missing_comp:
             click.echo('The service "{}" misses:\n{}'
@@ -653,6 +876,7 @@ def listservices(cluster):
     :param cluster: Cluster name
     :type cluster: str
     """
+    from prettytable import PrettyTable
 
     if not cluster:
         cluster = ss.svars['cluster']
@@ -675,6 +899,7 @@ def listservices(cluster):
         table_serv.sortby = 'Service'
     except (ex.LoadError, ex.CreationError) as e:
         print_with_color(e.message, 'red')
+        return False
     else:
         click.echo(table_serv)
 
@@ -686,7 +911,9 @@ def listservices(cluster):
 @jumbo.command()
 @click.argument('cluster_name', required=False)
 @click.option('--cluster', '-c')
-def start(cluster_name, cluster):
+@click.option('--parallel', '-P', type=click.IntRange(min=1),
+              help='Start up to N VMs concurrently, the Ansible host last')
+def start(cluster_name, cluster, parallel):
     """Launches the VMs (vagrant up)
     """
 
@@ -696,7 +923,10 @@ def start(cluster_name, cluster):
         cluster = ss.svars['cluster']
 
     try:
-        vagrant.cmd(['vagrant', 'up', '--color'], cluster=cluster)
+        if parallel:
+            vagrant.parallel_up(parallel, cluster=cluster)
+        else:
+            vagrant.cmd(['vagrant', 'up', '--color'], cluster=cluster)
     except (ex.LoadError, ex.CreationError) as e:
         print_with_color(e.message, 'red')
 
@@ -763,6 +993,236 @@ def restart(cluster_name, cluster):
         print_with_color(e.message, 'red')
 
 
+###################
+# Mirror commands #
+###################
+
+@jumbo.group('mirror')
+def mirror_cmd():
+    """Manage the local mirror of the resources downloaded by the VMs.
+    """
+
+
+@mirror_cmd.command('enable')
+@click.option('--address', '-a',
+              help='Mirror address seen from the VMs (default: .1 of the '
+              'cluster network)')
+@click.option('--port', '-p', type=int, help='Mirror port')
+def mirror_enable(address, port):
+    """Make the clusters download their resources through the mirror.
+    The clusters files are updated on their next use.
+    """
+
+    conf = mirror.load_conf()
+    conf['enabled'] = True
+    if address:
+        conf['address'] = address
+    if port:
+        conf['port'] = port
+    mirror.save_conf(conf)
+    click.echo('Mirror enabled on port %d. Run "jumbo mirror serve" before '
+               'starting the VMs: it waits for their private network.'
+               % conf['port'])
+
+
+@mirror_cmd.command('disable')
+def mirror_disable():
+    """Make the clusters download their resources from the internet.
+    """
+
+    conf = mirror.load_conf()
+    conf['enabled'] = False
+    mirror.save_conf(conf)
+    click.echo('Mirror disabled.')
+
+
+@mirror_cmd.command('serve')
+@click.option('--listen', '-l',
+              help='Address to listen on (default: the mirror address of '
+              'the cluster managed)')
+def mirror_serve(listen):
+    """Run the mirror server (until Ctrl+C).
+    """
+
+    conf = mirror.load_conf()
+    port = conf['port']
+    wait = False
+    if not listen:
+        listen = mirror.listen_address(conf, ss.svars['nodes'])
+        wait = not mirror.can_bind(listen)
+    try:
+        if wait:
+            click.echo('Waiting for the address {} (created when the VMs '
+                       'start)...'.format(listen))
+            mirror.wait_address(listen)
+        click.echo('Mirror listening on {}:{}...'.format(listen, port))
+        mirror.serve(listen, port)
+    except KeyboardInterrupt:
+        click.echo('Mirror stopped.')
+    except OSError as e:
+        print_with_color(str(e), 'red')
+
+
+@jumbo.command('prefetch')
+@click.option('--cluster', '-c',
+              help='Cluster whose versions are used (default: global)')
+@click.option('--workers', '-w', default=8, type=click.IntRange(min=1),
+              help='Number of concurrent downloads')
+@click.option('--packages', is_flag=True,
+              help='Also download all the packages of the repositories')
+def prefetch_cmd(cluster, workers, packages):
+    """Download the resources of versions.json in the local cache.
+    """
+
+    if not cluster:
+        cluster = ss.svars['cluster']
+
+    def progress(url, error):
+        if error:
+            print_with_color('Failed: {} ({})'.format(url, error), 'red')
+        else:
+            click.echo('Downloaded: %s' % url)
+
+    failed = prefetch.prefetch(cluster, workers, packages, progress)
+    if failed:
+        print_with_color('%d resources could not be downloaded.'
+                         % len(failed), 'red')
+    else:
+        click.echo('All the resources are downloaded.')
+
+
+@jumbo.command('bake')
+@click.option('--cluster', '-c',
+              help='Cluster whose nodes need boxes (default: all layers)')
+@click.option('--force', is_flag=True, help='Rebuild the existing boxes')
+def bake_cmd(cluster, force):
+    """Build Vagrant boxes with the packages of the nodes preinstalled.
+    """
+
+    if not cluster:
+        cluster = ss.svars['cluster']
+
+    if cluster:
+        try:
+            combinations = bake.cluster_layers(
+                clusters.list_nodes(cluster=cluster))
+        except ex.LoadError as e:
+            print_with_color(e.message, 'red')
+            return
+    else:
+        combinations = [['base']] + [['base', layer]
+                                     for layer in sorted(bake.LAYERS)
+                                     if layer != 'base']
+
+    for layers in combinations:
+        try:
+            name, built = bake.bake(layers, cluster, force, click.echo)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print_with_color('Failed to bake the box with the layers {}: {}'
+                             .format(', '.join(layers), e), 'red')
+            return
+        click.echo('Box "{}" {}.'.format(
+            name, 'built' if built else 'already exists'))
+
+    # Use the new boxes in the Vagrantfile
+    if cluster:
+        ss.dump_config()
+
+
+@jumbo.command('profile')
+@click.argument('cluster_name', required=False)
+@click.option('--cluster', '-c')
+@click.option('--run', '-r', 'run_index', default=-1, type=int,
+              help='Run to show (0 for the first, -1 for the last)')
+@click.option('--compare', type=int,
+              help='Run to compare with (same numbering as --run)')
+@click.option('--top', default=10, type=click.IntRange(min=1),
+              help='Number of slowest tasks to show')
+def profile_cmd(cluster_name, cluster, run_index, compare, top):
+    """Show the timings of the provisioning of a cluster.
+    """
+    from prettytable import PrettyTable
+
+    cluster = cluster_name if cluster_name else cluster
+
+    if not cluster:
+        cluster = ss.svars['cluster']
+
+    if not checks.check_cluster(cluster):
+        print_with_color(ex.LoadError('cluster', cluster, 'NotExist').message
+                         if cluster else
+                         ex.LoadError('cluster', None, 'NoContext').message,
+                         'red')
+        return
+
+    runs = profile.list_runs(cluster)
+    try:
+        run = profile.load_run(runs[run_index])
+        other = profile.load_run(runs[compare]) if compare is not None \
+            else None
+    except IndexError:
+        print_with_color('No such run: {} runs are recorded for the cluster '
+                         '"{}". Use "start" to record one.'
+                         .format(len(runs), cluster), 'red')
+        return
+
+    if other:
+        table = PrettyTable(['Phase', 'Before', 'After', 'Difference'])
+        for name, before, after in profile.compare(other, run):
+            table.add_row([name, format_duration(before),
+                           format_duration(after),
+                           format_duration(after - before, sign=True)
+                           if before is not None and after is not None
+                           else '-'])
+        print_colorized_table(table)
+        return
+
+    summary = profile.summarize(run, top)
+    click.echo('"{}" started at {} and lasted {}.'.format(
+        run['command'], time.strftime('%Y-%m-%d %H:%M:%S',
+                                      time.localtime(run['start'])),
+        format_duration(summary['total'])))
+
+    table = PrettyTable(['Phase', 'Node', 'Duration'])
+    for name, node, duration in summary['phases']:
+        table.add_row([name, node or '-', format_duration(duration)])
+    print_colorized_table(table)
+
+    if not run['tasks']:
+        click.echo('No Ansible timings recorded.')
+        return
+
+    table = PrettyTable(['Play', 'Duration'])
+    for play, duration in summary['plays']:
+        table.add_row([play, format_duration(duration)])
+    print_colorized_table(table)
+
+    table = PrettyTable(['Node', 'Tasks duration'])
+    for node, duration in summary['nodes']:
+        table.add_row([node, format_duration(duration)])
+    print_colorized_table(table)
+
+    table = PrettyTable(['Task', 'Role', 'Node', 'Status', 'Duration'])
+    for task in summary['tasks']:
+        table.add_row([task['task'], task['role'] or '-', task['host'],
+                       task['status'], format_duration(task['duration'])])
+    print_colorized_table(table)
+
+
+def format_duration(seconds, sign=False):
+    if seconds is None:
+        return '-'
+
+    prefix = ('+' if seconds >= 0 else '-') if sign else ''
+    seconds = abs(seconds)
+    if seconds < 60:
+        return '%s%.1fs' % (prefix, seconds)
+    minutes, seconds = divmod(int(seconds), 60)
+    if minutes < 60:
+        return '%s%dm%02ds' % (prefix, minutes, seconds)
+    return '%s%dh%02dm%02ds' % ((prefix,) + divmod(minutes, 60) + (seconds,))
+
+
 @jumbo.command()
 def logo():
     """Print a random ASCII logo.
@@ -0,0 +1,69 @@
+import subprocess
+import sys
+
+import click
+
+from jumbo.utils.settings import STARTUP_BUDGET
+
+ENTRY_MODULE = 'jumbo.cli.main'
+
+
+def measure_imports(module=ENTRY_MODULE):
+    """Measure the import time of a module and of all the modules it imports.
+
+    The import is done in a fresh interpreter with `-X importtime`.
+
+    :param module: Module to import, defaults to the CLI entry point
+    :type module: str
+    :return: The (module, self time, cumulative time) of each imported module,
+             in microseconds
+    :rtype: list
+    """
+
+    res = subprocess.run([sys.executable, '-X', 'importtime',
+                          '-c', 'import %s' % module],
+                         stdout=subprocess.DEVNULL,
+                         stderr=subprocess.PIPE)
+
+    imports = []
+    for line in res.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            # Header line
+            continue
+        imports.append((fields[2].strip(), self_us, cumulative_us))
+
+    return imports
+
+
+def print_startup_profile(limit=20):
+    """Print the slowest imports of the CLI and compare the total import time
+    with the startup budget.
+
+    :param limit: Number of modules to print, defaults to 20
+    :type limit: int
+    """
+
+    from prettytable import PrettyTable
+
+    imports = measure_imports()
+    total = max((i[2] for i in imports if i[0] == ENTRY_MODULE), default=0)
+
+    table = PrettyTable(['Module', 'Self (ms)', 'Cumulative (ms)'])
+    table.align['Module'] = 'l'
+    table.align['Self (ms)'] = 'r'
+    table.align['Cumulative (ms)'] = 'r'
+    for name, self_us, cumulative_us in sorted(
+            imports, key=lambda i: i[1], reverse=True)[:limit]:
+        table.add_row([name, '%.1f' % (self_us / 1000),
+                       '%.1f' % (cumulative_us / 1000)])
+    click.echo(table)
+
+    message = 'Startup import time: {:.1f} ms (budget: {} ms)'.format(
+        total / 1000, STARTUP_BUDGET)
+    click.secho(message, fg='green' if total / 1000 <= STARTUP_BUDGET
+                else 'red')
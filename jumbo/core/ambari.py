@@ -0,0 +1,236 @@
+import base64
+import http.client
+import json
+import random
+import time
+
+from urllib.parse import urlsplit
+
+from jumbo.utils import exceptions as ex
+
+# Final states of an Ambari request
+FINAL_STATES = ['COMPLETED', 'FAILED', 'TIMEDOUT', 'ABORTED']
+
+# States of the hosts whose agent is not registered anymore
+LOST_STATES = ['HEARTBEAT_LOST']
+
+# Status codes returned while Ambari is starting or agents are registering
+RETRY_STATUSES = [404, 409, 500, 502, 503]
+
+
+class RetryError(ex.Error):
+    """Raised when a request must be retried.
+    """
+    pass
+
+
+def connect(host, port=8080, timeout=30):
+    """Open a keep-alive connection to an Ambari server.
+
+    The connection is reopened automatically if the server closes it.
+
+    :param host: Ambari server host
+    :type host: str
+    :param port: Ambari server port, defaults to 8080
+    :type port: int, optional
+    :return: The connection
+    :rtype: http.client.HTTPConnection
+    """
+
+    return http.client.HTTPConnection(host, port, timeout=timeout)
+
+
+def request(conn, method, path, body=None, user='admin', password='admin'):
+    """Send a request to the Ambari REST API on a connection.
+
+    :param conn: The connection returned by `connect`
+    :type conn: http.client.HTTPConnection
+    :param method: HTTP method
+    :type method: str
+    :param path: Path of the resource (e.g. /api/v1/hosts)
+    :type path: str
+    :param body: JSON serializable request body, defaults to None
+    :type body: dict, optional
+    :raises RetryError: If the server is not ready to answer
+    :return: The status code and the decoded response body
+    :rtype: tuple
+    """
+
+    credentials = base64.b64encode(
+        ('%s:%s' % (user, password)).encode('utf-8')).decode('ascii')
+    headers = {
+        'Authorization': 'Basic ' + credentials,
+        'X-Requested-By': 'ambari',
+        'Connection': 'keep-alive'
+    }
+
+    try:
+        conn.request(method, path,
+                     body=json.dumps(body) if body is not None else None,
+                     headers=headers)
+        res = conn.getresponse()
+        # The response must be read entirely to reuse the connection
+        data = res.read()
+    except (OSError, http.client.HTTPException) as e:
+        conn.close()
+        raise RetryError(str(e))
+
+    if res.status in RETRY_STATUSES:
+        raise RetryError('HTTP %d on %s' % (res.status, path))
+
+    try:
+        return res.status, json.loads(data.decode('utf-8')) if data else None
+    except ValueError:
+        return res.status, None
+
+
+def backoff(base=1, cap=30):
+    """Generate exponential delays with full jitter.
+
+    :param base: First maximum delay in seconds, defaults to 1
+    :type base: float, optional
+    :param cap: Maximum delay in seconds, defaults to 30
+    :type cap: float, optional
+    """
+
+    attempt = 0
+    while True:
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
+        attempt += 1
+
+
+def retry(func, timeout, base=1, cap=30):
+    """Call a function until it doesn't raise RetryError, with backoff.
+
+    :param func: Function to call
+    :type func: callable
+    :param timeout: Maximum time to retry, in seconds
+    :type timeout: float
+    :raises RetryError: On timeout
+    :return: The value returned by the function
+    """
+
+    deadline = time.monotonic() + timeout
+    for delay in backoff(base, cap):
+        try:
+            return func()
+        except RetryError:
+            if time.monotonic() + delay > deadline:
+                raise
+            time.sleep(delay)
+
+
+def registered_hosts(conn):
+    """Return the hosts whose Ambari agent is registered and heartbeating.
+
+    :param conn: The connection returned by `connect`
+    :type conn: http.client.HTTPConnection
+    :rtype: list
+    """
+
+    _, hosts = request(conn, 'GET', '/api/v1/hosts?fields=Hosts/host_state')
+    return [h['Hosts']['host_name'] for h in (hosts or {}).get('items', [])
+            if h['Hosts'].get('host_state') not in LOST_STATES]
+
+
+def wait_agents(conn, hosts, timeout=600):
+    """Wait until the agents of some hosts are registered.
+
+    :param conn: The connection returned by `connect`
+    :type conn: http.client.HTTPConnection
+    :param hosts: Hosts fqdns
+    :type hosts: list
+    :param timeout: Maximum time to wait in seconds, defaults to 600
+    :type timeout: int, optional
+    :raises RetryError: On timeout
+    """
+
+    def check():
+        missing = set(hosts) - set(registered_hosts(conn))
+        if missing:
+            raise RetryError('Agents not registered: %s'
+                             % ', '.join(sorted(missing)))
+
+    retry(check, timeout)
+
+
+def start_all_services(conn, cluster, timeout=600):
+    """Ask Ambari to start all the services of a cluster.
+
+    :param conn: The connection returned by `connect`
+    :type conn: http.client.HTTPConnection
+    :param cluster: Ambari cluster name
+    :type cluster: str
+    :raises RetryError: If the request is not accepted before the timeout
+    :raises ex.CreationError: If Ambari rejects the request
+    :return: The path of the request to follow, None if there is nothing to
+             start
+    :rtype: str
+    """
+
+    body = {
+        'RequestInfo': {'context': 'Start all services'},
+        'Body': {'ServiceInfo': {'state': 'STARTED'}}
+    }
+    status, res = retry(lambda: request(
+        conn, 'PUT', '/api/v1/clusters/%s/services' % cluster, body), timeout)
+
+    # Ambari answers 200 when all the services are already started
+    if status == 200:
+        return None
+    if status != 202 or not res:
+        raise ex.CreationError('Ambari cluster', cluster, 'start request',
+                               'HTTP %d %s' % (status, json.dumps(res)),
+                               'Rejected')
+    return urlsplit(res['href']).path
+
+
+def request_status(conn, path):
+    """Return the status of an Ambari request.
+
+    :param conn: The connection returned by `connect`
+    :type conn: http.client.HTTPConnection
+    :param path: Path of the request
+    :type path: str
+    :raises RetryError: If the response is not a request status
+    :return: The 'Requests' of the response
+    :rtype: dict
+    """
+
+    fields = '?fields=Requests/request_status,Requests/progress_percent'
+    _, res = request(conn, 'GET', path + fields)
+    try:
+        res['Requests']['request_status']
+    except (TypeError, KeyError):
+        raise RetryError('Invalid response on %s' % path)
+    return res['Requests']
+
+
+def wait_request(conn, path, progress=None, timeout=3600, interval=5):
+    """Poll an Ambari request until it reaches a final state.
+
+    :param conn: The connection returned by `connect`
+    :type conn: http.client.HTTPConnection
+    :param path: Path of the request (returned by `start_all_services`)
+    :type path: str
+    :param progress: Called with the progress percentage on each poll
+    :type progress: callable, optional
+    :param timeout: Maximum time to wait in seconds, defaults to 3600
+    :type timeout: int, optional
+    :raises RetryError: On timeout
+    :return: The final state of the request
+    :rtype: str
+    """
+
+    deadline = time.monotonic() + timeout
+    while True:
+        res = retry(lambda: request_status(conn, path),
+                    deadline - time.monotonic())
+        state = res['request_status']
+        if progress:
+            progress(res.get('progress_percent', 0))
+        if state in FINAL_STATES:
+            return state
+        if time.monotonic() + interval > deadline:
+            raise RetryError('Request %s still %s' % (path, state))
+        time.sleep(interval)
@@ -0,0 +1,306 @@
+import hashlib
+import json
+import os
+import subprocess
+import time
+
+from jumbo.utils.settings import JUMBODIR, POOLNAME
+from jumbo.utils import versions as vs
+
+REGISTRY = JUMBODIR + 'boxes.json'
+BAKE_DIR = JUMBODIR + '.cache/bake/'
+PLAYBOOKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'data', 'playbooks')
+
+# Package layers of the boxes. The base layer is installed on every node, the
+# others on the nodes having their component. `playbooks` and `roles` install
+# the packages at provisioning: their yum and get_url tasks are the bake
+# playbook, and the box key changes when they change.
+LAYERS = {
+    'base': {
+        'component': None,
+        'playbooks': ['init-conf.yml'],
+        'roles': ['ambaricommon', 'ambariagents', 'ipaclient']
+    },
+    'pgsql': {
+        'component': 'PSQL_SERVER',
+        'roles': ['postgres']
+    },
+    'ambari': {
+        'component': 'AMBARI_SERVER',
+        'roles': ['ambariserver']
+    },
+    'ipa': {
+        'component': 'IPA_SERVER',
+        'roles': ['ipaserver']
+    }
+}
+
+# Modules of the tasks downloading and installing packages
+INSTALL_MODULES = ['yum', 'get_url']
+
+roles_digests = {}
+
+
+def node_layers(node):
+    """Return the package layers of the box of a node.
+
+    :param node: Node of the session
+    :type node: dict
+    :return: The layers, 'base' first
+    :rtype: list
+    """
+
+    return ['base'] + sorted(name for name, layer in LAYERS.items()
+                             if layer['component'] in node['components'])
+
+
+def layer_sources(layers):
+    """Return the playbooks and roles task files installing some layers.
+
+    :param layers: Layers names
+    :type layers: list
+    :return: The paths of the files, in installation order
+    :rtype: list
+    """
+
+    paths = []
+    for layer in layers:
+        paths += [os.path.join(PLAYBOOKS_DIR, playbook)
+                  for playbook in LAYERS[layer].get('playbooks', [])]
+        paths += [os.path.join(PLAYBOOKS_DIR, 'roles', role, 'tasks',
+                               'main.yml')
+                  for role in LAYERS[layer]['roles']]
+    return paths
+
+
+def install_tasks(path, variables):
+    """Return the tasks of a playbook or of a task file that download and
+    install packages (see INSTALL_MODULES), following the included tasks.
+
+    :param path: Path of the playbook or task file
+    :type path: str
+    :param variables: Variables of the included file names
+    :type variables: dict
+    :rtype: list
+    """
+
+    import jinja2
+    import yaml
+
+    with open(path, 'r') as tf:
+        tasks = yaml.safe_load(tf) or []
+    if tasks and 'hosts' in tasks[0]:
+        tasks = [t for play in tasks for t in play.get('tasks', [])]
+
+    selected = []
+    for task in tasks:
+        if 'include_tasks' in task:
+            name = jinja2.Template(task['include_tasks']).render(**variables)
+            selected += install_tasks(
+                os.path.join(os.path.dirname(path), name), variables)
+        elif any(m in task for m in INSTALL_MODULES):
+            selected.append(task)
+    return selected
+
+
+def roles_digest(layers):
+    """Return the hash of the roles and templates installing some layers.
+
+    :param layers: Layers names
+    :type layers: list
+    :rtype: str
+    """
+
+    key = tuple(layers)
+    if key not in roles_digests:
+        h = hashlib.sha1()
+        paths = [os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              os.pardir, 'utils', 'templates', 'bake')]
+        paths += [os.path.join(PLAYBOOKS_DIR, 'roles', role)
+                  for layer in layers for role in LAYERS[layer]['roles']]
+        paths += [os.path.join(PLAYBOOKS_DIR, playbook)
+                  for layer in layers
+                  for playbook in LAYERS[layer].get('playbooks', [])]
+        for path in paths:
+            if os.path.isfile(path):
+                h.update(os.path.basename(path).encode('utf-8'))
+                with open(path, 'rb') as pf:
+                    h.update(pf.read())
+            for root, dirs, files in sorted(os.walk(path)):
+                dirs.sort()
+                for name in sorted(files):
+                    h.update(name.encode('utf-8'))
+                    with open(os.path.join(root, name), 'rb') as rf:
+                        h.update(rf.read())
+        roles_digests[key] = h.hexdigest()
+
+    return roles_digests[key]
+
+
+def box_key(layers, cluster=None):
+    """Return the key of a box: the hash of the versions and of the roles
+    installing its packages.
+
+    :param layers: Layers names
+    :type layers: list
+    :param cluster: Cluster name (global versions if None), defaults to None
+    :type cluster: str, optional
+    :rtype: str
+    """
+
+    h = hashlib.sha1(json.dumps(vs.get_yaml_config(cluster),
+                                sort_keys=True).encode('utf-8'))
+    h.update(roles_digest(layers).encode('utf-8'))
+    return h.hexdigest()
+
+
+def box_name(layers, key):
+    return 'jumbo-%s-%s' % ('-'.join(layers), key[:12])
+
+
+def load_registry():
+    """Load the registry of the baked boxes.
+
+    :return: The boxes (name -> layers, key and creation date)
+    :rtype: dict
+    """
+
+    try:
+        with open(REGISTRY, 'r') as rf:
+            return json.load(rf)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_registry(registry):
+    from jumbo.utils import artifacts
+
+    os.makedirs(JUMBODIR, exist_ok=True)
+    artifacts.atomic_write(REGISTRY, json.dumps(registry, indent=2,
+                                                sort_keys=True))
+
+
+def node_boxes(nodes, cluster):
+    """Return the baked boxes matching the nodes of a cluster.
+
+    :param nodes: Nodes of the cluster
+    :type nodes: list
+    :param cluster: Cluster name
+    :type cluster: str
+    :return: The box of each node having one (node name -> box name)
+    :rtype: dict
+    """
+
+    registry = load_registry()
+    if not registry:
+        return {}
+
+    boxes = {}
+    for node in nodes:
+        layers = node_layers(node)
+        name = box_name(layers, box_key(layers, cluster))
+        if name in registry:
+            boxes[node['name']] = name
+    return boxes
+
+
+def cluster_layers(nodes):
+    """Return the distinct layers combinations of the nodes of a cluster.
+
+    :param nodes: Nodes of the cluster
+    :type nodes: list
+    :rtype: list
+    """
+
+    combinations = []
+    for node in nodes:
+        layers = node_layers(node)
+        if layers not in combinations:
+            combinations.append(layers)
+    return combinations
+
+
+def render_bake(name, layers, cluster=None):
+    """Generate the Vagrant project building a box.
+
+    :param name: Box name
+    :type name: str
+    :param layers: Layers names
+    :type layers: list
+    :param cluster: Cluster name (global versions if None), defaults to None
+    :type cluster: str, optional
+    :return: The project directory
+    :rtype: str
+    """
+
+    import yaml
+
+    from jumbo.utils import artifacts, session as ss
+
+    yaml_versions = vs.get_yaml_config(cluster)
+    work_dir = BAKE_DIR + name + '/'
+    os.makedirs(work_dir, exist_ok=True)
+
+    vagrant_temp = ss.get_jinja_env().get_template('bake/Vagrantfile.j2')
+    artifacts.atomic_write(work_dir + 'Vagrantfile',
+                           vagrant_temp.render(name=name,
+                                               pool_name=POOLNAME))
+
+    # The tasks of the provisioning, with the versions as variables
+    sources = layer_sources(layers)
+    tasks = []
+    for path in sources:
+        tasks += [t for t in install_tasks(path, yaml_versions)
+                  if t not in tasks]
+    bake_temp = ss.get_jinja_env().get_template('bake/bake.yml.j2')
+    artifacts.atomic_write(work_dir + 'bake.yml', bake_temp.render(
+        name=name,
+        sources=[os.path.relpath(p, PLAYBOOKS_DIR) for p in sources],
+        versions=yaml.dump(yaml_versions, default_flow_style=False),
+        tasks=yaml.dump(tasks, default_flow_style=False, sort_keys=False,
+                        width=1000)))
+
+    return work_dir
+
+
+def bake(layers, cluster=None, force=False, output=print):
+    """Build a box with the packages of some layers and add it to Vagrant.
+
+    :param layers: Layers names, 'base' first
+    :type layers: list
+    :param cluster: Cluster name (global versions if None), defaults to None
+    :type cluster: str, optional
+    :param force: Rebuild the box if it already exists, defaults to False
+    :type force: bool, optional
+    :raises subprocess.CalledProcessError: If a Vagrant command fails
+    :return: The box name and whether it has been built
+    :rtype: tuple
+    """
+
+    name = box_name(layers, box_key(layers, cluster))
+    registry = load_registry()
+    if name in registry and not force:
+        return name, False
+
+    work_dir = render_bake(name, layers, cluster)
+    box_file = work_dir + name + '.box'
+    try:
+        for command in [['vagrant', 'up'],
+                        ['vagrant', 'package', '--output', box_file],
+                        ['vagrant', 'box', 'add', '--force',
+                         '--name', name, box_file]]:
+            output(' '.join(command))
+            subprocess.run(command, cwd=work_dir, check=True)
+    finally:
+        subprocess.run(['vagrant', 'destroy', '-f'], cwd=work_dir)
+        if os.path.exists(box_file):
+            os.remove(box_file)
+
+    registry[name] = {
+        'layers': layers,
+        'key': box_key(layers, cluster),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    save_registry(registry)
+    return name, True
@@ -3,13 +3,15 @@ import json
 import pathlib
 import string
 import subprocess
-from distutils import dir_util
 from shutil import rmtree
 
 from jumbo.utils.settings import JUMBODIR
 from jumbo.utils import session as ss, exceptions as ex
-from jumbo.utils import checks
-from jumbo.core import services
+from jumbo.utils import checks, versions as vs
+from jumbo.core import services, store
+
+# Summary of each cluster, to list the clusters without parsing their configs
+SUMMARY_INDEX = JUMBODIR + '.cache/clusters.json'
 
 
 def check_config(name):
@@ -21,13 +23,16 @@ def check_config(name):
     return os.path.isfile(JUMBODIR + name + '/jumbo_config')
 
 
-def create_cluster(domain, template=None, *, cluster):
+def create_cluster(domain, template=None, *, cluster, dump=True):
     """Create a new cluster and load it in the session.
 
     :param name: New cluster name
     :type name: str
     :param domain: New cluster domain name
     :type domain: str
+    :param dump: Write the cluster configuration, defaults to True. The
+                 caller dumps the session itself otherwise.
+    :type dump: bool, optional
     :raises ex.CreationError: If name already used
     :return: True on creation success
     """
@@ -43,23 +48,25 @@ def create_cluster(domain, template=None, *, cluster):
                                    'NameNotAllowed')
 
     ss.clear()
-    data_dir = os.path.dirname(os.path.abspath(__file__)) + '/data/'
     config_dir = os.path.dirname(os.path.abspath(__file__)) + '/config/'
     if template:
         try:
             with open(config_dir + 'templates/' + template + '.json') \
                     as template_file:
                 ss.svars = json.load(template_file)
+            ss.reindex()
         except:
             raise ex.LoadError('template', template, 'NotExist')
 
     pathlib.Path(JUMBODIR + cluster).mkdir(parents=True)
 
-    dir_util.copy_tree(data_dir, JUMBODIR + cluster)
-    dir_util._path_created = {}
+    store.link_cluster(cluster)
     ss.svars['cluster'] = cluster
     ss.svars['domain'] = domain if domain else '%s.local' % cluster
 
+    if not dump:
+        return True
+
     services_components_hosts = None
     if template:
         services_components_hosts = services.get_services_components_hosts()
@@ -104,6 +111,8 @@ def delete_cluster(*, cluster):
         subprocess.check_output(['vagrant', 'destroy', '-f'])
         os.chdir(current_dir)
         rmtree(JUMBODIR + cluster)
+        vs.clear_resolved_cache(cluster)
+        store.prune()
     except IOError as e:
         raise ex.LoadError('cluster', cluster, e.strerror)
 
@@ -111,24 +120,139 @@ def delete_cluster(*, cluster):
     return True
 
 
-def list_clusters():
-    """List all the clusters managed by Jumbo.
+def config_stat(cluster):
+    """Return the modification time and the size of a cluster's config.
 
-    :raises ex.LoadError: If a cluster doesn't have a 'jumbo_config' file
-    :return: The list of clusters' configurations
-    :rtype: dict
+    :param cluster: Cluster name
+    :type cluster: str
+    :return: [mtime in ns, size], None if the config doesn't exist
+    :rtype: list
+    """
+
+    try:
+        st = os.stat(JUMBODIR + cluster + '/jumbo_config')
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def summarize_config(config):
+    return {
+        'cluster': config['cluster'],
+        'domain': config['domain'],
+        'nodes': len(config['nodes']),
+        'services': config['services']
+    }
+
+
+def load_summary_index():
+    try:
+        with open(SUMMARY_INDEX, 'r') as sf:
+            index = json.load(sf)
+    except (OSError, ValueError):
+        return {}
+    return index if isinstance(index, dict) else {}
+
+
+def save_summary_index(index):
+    from jumbo.utils import artifacts
+
+    try:
+        os.makedirs(os.path.dirname(SUMMARY_INDEX), exist_ok=True)
+        artifacts.atomic_write(SUMMARY_INDEX, json.dumps(index))
+    except OSError:
+        pass
+
+
+def update_summary(config):
+    """Update the summary of a cluster in the summary index.
+
+    Called each time a cluster config is dumped. The summaries are checked
+    against the configs' mtime when listing, so a lost update only costs a
+    parsing of the config.
+
+    :param config: The cluster configuration
+    :type config: dict
+    """
+
+    stat = config_stat(config['cluster'])
+    if stat is None:
+        return
+
+    index = load_summary_index()
+    entry = dict(summarize_config(config), stat=stat)
+    if index.get(config['cluster']) != entry:
+        index[config['cluster']] = entry
+        save_summary_index(index)
+
+
+def read_summary(cluster):
+    """Parse the config of a cluster and summarize it.
+
+    :param cluster: Cluster name
+    :type cluster: str
+    :return: The summary, or the reason why the config can't be read
+    :rtype: tuple
     """
-    path_list = [f.path for f in os.scandir(JUMBODIR) if f.is_dir()]
-    clusters = []
 
-    for p in path_list:
-        if not check_config(p.split('/')[-1]):
-            raise ex.LoadError('cluster', p.split('/')[-1], 'NoConfFile')
+    stat = config_stat(cluster)
+    if stat is None:
+        return None, 'NoConfFile'
+    try:
+        with open(JUMBODIR + cluster + '/jumbo_config', 'r') as cfg:
+            summary = summarize_config(json.load(cfg))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        return None, str(e) or e.__class__.__name__
+    return dict(summary, stat=stat), None
+
+
+def summarize_clusters(workers=8):
+    """Summarize all the clusters managed by Jumbo.
+
+    The summaries come from the summary index. The clusters whose config
+    changed since their summary was indexed are parsed concurrently, and
+    the index is updated.
+
+    :param workers: Number of configs parsed concurrently, defaults to 8
+    :type workers: int, optional
+    :return: The name, domain, number of nodes and services of the clusters,
+             and the reason why each broken cluster can't be read
+    :rtype: tuple (list, dict)
+    """
+
+    names = sorted(f.name for f in os.scandir(JUMBODIR)
+                   if f.is_dir() and not f.name.startswith('.'))
+    index = load_summary_index()
+    stale = [n for n in names
+             if n not in index or index[n].get('stat') != config_stat(n)]
+
+    if len(stale) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parsed = dict(zip(stale, executor.map(read_summary, stale)))
+    else:
+        parsed = {n: read_summary(n) for n in stale}
+
+    summaries = []
+    broken = {}
+    for n in names:
+        if n in parsed:
+            summary, error = parsed[n]
+            if error:
+                broken[n] = error
+                index.pop(n, None)
+                continue
+            index[n] = summary
+        summaries.append({k: v for k, v in index[n].items() if k != 'stat'})
 
-        with open(p + '/jumbo_config') as cfg:
-            clusters += [json.load(cfg)]
+    removed = [n for n in index if n not in names]
+    for n in removed:
+        del index[n]
+    if stale or removed:
+        save_summary_index(index)
 
-    return clusters
+    return summaries, broken
 
 
 @checks.valid_cluster
@@ -0,0 +1,82 @@
+# Record the duration of each task of the provisioning for `jumbo profile`.
+# Runs in the Ansible host VM: compatible with Python 2 and 3.
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import json
+import os
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+DOCUMENTATION = '''
+    callback: jumbo_timings
+    type: aggregate
+    short_description: Records the duration of the tasks per host
+    description:
+      - Writes the plays and tasks timings in ~/jumbo_timings.json (or in
+        the file of the JUMBO_TIMINGS environment variable) at the end of
+        the playbook.
+'''
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'jumbo_timings'
+
+    def __init__(self):
+        super(CallbackModule, self).__init__()
+        self.output = os.environ.get(
+            'JUMBO_TIMINGS', os.path.expanduser('~/jumbo_timings.json'))
+        self.start = time.time()
+        self.play = None
+        self.task_start = self.start
+        self.started = {}
+        self.tasks = []
+
+    def v2_playbook_on_play_start(self, play):
+        self.play = play.get_name()
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self.task_start = time.time()
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self.task_start = time.time()
+
+    def v2_runner_on_start(self, host, task):
+        # Only called by Ansible >= 2.8, task_start is used otherwise
+        self.started[(host.get_name(), task._uuid)] = time.time()
+
+    def record(self, result, status):
+        host = result._host.get_name()
+        task = result._task
+        end = time.time()
+        start = self.started.pop((host, task._uuid), self.task_start)
+        self.tasks.append({
+            'play': self.play,
+            'role': task._role.get_name() if task._role else None,
+            'task': task.get_name(),
+            'host': host,
+            'status': status,
+            'start': start,
+            'duration': end - start
+        })
+
+    def v2_runner_on_ok(self, result):
+        self.record(result, 'changed' if result._result.get('changed')
+                    else 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self.record(result, 'ignored' if ignore_errors else 'failed')
+
+    def v2_runner_on_unreachable(self, result):
+        self.record(result, 'unreachable')
+
+    def v2_playbook_on_stats(self, stats):
+        with open(self.output, 'w') as tf:
+            json.dump({
+                'start': self.start,
+                'end': time.time(),
+                'tasks': self.tasks
+            }, tf)
@@ -0,0 +1,524 @@
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+from jumbo.utils import exceptions as ex
+from jumbo.utils.settings import JUMBODIR
+
+MIRROR_CONF = JUMBODIR + 'mirror.json'
+CACHE_DIR = JUMBODIR + '.cache/mirror/'
+
+# Cached files that are refreshed from upstream after METADATA_TTL seconds
+METADATA_PATTERNS = [r'/repodata/', r'\.repo$', r'metalink', r'mirrorlist']
+METADATA_TTL = 3600
+
+# Delay between two refreshes of the allowed hosts by `serve`, in seconds
+ALLOWED_REFRESH = 60
+
+DEFAULT_CONF = {
+    'enabled': False,
+    'address': None,
+    'port': 8181
+}
+
+# Hosts the mirror downloads from, see `is_allowed`
+allowed_hosts = set()
+allowed_lock = threading.Lock()
+
+# Locks of the URLs being downloaded, with their number of users
+fetch_locks = {}
+fetch_locks_lock = threading.Lock()
+
+
+def load_conf():
+    """Load the mirror configuration of ~/.jumbo/mirror.json.
+
+    :return: The mirror configuration
+    :rtype: dict
+    """
+
+    conf = dict(DEFAULT_CONF)
+    try:
+        with open(MIRROR_CONF, 'r') as mc:
+            conf.update(json.load(mc))
+    except (IOError, ValueError):
+        pass
+    return conf
+
+
+def save_conf(conf):
+    """Write the mirror configuration in ~/.jumbo/mirror.json.
+
+    :param conf: The mirror configuration
+    :type conf: dict
+    """
+
+    from jumbo.utils import artifacts
+
+    os.makedirs(JUMBODIR, exist_ok=True)
+    artifacts.atomic_write(MIRROR_CONF, json.dumps(conf, indent=2))
+
+
+def mirror_address(conf, nodes):
+    """Return the address of the mirror seen from the VMs of a cluster.
+
+    By default, it is the host address (.1) of the private network of the
+    first node.
+
+    :param conf: The mirror configuration
+    :type conf: dict
+    :param nodes: Nodes of the cluster
+    :type nodes: list
+    :rtype: str
+    """
+
+    if conf['address']:
+        return conf['address']
+    if not nodes:
+        return None
+    return '.'.join(nodes[0]['ip'].split('.')[:3] + ['1'])
+
+
+def mirror_url(url, base):
+    """Rewrite an URL to fetch it through the mirror.
+
+    :param url: Upstream URL
+    :type url: str
+    :param base: Mirror base URL (http://address:port)
+    :type base: str
+    :return: The mirror URL, http://address:port/<scheme>/<host>/<path>
+    :rtype: str
+    """
+
+    parts = urlsplit(url)
+    if parts.scheme not in ['http', 'https']:
+        return url
+    return '{}/{}/{}{}'.format(base, parts.scheme, parts.netloc,
+                               url[len(parts.scheme + '://' +
+                                       parts.netloc):])
+
+
+def rewrite_versions(yaml_versions, base):
+    """Rewrite the URLs of the resolved versions to use the mirror.
+
+    :param yaml_versions: Versions returned by `versions.get_yaml_config`
+    :type yaml_versions: dict
+    :param base: Mirror base URL
+    :type base: str
+    :return: The versions, modified in place
+    :rtype: dict
+    """
+
+    for service in yaml_versions['services'].values():
+        service['url'] = mirror_url(service['url'], base)
+    for platform in yaml_versions['platform'].values():
+        for resource in platform['resources'].values():
+            resource['url'] = mirror_url(resource['url'], base)
+
+    return yaml_versions
+
+
+def base_url(nodes):
+    """Return the mirror base URL of a cluster, used to rewrite the URLs of
+    its versions (see `rewrite_versions`).
+
+    :param nodes: Nodes of the cluster
+    :type nodes: list
+    :return: The mirror base URL, None if the mirror is disabled
+    :rtype: str
+    """
+
+    conf = load_conf()
+    address = mirror_address(conf, nodes)
+    if not conf['enabled'] or not address:
+        return None
+
+    return 'http://%s:%d' % (address, conf['port'])
+
+
+def repo_file_hosts(content):
+    """Return the hosts of the URLs of a yum .repo file.
+
+    :param content: Content of the .repo file
+    :type content: bytes
+    :rtype: set
+    """
+
+    hosts = (urlsplit(u.decode('utf-8', 'replace')).hostname
+             for u in re.findall(rb'https?://[^\s]+', content))
+    return {h.lower() for h in hosts if h}
+
+
+def refresh_allowed_hosts():
+    """Add the hosts of the resources of the global and clusters
+    versions.json files, and of the .repo files among them that are
+    downloaded, to the allowed hosts.
+    """
+
+    from jumbo.core import prefetch
+
+    clusters = [None]
+    if os.path.isdir(JUMBODIR):
+        clusters += sorted(
+            e.name for e in os.scandir(JUMBODIR)
+            if e.is_dir() and not e.name.startswith('.')
+            and os.path.isfile(os.path.join(e.path, 'jumbo_config')))
+    hosts = set()
+    for cluster in clusters:
+        files, repos = prefetch.resources_urls(cluster)
+        for url in files + repos:
+            hosts.add(urlsplit(url).hostname)
+            path = prefetched(url) or cache_path(url)
+            if url.endswith('.repo') and path and os.path.isfile(path):
+                with open(path, 'rb') as rf:
+                    hosts |= repo_file_hosts(rf.read())
+
+    with allowed_lock:
+        allowed_hosts.update(h.lower() for h in hosts if h)
+
+
+def try_refresh_allowed_hosts():
+    """Refresh the allowed hosts, and keep the hosts already allowed if a
+    versions.json file is invalid.
+    """
+
+    try:
+        refresh_allowed_hosts()
+    except (OSError, ValueError, ex.LoadError):
+        pass
+
+
+def refresh_allowed_hosts_every(delay, stop):
+    """Refresh the allowed hosts until stopped, so that the clusters created
+    while the mirror runs are served.
+
+    :param delay: Delay between two refreshes, in seconds
+    :type delay: int
+    :param stop: Event that stops the refreshes
+    :type stop: threading.Event
+    """
+
+    while not stop.wait(delay):
+        try_refresh_allowed_hosts()
+
+
+def is_allowed(host):
+    """Check if the mirror can download from a host.
+
+    The mirror only downloads the resources of versions.json files and the
+    packages of their repositories: the other hosts are refused, so that it
+    can't be used as an open proxy. The hosts are computed by `serve`, not
+    while answering the requests.
+
+    :param host: Host name, without port
+    :type host: str
+    :rtype: bool
+    """
+
+    with allowed_lock:
+        return (host or '').lower() in allowed_hosts
+
+
+def cache_path(url):
+    """Return the path of the cached copy of an URL.
+
+    :param url: Upstream URL
+    :type url: str
+    :return: The path in the cache, None if the URL is not allowed
+    :rtype: str
+    """
+
+    parts = urlsplit(url)
+    path = parts.path if parts.path and not parts.path.endswith('/') \
+        else parts.path + 'index.html'
+    if parts.query:
+        path += '?' + parts.query
+    path = os.path.normpath(CACHE_DIR + parts.scheme + '/' +
+                            parts.netloc + '/' + path.lstrip('/'))
+    if not path.startswith(CACHE_DIR):
+        return None
+    return path
+
+
+def is_metadata(url):
+    return any(re.search(p, url) for p in METADATA_PATTERNS)
+
+
+def is_cached(url):
+    """Check if a fresh copy of an URL is in the cache.
+
+    :param url: Upstream URL
+    :type url: str
+    :rtype: bool
+    """
+
+    try:
+        mtime = os.stat(cache_path(url)).st_mtime
+    except (OSError, TypeError):
+        return False
+    return not is_metadata(url) or time.time() - mtime < METADATA_TTL
+
+
+def prefetched(url):
+    """Return the copy of an URL downloaded by `jumbo prefetch`, if fresh.
+
+    :param url: Upstream URL
+    :type url: str
+    :rtype: str
+    """
+
+    from jumbo.core import prefetch
+
+    path = prefetch.lookup(url)
+    if path and is_metadata(url) \
+            and time.time() - os.stat(path).st_mtime >= METADATA_TTL:
+        return None
+    return path
+
+
+def rewrite_repo_file(content, base):
+    """Rewrite the URLs of a yum .repo file to use the mirror.
+
+    :param content: Content of the .repo file
+    :type content: bytes
+    :param base: Mirror base URL
+    :type base: str
+    :rtype: bytes
+    """
+
+    return re.sub(rb'(https?://[^\s]+)',
+                  lambda m: mirror_url(m.group(1).decode('utf-8'),
+                                       base).encode('utf-8'),
+                  content)
+
+
+@contextlib.contextmanager
+def single_flight(url):
+    """Serialize the downloads of an URL: the first request downloads it
+    while the others wait, then find it in the cache.
+
+    :param url: Upstream URL
+    :type url: str
+    """
+
+    with fetch_locks_lock:
+        entry = fetch_locks.setdefault(url, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with fetch_locks_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del fetch_locks[url]
+
+
+def listen_address(conf, nodes):
+    """Return the address the mirror listens on by default: the mirror
+    address seen from the VMs (see `mirror_address`), or the loopback if
+    there is no cluster.
+
+    The default mirror address only exists once VirtualBox has created the
+    private network of the cluster, see `wait_address`.
+
+    :param conf: The mirror configuration
+    :type conf: dict
+    :param nodes: Nodes of the cluster managed
+    :type nodes: list
+    :rtype: str
+    """
+
+    return mirror_address(conf, nodes) or '127.0.0.1'
+
+
+def can_bind(address):
+    """Check if an address exists on the host and can be listened on.
+
+    :param address: IP address
+    :type address: str
+    :rtype: bool
+    """
+
+    import socket
+
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind((address, 0))
+    except OSError:
+        return False
+    return True
+
+
+def wait_address(address, delay=1):
+    """Wait until an address can be listened on.
+
+    The private network of a cluster is created when its VMs start, before
+    they are provisioned: the mirror can be started first and waits for it.
+
+    :param address: IP address
+    :type address: str
+    :param delay: Delay between two checks, in seconds, defaults to 1
+    :type delay: int, optional
+    """
+
+    while not can_bind(address):
+        time.sleep(delay)
+
+
+def serve(address='127.0.0.1', port=8181):
+    """Run the mirror HTTP server until interrupted.
+
+    The server answers to:
+    - GET /<scheme>/<host>/<path>: the file at <scheme>://<host>/<path>;
+    - GET <absolute URL> (HTTP proxy requests): the file at this URL;
+    - CONNECT host:port: a tunnel to host:port (not cached).
+
+    The files are downloaded once, even when requested by several VMs at the
+    same time, and served from ~/.jumbo/.cache/mirror, or from the files
+    downloaded by `jumbo prefetch`. Only the hosts of the
+    versions.json resources and of their .repo files are reachable (see
+    `is_allowed`), the other requests are refused with a 403. The allowed
+    hosts are computed when the server starts, and refreshed every
+    ALLOWED_REFRESH seconds.
+
+    :param address: Address to listen on, defaults to '127.0.0.1'
+    :type address: str
+    :param port: Port to listen on, defaults to 8181
+    :type port: int
+    """
+
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((address, port), mirror_handler())
+    try_refresh_allowed_hosts()
+    stop = threading.Event()
+    threading.Thread(target=refresh_allowed_hosts_every,
+                     args=(ALLOWED_REFRESH, stop), daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        stop.set()
+        server.server_close()
+
+
+def mirror_handler():
+    """Build the request handler class of the mirror server.
+
+    :rtype: type
+    """
+
+    import select
+    import shutil
+    import socket
+    import urllib.request
+
+    from http.server import BaseHTTPRequestHandler
+
+    class MirrorHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def upstream_url(self):
+            if self.path.startswith(('http://', 'https://')):
+                return self.path
+            parts = self.path.lstrip('/').split('/', 2)
+            if len(parts) < 2 or parts[0] not in ['http', 'https']:
+                return None
+            return '{}://{}/{}'.format(parts[0], parts[1],
+                                       parts[2] if len(parts) > 2 else '')
+
+        def do_HEAD(self):
+            self.do_GET(body=False)
+
+        def do_GET(self, body=True):
+            url = self.upstream_url()
+            path = cache_path(url) if url else None
+            if not path:
+                self.send_error(404)
+                return
+            if not is_allowed(urlsplit(url).hostname):
+                self.send_error(403)
+                return
+
+            blob = prefetched(url)
+            if blob:
+                path = blob
+            elif not is_cached(url):
+                with single_flight(url):
+                    # Downloaded by another request meanwhile
+                    if not is_cached(url):
+                        try:
+                            fetch(url, path)
+                        except OSError as e:
+                            if not os.path.isfile(path):
+                                self.send_error(502, str(e))
+                                return
+
+            with open(path, 'rb') as cf:
+                data = None
+                if url.endswith('.repo'):
+                    data = cf.read()
+                    with allowed_lock:
+                        allowed_hosts.update(repo_file_hosts(data))
+                    # Proxy requests have the upstream host as Host header
+                    if self.path.startswith('/'):
+                        data = rewrite_repo_file(
+                            data, 'http://' + self.headers['Host'])
+                self.send_response(200)
+                self.send_header('Content-Length', str(
+                    len(data) if data is not None
+                    else os.fstat(cf.fileno()).st_size))
+                self.end_headers()
+                if not body:
+                    return
+                if data is not None:
+                    self.wfile.write(data)
+                else:
+                    shutil.copyfileobj(cf, self.wfile)
+
+        def do_CONNECT(self):
+            host, _, port = self.path.partition(':')
+            if not is_allowed(host):
+                self.send_error(403)
+                return
+            try:
+                upstream = socket.create_connection((host, int(port or 443)),
+                                                    timeout=30)
+            except (OSError, ValueError) as e:
+                self.send_error(502, str(e))
+                return
+
+            self.send_response(200, 'Connection established')
+            self.end_headers()
+            sockets = [self.connection, upstream]
+            with upstream:
+                while True:
+                    readable, _, _ = select.select(sockets, [], [], 60)
+                    if not readable:
+                        break
+                    for s in readable:
+                        data = s.recv(65536)
+                        if not data:
+                            return
+                        (upstream if s is self.connection
+                         else self.connection).sendall(data)
+            self.close_connection = True
+
+    def fetch(url, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '%s.tmp-%d-%d' % (path, os.getpid(), threading.get_ident())
+        try:
+            with urllib.request.urlopen(url, timeout=60) as res, \
+                    open(tmp, 'wb') as tf:
+                shutil.copyfileobj(res, tf)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    return MirrorHandler
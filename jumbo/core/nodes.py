@@ -71,20 +71,18 @@ def edit_node(name, ip=None, ram=None, cpus=None, *, cluster):
     if check_ip(ip, cluster=cluster):
         raise ex.CreationError('node', name, 'IP', ip, 'Exists')
 
-
     changed = []
 
-    for i, m in enumerate(ss.svars['nodes']):
-        if m['name'] == name:
-            if ip:
-                changed.append(["IP", ss.svars['nodes'][i]['ip'], ip])
-                ss.svars['nodes'][i]['ip'] = ip
-            if ram:
-                changed.append(["RAM", ss.svars['nodes'][i]['ram'], ram])
-                ss.svars['nodes'][i]['ram'] = ram
-            if cpus:
-                changed.append(["CPUs", ss.svars['nodes'][i]['cpus'], cpus])
-                ss.svars['nodes'][i]['cpus'] = cpus
+    m = ss.get_node(name)
+    if ip:
+        changed.append(["IP", m['ip'], ip])
+        ss.set_node_ip(name, ip)
+    if ram:
+        changed.append(["RAM", m['ram'], ram])
+        m['ram'] = ram
+    if cpus:
+        changed.append(["CPUs", m['cpus'], cpus])
+        m['cpus'] = cpus
 
     ss.dump_config()
 
@@ -108,9 +106,7 @@ def remove_node(*, cluster, node):
     if not check_node(cluster=cluster, node=node):
         raise ex.LoadError('node', node, 'NotExist')
 
-    for i, m in enumerate(ss.svars['nodes']):
-        if m['name'] == node:
-            del(ss.svars['nodes'][i])
+    ss.remove_node(node)
 
     ss.dump_config()
 
@@ -128,11 +124,7 @@ def check_node(*, cluster, node):
     :return: True if the node exists
     :rtype: bool
     """
-    for m in ss.svars['nodes']:
-        if m['name'] == node:
-            return True
-
-    return False
+    return ss.get_node(node) is not None
 
 
 @valid_cluster
@@ -148,8 +140,8 @@ def check_ip(ip, *, cluster):
     :return: True if the ip is used
     :rtype: bool
     """
-    for m in ss.svars['nodes']:
-        if m['ip'] == ip:
-            return m['name']
+    m = ss.get_node_by_ip(ip)
+    if m:
+        return m['name']
 
     return False
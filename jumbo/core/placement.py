@@ -0,0 +1,148 @@
+from jumbo.utils import session as ss
+
+# Decisions of the placements since the last `clear`, for explanations
+decisions = []
+
+ram_costs = {}
+
+
+def clear():
+    """Forget the recorded placement decisions.
+    """
+
+    del decisions[:]
+
+
+def component_ram(name, catalog):
+    """Return the RAM needed by a component, in MB.
+
+    The RAM of a component is its `ram` in services.json if defined.
+    Otherwise, the daemons of a service share the RAM required by the service
+    (`requirements.ram`) left by the components defining their own, and the
+    clients (`auto_install`) need none.
+
+    :param name: Component name
+    :type name: str
+    :param catalog: The services catalog
+    :type catalog: dict
+    :rtype: float
+    """
+
+    if name not in ram_costs:
+        service = catalog['services'][catalog['component_service'][name]]
+        daemons = [c for c in service['components']
+                   if c['name'] not in service['auto_install']]
+        shared = [c for c in daemons if 'ram' not in c]
+        left = service['requirements'].get('ram', 0) \
+            - sum(c['ram'] for c in daemons if 'ram' in c)
+        for c in service['components']:
+            if 'ram' in c:
+                ram_costs[c['name']] = c['ram']
+            elif c in shared:
+                ram_costs[c['name']] = max(0, left) / len(shared)
+            else:
+                ram_costs[c['name']] = 0
+
+    return ram_costs[name]
+
+
+def is_daemon(name, catalog):
+    service = catalog['services'][catalog['component_service'][name]]
+    return name not in service['auto_install']
+
+
+def node_load(node, catalog):
+    """Return the resources left on a node.
+
+    :param node: Node of the session
+    :type node: dict
+    :param catalog: The services catalog
+    :type catalog: dict
+    :return: The free RAM (MB) and the number of daemons per CPU
+    :rtype: tuple
+    """
+
+    used = sum(component_ram(c, catalog) for c in node['components'])
+    daemons = sum(1 for c in node['components'] if is_daemon(c, catalog))
+    return node['ram'] - used, daemons / max(1, node['cpus'])
+
+
+def describe(node, component, ranks, catalog):
+    free, load = node_load(node, catalog)
+    return '{} ({}, {:.0f}/{} MB free, {:.1f} daemons/CPU)'.format(
+        node['name'], component['hosts_types'][ranks[node['name']][0]],
+        free, node['ram'], load)
+
+
+def plan(component, dist, catalog):
+    """Choose the nodes of the session cluster where to install a component.
+
+    The candidates are the nodes of the component's `hosts_types`. A node
+    hosts at most one instance of a component, so the instances of HA
+    components (NameNodes, ResourceManagers, ZooKeeper servers...) are on
+    distinct nodes. The candidates are ranked by:
+    1. enough free RAM for the component first;
+    2. then by order of the `hosts_types`;
+    3. then with the most free RAM;
+    4. then with the fewest daemons per CPU;
+    5. then in the order of the cluster.
+
+    :param component: Component from services.json
+    :type component: dict
+    :param dist: 'default' or 'ha'
+    :type dist: str
+    :param catalog: The services catalog
+    :type catalog: dict
+    :return: The chosen nodes names and the number of instances missing:
+             0 if the placement is complete, -1 - number of candidates for
+             components installed everywhere
+    :rtype: tuple
+    """
+
+    name = component['name']
+    number = component['number'][dist]
+    if number == 0:
+        return [], 0
+
+    candidates = []
+    ranks = {}
+    for rank, host_type in enumerate(component['hosts_types']):
+        for m in ss.get_nodes_by_type(host_type):
+            if m['name'] not in ranks:
+                ranks[m['name']] = (rank, len(candidates))
+                candidates.append(m)
+
+    if number == -1:
+        chosen = [m['name'] for m in candidates
+                  if name not in m['components']]
+        return chosen, -1 - len(candidates)
+
+    hosting = [m for m in candidates if name in m['components']]
+    free = [m for m in candidates if name not in m['components']]
+    needed = number - len(hosting)
+    ram = component_ram(name, catalog)
+
+    def score(m):
+        free_ram, load = node_load(m, catalog)
+        rank, order = ranks[m['name']]
+        return free_ram < ram, rank, -free_ram, load, order
+
+    free.sort(key=score)
+    chosen = [m['name'] for m in free[:max(0, needed)]]
+    for i, m in enumerate(free[:len(chosen)]):
+        others = free[i + 1:]
+        decisions.append({
+            'component': name,
+            'node': m['name'],
+            'overcommitted': score(m)[0],
+            'reason': '{:.0f} MB needed, {} chosen over: {}{}{}'.format(
+                ram, describe(m, component, ranks, catalog),
+                ', '.join(describe(o, component, ranks, catalog)
+                          for o in others[:3]) or 'no other candidate',
+                ' and %d more' % (len(others) - 3) if len(others) > 3
+                else '',
+                '; already on ' + ', '.join(h['name'] for h in hosting)
+                if hosting else '')
+        })
+
+    return chosen, max(0, needed - len(chosen))
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import threading
+
+from urllib.parse import urljoin, urlsplit
+
+from jumbo.utils.settings import JUMBODIR
+from jumbo.utils import versions as vs
+
+BLOBS_DIR = JUMBODIR + '.cache/blobs/'
+INDEX = BLOBS_DIR + 'index.json'
+PARTIAL_DIR = BLOBS_DIR + 'partial/'
+
+# Size of the chunks read from the network, in bytes
+CHUNK_SIZE = 1024 * 1024
+
+# Extensions of the resources downloaded as files, the other resources are
+# yum repositories
+FILE_EXTENSIONS = ['.rpm', '.jar', '.repo', '.tar.gz', '.tgz', '.zip']
+
+index_lock = threading.Lock()
+
+
+def load_index():
+    """Load the index of the downloaded resources.
+
+    :return: The sha256 and size of each downloaded URL
+    :rtype: dict
+    """
+
+    try:
+        with open(INDEX, 'r') as idx:
+            return json.load(idx)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_index(index):
+    from jumbo.utils import artifacts
+
+    os.makedirs(BLOBS_DIR, exist_ok=True)
+    artifacts.atomic_write(INDEX, json.dumps(index, indent=2,
+                                             sort_keys=True))
+
+
+def blob_path(sha256):
+    return BLOBS_DIR + 'sha256/%s/%s' % (sha256[:2], sha256)
+
+
+def lookup(url, index=None):
+    """Return the path of the downloaded copy of an URL.
+
+    :param url: Resource URL
+    :type url: str
+    :param index: Index returned by `load_index`, loaded if None
+    :type index: dict, optional
+    :return: The path of the file, None if the URL has not been downloaded
+    :rtype: str
+    """
+
+    entry = (index if index is not None else load_index()).get(url)
+    if not entry:
+        return None
+
+    path = blob_path(entry['sha256'])
+    try:
+        if os.stat(path).st_size == entry['size']:
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def resources_urls(cluster=None):
+    """List the URLs of the resources used by a cluster.
+
+    :param cluster: Cluster name (global versions if None), defaults to None
+    :type cluster: str, optional
+    :return: The URLs of the files and of the yum repositories
+    :rtype: tuple
+    """
+
+    yaml_versions = vs.get_yaml_config(cluster)
+    urls = [s['url'] for s in yaml_versions['services'].values()]
+    for platform in yaml_versions['platform'].values():
+        urls.extend(r['url'] for r in platform['resources'].values())
+
+    files = [u for u in urls if is_file_url(u)]
+    repos = [u for u in urls if u not in files]
+    return files, repos
+
+
+def is_file_url(url):
+    """Check if a resource URL is a file rather than a yum repository.
+
+    Repositories often end with a dotted version (e.g. .../updates/2.6.4.0),
+    so only the known `FILE_EXTENSIONS` are files.
+
+    :param url: Resource URL
+    :type url: str
+    :rtype: bool
+    """
+
+    path = urlsplit(url).path.lower()
+    return path.endswith(tuple(FILE_EXTENSIONS))
+
+
+def repo_packages(repo_url, index):
+    """List the files of a yum repository, with their checksums.
+
+    :param repo_url: Base URL of the repository
+    :type repo_url: str
+    :param index: The index of the downloaded resources
+    :type index: dict
+    :return: The (url, sha256) of the metadata and of the packages
+    :rtype: list
+    """
+
+    import gzip
+    import xml.etree.ElementTree as ET
+
+    repo_url = repo_url.rstrip('/') + '/'
+    repomd_url = urljoin(repo_url, 'repodata/repomd.xml')
+    with open(download(repomd_url, index, refresh=True), 'rb') as rf:
+        repomd = ET.parse(rf).getroot()
+
+    ns = {'repo': 'http://linux.duke.edu/metadata/repo',
+          'common': 'http://linux.duke.edu/metadata/common'}
+    files = []
+    primary = None
+    for data in repomd.findall('repo:data', ns):
+        checksum = data.find('repo:checksum', ns)
+        href = data.find('repo:location', ns).get('href')
+        sha256 = checksum.text if checksum.get('type') == 'sha256' else None
+        files.append((urljoin(repo_url, href), sha256))
+        if data.get('type') == 'primary':
+            primary = files[-1]
+
+    if primary:
+        with gzip.open(download(primary[0], index, primary[1]), 'rb') as pf:
+            packages = ET.parse(pf).getroot().findall('common:package', ns)
+            for package in packages:
+                checksum = package.find('common:checksum', ns)
+                href = package.find('common:location', ns).get('href')
+                files.append((urljoin(repo_url, href),
+                              checksum.text
+                              if checksum.get('type') == 'sha256' else None))
+
+    return files
+
+
+def download(url, index, sha256=None, refresh=False):
+    """Download an URL in the blobs cache, resuming partial downloads.
+
+    :param url: Resource URL
+    :type url: str
+    :param index: The index of the downloaded resources, updated in place
+    :type index: dict
+    :param sha256: Expected checksum, defaults to None
+    :type sha256: str, optional
+    :param refresh: Download even if already cached, defaults to False
+    :type refresh: bool, optional
+    :raises IOError: If the download fails or the checksum doesn't match
+    :return: The path of the file in the cache
+    :rtype: str
+    """
+
+    import shutil
+    import urllib.error
+    import urllib.request
+
+    if not refresh:
+        with index_lock:
+            path = lookup(url, index)
+        if path and (not sha256 or index[url]['sha256'] == sha256):
+            return path
+
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    partial = PARTIAL_DIR + hashlib.sha1(url.encode('utf-8')).hexdigest()
+    offset = os.path.getsize(partial) if os.path.isfile(partial) else 0
+
+    req = urllib.request.Request(url)
+    if offset:
+        req.add_header('Range', 'bytes=%d-' % offset)
+    try:
+        res = urllib.request.urlopen(req, timeout=60)
+    except urllib.error.HTTPError as e:
+        # The partial file is complete or invalid: start again
+        if e.code != 416:
+            raise
+        os.remove(partial)
+        return download(url, index, sha256, refresh)
+
+    with res, open(partial, 'ab' if res.status == 206 else 'wb') as pf:
+        shutil.copyfileobj(res, pf, CHUNK_SIZE)
+
+    h = hashlib.sha256()
+    with open(partial, 'rb') as pf:
+        for chunk in iter(lambda: pf.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    if sha256 and h.hexdigest() != sha256:
+        os.remove(partial)
+        raise IOError('Checksum mismatch for %s' % url)
+
+    path = blob_path(h.hexdigest())
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(partial, path)
+    with index_lock:
+        index[url] = {
+            'sha256': h.hexdigest(),
+            'size': os.path.getsize(path)
+        }
+
+    return path
+
+
+def prefetch(cluster=None, workers=8, packages=False, progress=None):
+    """Download the resources used by a cluster in the blobs cache.
+
+    :param cluster: Cluster name (global versions if None), defaults to None
+    :type cluster: str, optional
+    :param workers: Number of concurrent downloads, defaults to 8
+    :type workers: int, optional
+    :param packages: Also download the packages of the yum repositories,
+                     defaults to False (only their metadata)
+    :type packages: bool, optional
+    :param progress: Called with (url, error) after each download
+    :type progress: callable, optional
+    :return: The URLs that couldn't be downloaded
+    :rtype: list
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    index = load_index()
+    files, repos = resources_urls(cluster)
+    todo = [(u, None) for u in files]
+    failed = []
+
+    def list_repo(repo):
+        try:
+            return [f for f in repo_packages(repo, index)
+                    if packages or '/repodata/' in f[0]]
+        except (IOError, ValueError, SyntaxError) as e:
+            failed.append(repo)
+            if progress:
+                progress(repo, str(e))
+            return []
+
+    def fetch(item):
+        error = None
+        try:
+            download(item[0], index, item[1])
+        except (IOError, ValueError) as e:
+            error = str(e)
+            failed.append(item[0])
+        if progress:
+            progress(item[0], error)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for repo_files in pool.map(list_repo, repos):
+            todo.extend(repo_files)
+        # A file can be referenced by several repositories
+        todo = list(dict(todo).items())
+        list(pool.map(fetch, todo))
+
+    save_index(index)
+    return failed
@@ -0,0 +1,282 @@
+import contextlib
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+
+from jumbo.utils.settings import JUMBODIR
+
+PROFILES_DIR = 'profiles/'
+
+# Path of the tasks timings written by the jumbo_timings callback plugin in
+# the Ansible host VM
+TIMINGS_PATH = '/home/vagrant/jumbo_timings.json'
+
+# Vagrant output line: ==> <machine>: <message>
+VAGRANT_LINE = re.compile(r'^(?:\x1b\[[0-9;]*m)*==> ([\w.-]+): (.*)$')
+PROVISIONER = re.compile(r'Running provisioner: (.*?)(?: \(\w+\))?\.\.\.')
+
+current_run = None
+run_lock = threading.Lock()
+
+
+def start_run(cluster, command):
+    """Start recording the timings of a provisioning.
+
+    :param cluster: Cluster name
+    :type cluster: str
+    :param command: Jumbo command being profiled
+    :type command: str
+    :return: The run
+    :rtype: dict
+    """
+
+    global current_run
+    current_run = {
+        'cluster': cluster,
+        'command': command,
+        'start': time.time(),
+        'end': None,
+        'phases': [],
+        'tasks': [],
+        'open': {}
+    }
+    return current_run
+
+
+def begin_phase(name, node=None):
+    """Start a phase of the current run.
+
+    :param name: Phase name
+    :type name: str
+    :param node: Node of the phase, None for the whole cluster
+    :type node: str, optional
+    :return: The phase, None if no run is recorded
+    :rtype: dict
+    """
+
+    if current_run is None:
+        return None
+
+    phase = {
+        'name': name,
+        'node': node,
+        'start': time.time(),
+        'duration': None
+    }
+    with run_lock:
+        current_run['phases'].append(phase)
+    return phase
+
+
+def end_phase(phase):
+    if phase and phase['duration'] is None:
+        phase['duration'] = time.time() - phase['start']
+
+
+@contextlib.contextmanager
+def phase(name, node=None):
+    """Record the duration of a block as a phase of the current run.
+
+    :param name: Phase name
+    :type name: str
+    :param node: Node of the phase, None for the whole cluster
+    :type node: str, optional
+    """
+
+    p = begin_phase(name, node)
+    try:
+        yield p
+    finally:
+        end_phase(p)
+
+
+def track_output(line):
+    """Update the Vagrant phases of the nodes from a line of Vagrant output.
+
+    The 'boot' phase of a node lasts until its first provisioner, then each
+    provisioner is a phase.
+
+    :param line: Line of `vagrant up` output
+    :type line: str
+    """
+
+    if current_run is None:
+        return
+
+    match = VAGRANT_LINE.match(line)
+    if not match:
+        return
+
+    node = match.group(1)
+    suffix = '_' + current_run['cluster']
+    if node.endswith(suffix):
+        node = node[:-len(suffix)]
+
+    opened = current_run['open']
+    provisioner = PROVISIONER.search(match.group(2))
+    if provisioner:
+        end_phase(opened.get(node))
+        opened[node] = begin_phase('provision: ' + provisioner.group(1),
+                                   node)
+    elif node not in opened:
+        opened[node] = begin_phase('boot', node)
+
+
+def end_node_phases(node=None):
+    """End the Vagrant phases of a node, or of all the nodes.
+
+    :param node: Node name, defaults to None (all the nodes)
+    :type node: str, optional
+    """
+
+    if current_run is None:
+        return
+
+    opened = current_run['open']
+    for name in [node] if node else list(opened):
+        end_phase(opened.pop(name, None))
+
+
+def collect_tasks(cluster, node):
+    """Fetch the tasks timings written by Ansible in the Ansible host.
+
+    :param cluster: Cluster name
+    :type cluster: str
+    :param node: Ansible host name
+    :type node: str
+    :return: The timings, None if they couldn't be fetched
+    :rtype: dict
+    """
+
+    try:
+        res = subprocess.run(['vagrant', 'ssh', '%s_%s' % (node, cluster),
+                              '-c', 'cat %s' % TIMINGS_PATH],
+                             cwd=os.path.join(JUMBODIR, cluster),
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL,
+                             timeout=60)
+        return json.loads(res.stdout.decode('utf-8'))
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+
+def finish_run(ansible_host=None):
+    """End the current run, fetch the Ansible timings and save the run in
+    the cluster directory.
+
+    :param ansible_host: Ansible host name, defaults to None (no Ansible
+                         timings)
+    :type ansible_host: str, optional
+    :return: The path of the saved run, None if no run is recorded
+    :rtype: str
+    """
+
+    from jumbo.utils import artifacts
+
+    global current_run
+    run = current_run
+    if run is None:
+        return None
+
+    end_node_phases()
+    current_run = None
+    run['end'] = time.time()
+    del run['open']
+
+    timings = collect_tasks(run['cluster'], ansible_host) \
+        if ansible_host else None
+    # Only keep the tasks of this run
+    if timings and timings.get('start', 0) >= run['start']:
+        run['tasks'] = timings.get('tasks', [])
+
+    profiles_dir = JUMBODIR + run['cluster'] + '/' + PROFILES_DIR
+    os.makedirs(profiles_dir, exist_ok=True)
+    path = profiles_dir + '%s-%03d.json' % (
+        time.strftime('%Y%m%d-%H%M%S', time.localtime(run['start'])),
+        run['start'] % 1 * 1000)
+    artifacts.atomic_write(path, json.dumps(run, indent=2))
+    return path
+
+
+def list_runs(cluster):
+    """List the recorded runs of a cluster, oldest first.
+
+    :param cluster: Cluster name
+    :type cluster: str
+    :return: The paths of the runs
+    :rtype: list
+    """
+
+    profiles_dir = JUMBODIR + cluster + '/' + PROFILES_DIR
+    try:
+        return [profiles_dir + f for f in sorted(os.listdir(profiles_dir))
+                if f.endswith('.json')]
+    except OSError:
+        return []
+
+
+def load_run(path):
+    with open(path, 'r') as rf:
+        return json.load(rf)
+
+
+def summarize(run, top=10):
+    """Aggregate the timings of a run.
+
+    :param run: Run loaded by `load_run`
+    :type run: dict
+    :param top: Number of slowest tasks to return, defaults to 10
+    :type top: int, optional
+    :return: The total duration, the phases, the slowest tasks, the duration
+             of the tasks per node and per play (wall clock)
+    :rtype: dict
+    """
+
+    nodes = {}
+    plays = {}
+    for task in run['tasks']:
+        nodes[task['host']] = nodes.get(task['host'], 0) + task['duration']
+        start, end = plays.get(task['play'], (task['start'], 0))
+        plays[task['play']] = (min(start, task['start']),
+                               max(end, task['start'] + task['duration']))
+
+    return {
+        'total': (run['end'] or run['start']) - run['start'],
+        'phases': [(p['name'], p['node'], p['duration'] or 0)
+                   for p in run['phases']],
+        'tasks': sorted(run['tasks'], key=lambda t: t['duration'],
+                        reverse=True)[:top],
+        'nodes': sorted(nodes.items(), key=lambda n: n[1], reverse=True),
+        'plays': [(play, end - start) for play, (start, end)
+                  in sorted(plays.items(), key=lambda p: p[1][0])]
+    }
+
+
+def compare(old, new):
+    """Compare the phases and plays durations of two runs.
+
+    :param old: Run loaded by `load_run`
+    :type old: dict
+    :param new: Run loaded by `load_run`
+    :type new: dict
+    :return: (name, old duration, new duration) of each phase and play, the
+             durations of the phases being summed over the nodes
+    :rtype: list
+    """
+
+    def durations(run):
+        summary = summarize(run, top=0)
+        res = {'total': summary['total']}
+        for name, _, duration in summary['phases']:
+            res[name] = res.get(name, 0) + duration
+        for play, duration in summary['plays']:
+            res['play: %s' % play] = duration
+        return res
+
+    old_d = durations(old)
+    new_d = durations(new)
+    names = list(new_d) + [n for n in old_d if n not in new_d]
+    return [(n, old_d.get(n), new_d.get(n)) for n in names]
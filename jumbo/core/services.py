@@ -1,5 +1,8 @@
+import hashlib
 import os
 import json
+import pathlib
+import pickle
 
 from jumbo.core import nodes
 from jumbo.utils import exceptions as ex, session as ss
@@ -7,6 +10,11 @@ from jumbo.utils.settings import JUMBODIR
 from jumbo.utils.checks import valid_cluster
 
 
+SERVICES_CONF = (os.path.dirname(os.path.abspath(__file__)) +
+                 '/config/services.json')
+CACHE_DIR = JUMBODIR + '.cache/'
+
+
 def load_services_conf():
     """Load the global services configuration.
 
@@ -14,12 +22,205 @@ def load_services_conf():
     :rtype: json
     """
 
-    with open(os.path.dirname(os.path.abspath(__file__)) +
-              '/config/services.json') as cfg:
+    with open(SERVICES_CONF) as cfg:
         return json.load(cfg)
 
 
-config = load_services_conf()
+def compile_catalog(conf):
+    """Build the lookup tables of a services configuration.
+
+    :param conf: The services configuration
+    :type conf: dict
+    :raises ex.LoadError: If the services requirements form a cycle
+    :return: The services and components indexed by name, the service of each
+             component, the components of each service, the cardinalities of
+             each component, the services depending on each service and the
+             requirements graph (see `compile_requirements`)
+    :rtype: dict
+    """
+
+    catalog = {
+        'services': {},
+        'components': {},
+        'component_service': {},
+        'service_components': {},
+        'number': {},
+        'dependents': {
+            'default': {},
+            'ha': {}
+        }
+    }
+
+    for s in conf['services']:
+        catalog['services'][s['name']] = s
+        catalog['service_components'][s['name']] = []
+        for c in s['components']:
+            catalog['components'][c['name']] = c
+            catalog['component_service'][c['name']] = s['name']
+            catalog['service_components'][s['name']].append(c['name'])
+            catalog['number'][c['name']] = c['number']
+        for req in ['default', 'ha']:
+            for req_s in s['requirements']['services'][req]:
+                catalog['dependents'][req].setdefault(req_s, []) \
+                    .append(s['name'])
+
+    catalog.update(compile_requirements(conf))
+    return catalog
+
+
+def compile_requirements(conf):
+    """Compile the services requirements into a DAG.
+
+    For each mode ('default' and 'ha'):
+    - 'requires': the services directly required by each service;
+    - 'closure': all the services required by each service, dependencies
+      first. The requirements of the required services are always the
+      'default' ones;
+    - 'order': all the services, each one after its 'default' requirements.
+
+    :param conf: The services configuration
+    :type conf: dict
+    :raises ex.LoadError: If the requirements form a cycle
+    :rtype: dict
+    """
+
+    requires = {
+        req: {s['name']: list(s['requirements']['services'][req])
+              for s in conf['services']}
+        for req in ['default', 'ha']
+    }
+
+    # Depth-first post-order of the 'default' requirements
+    closure = {'default': {}, 'ha': {}}
+    order = []
+
+    def visit(name, path):
+        if name in closure['default']:
+            return
+        if name in path:
+            cycle = path[path.index(name):] + [name]
+            raise ex.LoadError('services requirements', ' -> '.join(cycle),
+                               'Cycle')
+        deps = []
+        for r in requires['default'].get(name, []):
+            visit(r, path + [name])
+            for d in closure['default'][r] + [r]:
+                if d not in deps:
+                    deps.append(d)
+        closure['default'][name] = deps
+        order.append(name)
+
+    for s in conf['services']:
+        visit(s['name'], [])
+        # Also detect the cycles through HA requirements
+        for r in requires['ha'][s['name']]:
+            visit(r, [])
+            if s['name'] in closure['default'][r] + [r]:
+                raise ex.LoadError(
+                    'services requirements',
+                    ' -> '.join([s['name'], r, s['name']]), 'Cycle')
+
+    for s in conf['services']:
+        deps = []
+        for r in requires['ha'][s['name']]:
+            for d in closure['default'][r] + [r]:
+                if d not in deps:
+                    deps.append(d)
+        closure['ha'][s['name']] = deps
+
+    return {
+        'requires': requires,
+        'closure': closure,
+        'order': order
+    }
+
+
+def catalog_cache_path(raw):
+    """Return the cache path of the catalog of a services configuration,
+    keyed on the hash of services.json and of this module, which compiles
+    the catalog.
+
+    :param raw: Content of services.json
+    :type raw: bytes
+    :rtype: str
+    """
+
+    digest = hashlib.sha1(raw)
+    with open(os.path.abspath(__file__), 'rb') as src:
+        digest.update(src.read())
+    return CACHE_DIR + 'services-%s.pickle' % digest.hexdigest()
+
+
+def load_catalog():
+    """Load the global services configuration and its compiled catalog.
+
+    The catalog is cached in ~/.jumbo/.cache (see `catalog_cache_path`). An
+    invalid cache is compiled again and replaced.
+
+    :return: The configuration and the catalog
+    :rtype: tuple
+    """
+
+    with open(SERVICES_CONF, 'rb') as cfg:
+        raw = cfg.read()
+
+    cache = catalog_cache_path(raw)
+    try:
+        with open(cache, 'rb') as cf:
+            return pickle.load(cf)
+    except Exception:
+        # Missing, truncated or written by another version of Jumbo
+        pass
+
+    conf = json.loads(raw.decode('utf-8'))
+    loaded = (conf, compile_catalog(conf))
+    try:
+        pathlib.Path(CACHE_DIR).mkdir(parents=True, exist_ok=True)
+        with open(cache + '.%d' % os.getpid(), 'wb') as cf:
+            pickle.dump(loaded, cf)
+        os.replace(cache + '.%d' % os.getpid(), cache)
+    except OSError:
+        pass
+
+    return loaded
+
+
+def load():
+    """Load the services configuration and catalog in the module.
+    """
+
+    global config, catalog
+    config, catalog = load_catalog()
+
+
+def get_config():
+    """Return the global services configuration, loading it on first use.
+
+    :rtype: dict
+    """
+
+    if 'config' not in globals():
+        load()
+    return config
+
+
+def get_catalog():
+    """Return the services catalog, loading it on first use.
+
+    :rtype: dict
+    """
+
+    if 'catalog' not in globals():
+        load()
+    return catalog
+
+
+def __getattr__(name):
+    if name in ['config', 'catalog']:
+        load()
+        return globals()[name]
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 def check_service(name):
@@ -30,10 +231,7 @@ def check_service(name):
     :return: True if the service exists
     """
 
-    for s in config['services']:
-        if s['name'] == name:
-            return s
-    return False
+    return get_catalog()['services'].get(name, False)
 
 
 def check_service_cluster(name):
@@ -58,11 +256,7 @@ def check_component(name):
     :return: The service of the component if the component exists
     """
 
-    for s in config['services']:
-        for c in s['components']:
-            if name == c['name']:
-                return s['name']
-    return False
+    return get_catalog()['component_service'].get(name, False)
 
 
 def add_component(name, node, cluster, ha=None):
@@ -78,11 +272,8 @@ def add_component(name, node, cluster, ha=None):
     :raises ex.CreationError: [description]
     """
 
-    for i, m in enumerate(ss.svars['nodes']):
-        if m['name'] == node:
-            m_index = i
-            break
-    else:
+    m_conf = ss.get_node(node)
+    if not m_conf:
         raise ex.LoadError('node', node, 'NotExist')
 
     service = check_component(name)
@@ -93,10 +284,6 @@ def add_component(name, node, cluster, ha=None):
         raise ex.CreationError(
             'cluster', cluster, 'service', service, 'NotInstalled')
 
-    for i, m in enumerate(ss.svars['nodes']):
-        if m['name'] == node:
-            m_index = i
-
     if ha is None:
         ha = check_comp_number(service, name)
 
@@ -115,11 +302,11 @@ def add_component(name, node, cluster, ha=None):
         raise ex.CreationError('service', name, 'components', print_missing,
                                'ReqNotMet')
 
-    if name in ss.svars['nodes'][m_index]['components']:
+    if name in m_conf['components']:
         raise ex.CreationError('node', node, 'component', name,
                                'Installed')
 
-    ss.svars['nodes'][m_index]['components'].append(name)
+    ss.add_component(node, name)
     ss.dump_config(get_services_components_hosts())
 
 
@@ -165,7 +352,7 @@ def add_service(name, ha=False, *, cluster):
         raise ex.CreationError('service', name, 'components', print_missing,
                                'ReqNotMet')
 
-    ss.svars['services'].append(name)
+    ss.add_service(name)
     auto_install_service(name, cluster, ha)
     ss.dump_config(get_services_components_hosts())
 
@@ -181,55 +368,58 @@ def check_service_req_service(name, ha=False):
     :rtype: dict
     """
 
+    s = get_catalog()['services'].get(name)
+    if not s:
+        raise ex.LoadError('service', name, 'NotExist')
+
     req = 'ha' if ha else 'default'
     missing_serv = []
     missing_comp = {}
-    for s in config['services']:
-        if s['name'] == name:
-            for req_s in s['requirements']['services'][req]:
-                if req_s not in ss.svars['services']:
-                    missing_serv.append(req_s)
-                missing_comp.update(check_service_req_comp(req_s))
-            return missing_serv, missing_comp
-    raise ex.LoadError('service', name, 'NotExist')
+    for req_s in s['requirements']['services'][req]:
+        if req_s not in ss.svars['services']:
+            missing_serv.append(req_s)
+        missing_comp.update(check_service_req_comp(req_s))
+    return missing_serv, missing_comp
 
 
-def check_service_req_comp(name):
+def check_service_req_comp(name, counts=None):
     """Check if all the components required are installed for a service.
 
     :param name: Service name
     :type name: str
-    :param ha: Weither the service is in HA, defaults to False
+    :param counts: Components counts, filled on first use, defaults to None
+                   (counted in the session)
+    :type counts: dict, optional
     :raises ex.LoadError: If the service doesn't exist
     :return: The missing components needed to install the service
     :rtype: dict
     """
 
+    if name not in get_catalog()['services']:
+        raise ex.LoadError('service', name, 'NotExist')
+
     missing = {
         'default': {},
         'ha': {}
     }
-    comp_count = count_components()
-    for s in config['services']:
-        if s['name'] == name:
-            for comp in s['components']:
-                req = 'default'
-                req_number = comp['number'][req] if comp['number'][req] != -1 \
-                    else 1
-                missing_count = req_number - comp_count[comp['name']]
-                if missing_count > 0:
-                    missing['default'][comp['name']] = missing_count
-                req = 'ha'
-                req_number = comp['number'][req] if comp['number'][req] != -1 \
-                    else 1
-                missing_count = req_number - comp_count[comp['name']]
-                if missing_count > 0:
-                    missing['ha'][comp['name']] = missing_count
-
-            if not missing['ha'] or not missing['default']:
-                return {}
-            return missing
-    raise ex.LoadError('service', name, 'NotExist')
+    for comp in get_catalog()['service_components'][name]:
+        if counts is None:
+            comp_count = ss.count_component(comp)
+        else:
+            if comp not in counts:
+                counts[comp] = ss.count_component(comp)
+            comp_count = counts[comp]
+        for req in ['default', 'ha']:
+            req_number = get_catalog()['number'][comp][req]
+            if req_number == -1:
+                req_number = 1
+            missing_count = req_number - comp_count
+            if missing_count > 0:
+                missing[req][comp] = missing_count
+
+    if not missing['ha'] or not missing['default']:
+        return {}
+    return missing
 
 
 @valid_cluster
@@ -268,14 +458,13 @@ def count_components():
     """
 
     components = get_available_components()
-    for node in ss.svars['nodes']:
-        for c in node['components']:
-            components[c] += 1
+    for c in components:
+        components[c] = ss.count_component(c)
     return components
 
 
 def get_available_types():
-    return config['node_types']
+    return get_config()['node_types']
 
 
 def get_available_services():
@@ -285,10 +474,7 @@ def get_available_services():
     :rtype: dict
     """
 
-    services = {}
-    for s in config['services']:
-        services[s['name']] = 0
-    return services
+    return dict.fromkeys(get_catalog()['services'], 0)
 
 
 def get_available_components():
@@ -298,11 +484,7 @@ def get_available_components():
     :rtype: dict
     """
 
-    components = {}
-    for s in config['services']:
-        for c in s['components']:
-            components[c['name']] = 0
-    return components
+    return dict.fromkeys(get_catalog()['components'], 0)
 
 
 def get_service_components(name):
@@ -314,12 +496,7 @@ def get_service_components(name):
     :rtype: list
     """
 
-    components = []
-    for s in config['services']:
-        if s['name'] == name:
-            for c in s['components']:
-                components.append(c['name'])
-    return components
+    return list(get_catalog()['service_components'].get(name, []))
 
 
 def check_dependent_services(service, ha=False):
@@ -332,12 +509,8 @@ def check_dependent_services(service, ha=False):
     """
 
     req = 'ha' if ha else 'default'
-    dependent = []
-    for s in config['services']:
-        if s['name'] in ss.svars['services']:
-            if service in s['requirements']['services'][req]:
-                dependent.append(s['name'])
-    return dependent
+    return [s for s in get_catalog()['dependents'][req].get(service, [])
+            if s in ss.svars['services']]
 
 
 def check_comp_number(service, component):
@@ -350,44 +523,38 @@ def check_comp_number(service, component):
     :return: True if the service is in HA mode, false otherwise
     """
 
+    if service not in get_catalog()['services']:
+        raise ex.LoadError('service', service, 'NotExist')
+    if get_catalog()['component_service'].get(component) != service:
+        raise ex.LoadError('component', component, 'NotExist')
+
     ha = 'ha' if check_ha(service) else 'default'
-    serv_comp_host = get_services_components_hosts()
-    number_comp = 1
-    if serv_comp_host[service].get(component):
-        number_comp = len(serv_comp_host[service][component]) + 1
-    for s in config['services']:
-        if s['name'] == service:
-            for c in s['components']:
-                if c['name'] == component:
-                    if number_comp > c['number'][ha] \
-                            and c['number'][ha] != -1:
-                        raise ex.CreationError('cluster',
-                                               ss.svars['cluster'],
-                                               'components',
-                                               component,
-                                               'MaxNumber')
-                    elif number_comp == c['number']['ha']:
-                        to_remove = {}
-                        for comp in s['components']:
-                            n = 0
-                            max_n = comp['number']['ha']
-                            if serv_comp_host[service].get(comp['name']):
-                                n = len(serv_comp_host[service][comp['name']])
-                            if n > max_n and max_n != -1:
-                                to_remove[comp['name']] = n - max_n
-                        if to_remove:
-                            print_remove = []
-                            for k, v in to_remove.items():
-                                print_remove.append('{} {}'.format(v, k))
-                            raise ex.CreationError('service',
-                                                   service,
-                                                   'components',
-                                                   print_remove,
-                                                   'TooManyHA')
-                        return True
-                    return False
-            raise ex.LoadError('component', component, 'NotExist')
-    raise ex.LoadError('service', service, 'NotExist')
+    number = get_catalog()['number'][component]
+    number_comp = ss.count_component(component) + 1
+    if number_comp > number[ha] and number[ha] != -1:
+        raise ex.CreationError('cluster',
+                               ss.svars['cluster'],
+                               'components',
+                               component,
+                               'MaxNumber')
+    elif number_comp == number['ha']:
+        to_remove = {}
+        for comp in get_catalog()['service_components'][service]:
+            n = ss.count_component(comp)
+            max_n = get_catalog()['number'][comp]['ha']
+            if n > max_n and max_n != -1:
+                to_remove[comp] = n - max_n
+        if to_remove:
+            print_remove = []
+            for k, v in to_remove.items():
+                print_remove.append('{} {}'.format(v, k))
+            raise ex.CreationError('service',
+                                   service,
+                                   'components',
+                                   print_remove,
+                                   'TooManyHA')
+        return True
+    return False
 
 
 def check_ha(service):
@@ -398,17 +565,15 @@ def check_ha(service):
     :return: True if the service is in HA mode, False otherwise
     """
 
-    serv_comp_host = get_services_components_hosts()
-    for s in config['services']:
-        if s['name'] == service:
-            for c in s['components']:
-                if serv_comp_host[service].get(c['name']):
-                    number_comp = len(serv_comp_host[service][c['name']])
-                    if number_comp > c['number']['default'] \
-                            and c['number']['ha'] > c['number']['default']:
-                        return True
-            return False
-    raise ex.LoadError('service', service, 'NotExist')
+    if service not in get_catalog()['services']:
+        raise ex.LoadError('service', service, 'NotExist')
+
+    for c in get_catalog()['service_components'][service]:
+        number = get_catalog()['number'][c]
+        if ss.count_component(c) > number['default'] \
+                and number['ha'] > number['default']:
+            return True
+    return False
 
 
 @valid_cluster
@@ -438,16 +603,11 @@ def remove_service(service, *, cluster):
             'service', service, 'services', dependent, 'Dependency'
         )
 
-    serv_comp = get_service_components(service)
-    for m in ss.svars['nodes']:
-        to_remove = []
-        for c in m['components']:
-            if c in serv_comp:
-                to_remove.append(c)
-        for c in to_remove:
-            m['components'].remove(c)
+    for c in get_service_components(service):
+        for m in ss.get_component_hosts(c):
+            ss.remove_component(m, c)
 
-    ss.svars['services'].remove(service)
+    ss.remove_service(service)
     ss.dump_config(get_services_components_hosts())
 
 
@@ -474,34 +634,26 @@ def remove_component(component, *, node, cluster):
     if not service:
         raise ex.LoadError('component', component, 'NotExist')
 
-    for i, m in enumerate(ss.svars['nodes']):
-        if m['name'] == node:
-            m_index = i
-
-    if component not in ss.svars['nodes'][m_index]['components']:
+    if component not in ss.get_node(node)['components']:
         raise ex.CreationError('node', node, 'component', component,
                                'NotInstalled')
 
-    ss.svars['nodes'][m_index]['components'].remove(component)
+    ss.remove_component(node, component)
     ss.dump_config(get_services_components_hosts())
 
 
 @valid_cluster
-def list_components(*, node, cluster):
-    """List the components installed on a node of a specified cluster.
+def list_cluster_components(*, cluster):
+    """List the components installed on all the nodes of a cluster, with
+    their service and abbreviation.
 
-    :param node: Machine name
-    :type node: str
     :param cluster: Cluster name
     :type cluster: str
-    :raises ex.LoadError: [description]
-    :return: The list of the components installed on the node
-    :rtype: list
+    :raises ex.LoadError: If the cluster configuration can't be read
+    :return: The components of each node, in the cluster's order
+    :rtype: dict {node: {component: {'service': str, 'abbr': str}, ...}, ...}
     """
 
-    if not nodes.check_node(cluster=cluster, node=node):
-        raise ex.LoadError('node', node, 'NotExist')
-
     if cluster != ss.svars['cluster']:
         try:
             with open(JUMBODIR + cluster + '/jumbo_config', 'r') as clf:
@@ -511,12 +663,20 @@ def list_components(*, node, cluster):
     else:
         cluster_conf = ss.svars
 
+    catalog = get_catalog()
+    described = {}
+    nodes_components = {}
     for m in cluster_conf['nodes']:
-        if m['name'] == node:
-            m_conf = m
-            break
+        nodes_components[m['name']] = {}
+        for c in m['components']:
+            if c not in described:
+                described[c] = {
+                    'service': catalog['component_service'].get(c),
+                    'abbr': catalog['components'].get(c, {}).get('abbr')
+                }
+            nodes_components[m['name']][c] = described[c]
 
-    return m_conf['components']
+    return nodes_components
 
 
 def get_abbr(component, service):
@@ -531,32 +691,18 @@ def get_abbr(component, service):
     if not check_component(component):
         raise ex.LoadError('component', component, 'NotExist')
 
-    for s in config['services']:
-        if s['name'] == service:
-            for c in s['components']:
-                if c['name'] == component:
-                    return c['abbr']
+    if get_catalog()['component_service'][component] == service:
+        return get_catalog()['components'][component]['abbr']
 
 
 def get_services_components_hosts():
-    """Generate the list services->components->hosts of the session cluster.
+    """Return the list services->components->hosts of the session cluster.
 
-    :return: The list services->components->hosts
-    :rtype: dict
+    :return: The read-only view services->components->hosts
+    :rtype: types.MappingProxyType
     """
 
-    services_components_hosts = {}
-    for s in ss.svars['services']:
-        services_components_hosts[s] = {}
-        components = get_service_components(s)
-        for c in components:
-            services_components_hosts[s][c] = []
-            for m in ss.svars['nodes']:
-                if c in m['components']:
-                    services_components_hosts[s][c].append(m['name'])
-            if not services_components_hosts[s][c]:
-                services_components_hosts[s].pop(c)
-    return services_components_hosts
+    return ss.get_services_components_hosts()
 
 
 @valid_cluster
@@ -607,35 +753,34 @@ def auto_assign(service, ha, *, cluster):
 def auto_assign_service_comp(component, dist, cluster, check):
     """Auto-install a component on the best fitting hosts.
 
+    The hosts are chosen by the placement engine, on the free resources of
+    the nodes (see `placement.plan`).
+
     :param component: component dict from services.json
     :type component dict
-    :param dist:
+    :param dist: 'default' or 'ha'
     :param cluster
+    :param check: Only compute the placement if True
+    :return: The number of instances that couldn't be placed (see
+             `placement.plan`)
     """
 
-    count = component['number'][dist]  # -1 = everywhere
-    if count == 0:
-        return 0
-    for host_type in component['hosts_types']:
-        for m in ss.svars['nodes']:
-            if host_type in m['types']:
-                try:
-                    if not check:
-                        add_component(component['name'],
-                                      node=m['name'],
-                                      cluster=cluster,
-                                      ha=dist == 'ha')
-                # Ignore error when adding already existing component
-                except ex.CreationError as e:
-                    if e.type == 'Installed':
-                        pass
-                    else:
-                        raise e
-                count -= 1
-                if count == 0:
-                    return 0
+    from jumbo.core import placement
 
-    return count
+    if check:
+        placement_decisions = list(placement.decisions)
+    hosts, left = placement.plan(component, dist, get_catalog())
+    if check:
+        placement.decisions[:] = placement_decisions
+        return left
+
+    for host in hosts:
+        add_component(component['name'],
+                      node=host,
+                      cluster=cluster,
+                      ha=dist == 'ha')
+
+    return left
 
 
 def auto_install_service(service, cluster, ha=False):
@@ -648,12 +793,10 @@ def auto_install_service(service, cluster, ha=False):
     """
 
     req = 'ha' if ha else 'default'
-    for s in config['services']:
-        if s['name'] == service:
-            for c in s['components']:
-                if c['name'] in s['auto_install']:
-                    auto_assign_service_comp(c, req, cluster,
-                                             check=False)
+    s = get_catalog()['services'][service]
+    for c in s['components']:
+        if c['name'] in s['auto_install']:
+            auto_assign_service_comp(c, req, cluster, check=False)
 
 
 def auto_install_node(node, cluster):
@@ -667,20 +810,17 @@ def auto_install_node(node, cluster):
     """
 
     count = 0
-    for m in ss.svars['nodes']:
-        if m['name'] == node:
-            m_conf = m
+    m_conf = ss.get_node(node)
 
-    for s in config['services']:
-        if s['name'] in ss.svars['services']:
+    installed = set(ss.svars['services'])
+    for name, s in get_catalog()['services'].items():
+        if name in installed:
             for c in s['auto_install']:
-                for comp in s['components']:
-                    if comp['name'] == c:
-                        for t in m_conf['types']:
-                            if t in comp['hosts_types']:
-                                add_component(c, node=node,
-                                              cluster=cluster)
-                                count += 1
+                comp = get_catalog()['components'][c]
+                for t in m_conf['types']:
+                    if t in comp['hosts_types']:
+                        add_component(c, node=node, cluster=cluster)
+                        count += 1
 
     return count
 
@@ -689,6 +829,11 @@ def auto_install_node(node, cluster):
 def get_service_dependencies(name, ha=False, first=False, *, cluster):
     """Return the missing dependencies of a service
 
+    The missing services are the services of the requirements closure that
+    are not installed, dependencies first. The missing components are the
+    components needed by the requirements of the service and of the missing
+    services whose own requirements are all installed.
+
     :param name: The service name
     :type name: str
     :param cluster: The cluster name
@@ -697,39 +842,45 @@ def get_service_dependencies(name, ha=False, first=False, *, cluster):
     :param ha: bool, optional
     :param first: True if this is the main service to, defaults to False
     :param first: bool, optional
+    :raises ex.LoadError: If the service doesn't exist
     :return: The missing components and services
     :rtype: dict {'components': {comp: number_missing, ...}, 'services': []}
     """
 
+    catalog = get_catalog()
+    if name not in catalog['services']:
+        raise ex.LoadError('service', name, 'NotExist')
+
+    req = 'ha' if ha else 'default'
+    installed = set(ss.svars['services'])
+    missing_serv = [s for s in catalog['closure'][req][name]
+                    if s not in installed]
+
     dependencies = {
         'components': {},
-        'services': []
+        'services': missing_serv if first else missing_serv + [name]
     }
 
-    missing_serv, missing_comp = check_service_req_service(name, ha)
-    for s in missing_serv:
-        missing_serv_dep = get_service_dependencies(name=s, cluster=cluster)
-        for dep in missing_serv_dep['services']:
-            if dep not in dependencies['services']:
-                dependencies['services'].append(dep)
-        if missing_serv_dep['components']:
-            dependencies['components'].update(missing_serv_dep['components'])
-    if not missing_serv:
-        if missing_comp:
-            dependencies['components'].update(missing_comp['default'])
-
-    if not first:
-        dependencies['services'].append(name)
+    # Snapshot of the components counts, shared by all the services
+    counts = {}
+    missing_comp = {}
+    for s in [name] + missing_serv:
+        requires = catalog['requires'][req if s == name else 'default'][s]
+        if any(r not in installed for r in requires):
+            continue
+        for r in requires:
+            if r not in missing_comp:
+                missing_comp[r] = check_service_req_comp(r, counts)
+            dependencies['components'].update(
+                missing_comp[r].get('default', {}))
 
     return dependencies
 
 
 def get_component(name):
-    for s in config['services']:
-        for c in s['components']:
-            if c['name'] == name:
-                return c
-    raise ex.LoadError('component', name, 'NotExist')
+    if name not in get_catalog()['components']:
+        raise ex.LoadError('component', name, 'NotExist')
+    return get_catalog()['components'][name]
 
 
 @valid_cluster
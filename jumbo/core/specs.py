@@ -0,0 +1,387 @@
+import ipaddress
+import json
+import string
+
+from jumbo.core import clusters, services
+from jumbo.utils import session as ss, exceptions as ex, checks
+
+# Keys of a node in a spec: name, type and whether the key is required
+NODE_KEYS = [
+    ('name', str, True),
+    ('ip', str, True),
+    ('ram', int, True),
+    ('cpus', int, False),
+    ('types', list, False),
+    ('components', list, False)
+]
+
+
+def load_spec(path):
+    """Load a cluster specification file (JSON or YAML).
+
+    :param path: Path of the specification file
+    :type path: str
+    :raises ex.LoadError: If the file doesn't exist or can't be parsed
+    :return: The specification
+    :rtype: dict
+    """
+
+    try:
+        with open(path, 'r') as sf:
+            if path.endswith(('.yml', '.yaml')):
+                import yaml
+
+                spec = yaml.safe_load(sf)
+            else:
+                spec = json.load(sf)
+    except IOError:
+        raise ex.LoadError('spec', path, 'NotExist')
+    except ValueError as e:
+        raise ex.LoadError('spec', path, str(e))
+
+    check_spec(spec, path)
+    return spec
+
+
+def check_spec(spec, path=None):
+    """Check the structure of a specification before it is normalized.
+
+    :param spec: The specification
+    :type spec: dict
+    :param path: Path of the specification file
+    :type path: str, optional
+    :raises ex.LoadError: If a required key is missing or has a wrong type
+    """
+
+    if not isinstance(spec, dict):
+        raise ex.LoadError('spec', path, 'The spec must be a mapping.')
+
+    for key in ['cluster', 'domain']:
+        if spec.get(key) is not None and not isinstance(spec[key], str):
+            raise ex.LoadError('spec', path,
+                               '"%s" must be a string.' % key)
+
+    for key in ['nodes', 'services']:
+        if not isinstance(spec.get(key, []), list):
+            raise ex.LoadError('spec', path, '"%s" must be a list.' % key)
+
+    for i, s in enumerate(spec.get('services', [])):
+        if isinstance(s, str):
+            continue
+        if not isinstance(s, dict) or not isinstance(s.get('name'), str):
+            raise ex.LoadError('spec', path,
+                               'Service %d must be a name or a mapping '
+                               'with a "name" string.' % (i + 1))
+
+    for i, n in enumerate(spec.get('nodes', [])):
+        if not isinstance(n, dict):
+            raise ex.LoadError('spec', path,
+                               'Node %d must be a mapping.' % (i + 1))
+        for key, key_type, required in NODE_KEYS:
+            if key not in n and not required:
+                continue
+            if not isinstance(n.get(key), key_type) \
+                    or isinstance(n.get(key), bool):
+                raise ex.LoadError('spec', path,
+                                   'Node %d: "%s" must be a %s.'
+                                   % (i + 1, key, key_type.__name__))
+
+
+def normalize_spec(spec, cluster=None):
+    """Build the target cluster configuration described by a specification.
+
+    :param spec: The specification
+    :type spec: dict
+    :param cluster: Cluster name, overrides the one of the spec
+    :type cluster: str, optional
+    :raises ex.LoadError: If the spec is malformed or doesn't name a cluster
+    :return: The target configuration (same format as `ss.svars`) and the
+             services in HA mode
+    :rtype: tuple
+    """
+
+    check_spec(spec)
+
+    cluster = cluster if cluster else spec.get('cluster')
+    if not cluster:
+        raise ex.LoadError('spec', None, 'NoContext')
+
+    target = {
+        'cluster': cluster,
+        'domain': spec.get('domain') or '%s.local' % cluster,
+        'nodes': [],
+        'services': []
+    }
+    ha_services = []
+
+    for s in spec.get('services', []):
+        if isinstance(s, dict):
+            name = s['name']
+            if s.get('ha', False):
+                ha_services.append(name)
+        else:
+            name = s
+        target['services'].append(name)
+
+    for n in spec.get('nodes', []):
+        target['nodes'].append({
+            'name': n['name'],
+            'ip': n['ip'],
+            'ram': n['ram'],
+            'types': list(n.get('types', [])),
+            'cpus': n.get('cpus', 1),
+            'components': list(n.get('components', [])),
+            'groups': []
+        })
+
+    return target, ha_services
+
+
+def validate_target(target, ha_services):
+    """Check a whole target configuration against the services.json rules.
+
+    :param target: The target configuration
+    :type target: dict
+    :param ha_services: The services in HA mode
+    :type ha_services: list
+    :raises ex.LoadError: If a service, component or type doesn't exist
+    :raises ex.CreationError: If the configuration breaks a rule
+    """
+
+    catalog = services.get_catalog()
+    available_types = services.get_available_types()
+
+    names = set()
+    ips = set()
+    counts = {}
+    for m in target['nodes']:
+        if m['name'] in names:
+            raise ex.CreationError('node', m['name'], 'name', m['name'],
+                                   'Exists')
+        names.add(m['name'])
+
+        if m['name'][0] in string.digits:
+            raise ex.CreationError('node', m['name'], 'name',
+                                   'A node name cannot start with a digit.',
+                                   'NameNotAllowed')
+
+        try:
+            ipaddress.ip_address(m['ip'])
+        except ValueError:
+            raise ex.CreationError('node', m['name'], 'IP', m['ip'],
+                                   'NotSupported')
+        if m['ip'] in ips:
+            raise ex.CreationError('node', m['name'], 'IP', m['ip'],
+                                   'Exists')
+        ips.add(m['ip'])
+
+        for t in m['types']:
+            if t not in available_types:
+                raise ex.LoadError('type', t, 'NotExist')
+        if 'ldap' in m['types'] and len(m['types']) > 1:
+            raise ex.CreationError('node', m['name'], 'type', 'ldap',
+                                   'LDAPNotCompatible')
+
+        for c in m['components']:
+            service = catalog['component_service'].get(c)
+            if not service:
+                raise ex.LoadError('component', c, 'NotExist')
+            if service not in target['services']:
+                raise ex.CreationError('cluster', target['cluster'],
+                                       'service', service, 'NotInstalled')
+            if m['components'].count(c) > 1:
+                raise ex.CreationError('node', m['name'], 'component', c,
+                                       'Installed')
+            counts[c] = counts.get(c, 0) + 1
+
+    for s in target['services']:
+        if s not in catalog['services']:
+            raise ex.LoadError('service', s, 'NotExist')
+        if target['services'].count(s) > 1:
+            raise ex.CreationError('cluster', target['cluster'], 'service',
+                                   s, 'Installed')
+
+    for s in target['services']:
+        # Like `add_component`, enough components switch a service in HA
+        ha = s in ha_services or any(
+            counts.get(c, 0) > catalog['number'][c]['default']
+            and catalog['number'][c]['ha'] > catalog['number'][c]['default']
+            for c in catalog['service_components'][s])
+        req = 'ha' if ha else 'default'
+
+        if ha and s not in ha_services:
+            to_remove = []
+            for c in catalog['service_components'][s]:
+                max_n = catalog['number'][c]['ha']
+                if max_n != -1 and counts.get(c, 0) > max_n:
+                    to_remove.append('{} {}'.format(counts[c] - max_n, c))
+            if to_remove:
+                raise ex.CreationError('service', s, 'components',
+                                       to_remove, 'TooManyHA')
+
+        for c in catalog['service_components'][s]:
+            max_number = catalog['number'][c][req]
+            if max_number != -1 and counts.get(c, 0) > max_number:
+                raise ex.CreationError('cluster', target['cluster'],
+                                       'components', c, 'MaxNumber')
+
+        missing_serv = [r for r in catalog['services'][s]['requirements']
+                        ['services'][req] if r not in target['services']]
+        if missing_serv:
+            raise ex.CreationError('service', s, 'services',
+                                   (' - %s' % r for r in missing_serv),
+                                   'ReqNotMet')
+
+        for r in catalog['services'][s]['requirements']['services'][req]:
+            missing = missing_components(r, counts)
+            if missing:
+                raise ex.CreationError(
+                    'service', s, 'components',
+                    [' - {} {}'.format(v, k) for k, v in missing.items()],
+                    'ReqNotMet')
+
+
+def missing_components(service, counts):
+    """Return the components missing for a service to be complete.
+
+    A service is complete if its components reach either the default or the
+    High Availability cardinalities.
+
+    :param service: Service name
+    :type service: str
+    :param counts: Number of instances of each component
+    :type counts: dict
+    :return: The missing components for the default mode, empty if complete
+    :rtype: dict
+    """
+
+    catalog = services.get_catalog()
+    missing = {
+        'default': {},
+        'ha': {}
+    }
+    for c in catalog['service_components'][service]:
+        for req in ['default', 'ha']:
+            req_number = catalog['number'][c][req]
+            if req_number == -1:
+                req_number = 1
+            if req_number > counts.get(c, 0):
+                missing[req][c] = req_number - counts.get(c, 0)
+
+    if not missing['default'] or not missing['ha']:
+        return {}
+    return missing['default']
+
+
+def diff_config(current, target):
+    """Compute the changes between the current and the target configurations.
+
+    :param current: The current configuration
+    :type current: dict
+    :param target: The target configuration
+    :type target: dict
+    :return: The nodes, services and components to add, remove or modify
+    :rtype: dict
+    """
+
+    current_nodes = {m['name']: m for m in current['nodes']}
+    target_nodes = {m['name']: m for m in target['nodes']}
+
+    diff = {
+        'domain': None,
+        'nodes': {'add': [], 'remove': [], 'edit': []},
+        'services': {'add': [], 'remove': []},
+        'components': {'add': [], 'remove': []}
+    }
+
+    if current.get('domain') != target['domain']:
+        diff['domain'] = [current.get('domain'), target['domain']]
+
+    for name, m in target_nodes.items():
+        old = current_nodes.get(name)
+        if not old:
+            diff['nodes']['add'].append(name)
+            old = {'components': []}
+        else:
+            changed = [[p, old[p], m[p]] for p in ['ip', 'ram', 'cpus',
+                                                   'types']
+                       if old[p] != m[p]]
+            if changed:
+                diff['nodes']['edit'].append([name, changed])
+        diff['components']['add'].extend(
+            [name, c] for c in m['components']
+            if c not in old['components'])
+
+    for name, old in current_nodes.items():
+        m = target_nodes.get(name)
+        if not m:
+            diff['nodes']['remove'].append(name)
+            m = {'components': []}
+        diff['components']['remove'].extend(
+            [name, c] for c in old['components']
+            if c not in m['components'])
+
+    diff['services']['add'] = [s for s in target['services']
+                               if s not in current['services']]
+    diff['services']['remove'] = [s for s in current['services']
+                                  if s not in target['services']]
+
+    return diff
+
+
+def is_empty(diff):
+    """Check if a diff returned by `diff_config` has no change.
+
+    :rtype: bool
+    """
+
+    return not diff['domain'] \
+        and not any(v for d in ['nodes', 'services', 'components']
+                    for v in diff[d].values())
+
+
+def apply_spec(spec, cluster=None, dry_run=False):
+    """Bring a cluster to the state described by a specification.
+
+    The whole target state is validated once and the cluster artifacts are
+    written once. The cluster is created if it doesn't exist. Only the
+    domain, nodes and services of an existing cluster are replaced.
+
+    :param spec: The specification
+    :type spec: dict
+    :param cluster: Cluster name, overrides the one of the spec
+    :type cluster: str, optional
+    :param dry_run: Only compute the changes, defaults to False
+    :type dry_run: bool, optional
+    :raises ex.LoadError: If the spec references unknown objects
+    :raises ex.CreationError: If the target state breaks a rule
+    :return: The changes applied (see `diff_config`)
+    :rtype: dict
+    """
+
+    target, ha_services = normalize_spec(spec, cluster)
+    validate_target(target, ha_services)
+
+    exists = checks.check_cluster(target['cluster'])
+    if exists:
+        ss.load_config(target['cluster'])
+        current = ss.svars
+    else:
+        current = {'domain': None, 'nodes': [], 'services': []}
+
+    diff = diff_config(current, target)
+    if dry_run or (exists and is_empty(diff)):
+        return diff
+
+    if not exists:
+        # Dumped once below, with the nodes and services of the spec
+        clusters.create_cluster(target['domain'], cluster=target['cluster'],
+                                dump=False)
+
+    # The other settings of the cluster (e.g. 'configurations') are kept
+    for key in ['domain', 'nodes', 'services']:
+        ss.svars[key] = target[key]
+    ss.reindex()
+    ss.dump_config(services.get_services_components_hosts())
+
+    return diff
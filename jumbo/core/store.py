@@ -0,0 +1,221 @@
+import contextlib
+import filecmp
+import hashlib
+import os
+import shutil
+import stat
+
+from jumbo.utils.settings import JUMBODIR, OS
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+STORE_DIR = JUMBODIR + '.store/'
+
+# File of a cluster directory with the store version it is linked to
+REF = '.store'
+
+# Files edited by the users: copied in the clusters instead of linked
+EDITABLE = ['versions.json']
+
+# Directories not published in the store
+IGNORED = ['__pycache__']
+
+versions = {}
+
+
+def list_files(root):
+    """List the files of a tree, skipping the `IGNORED` directories.
+
+    :param root: Root directory
+    :type root: str
+    :return: The paths relative to the root, sorted
+    :rtype: list
+    """
+
+    res = []
+    for path, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in IGNORED]
+        rel = os.path.relpath(path, root)
+        res.extend(os.path.normpath(os.path.join(rel, f)) for f in files)
+    return sorted(res)
+
+
+def data_version():
+    """Return the content hash of the packaged data directory (playbooks,
+    roles, modules...), computed once per process.
+
+    :rtype: str
+    """
+
+    if DATA_DIR not in versions:
+        digest = hashlib.sha1()
+        for rel in list_files(DATA_DIR):
+            digest.update(rel.replace(os.sep, '/').encode('utf-8') + b'\0')
+            with open(os.path.join(DATA_DIR, rel), 'rb') as df:
+                digest.update(hashlib.sha1(df.read()).digest())
+        versions[DATA_DIR] = digest.hexdigest()[:16]
+    return versions[DATA_DIR]
+
+
+def publish():
+    """Add the packaged data directory to the store if it isn't yet.
+
+    The version is built in a temporary directory and renamed, so that
+    concurrent Jumbo processes never see a partial version. The files of
+    the store are read-only: a cluster file modified in place would modify
+    all the clusters.
+
+    :return: The directory of the version in the store
+    :rtype: str
+    """
+
+    version_dir = STORE_DIR + data_version() + '/'
+    if os.path.isdir(version_dir):
+        return version_dir
+
+    tmp = STORE_DIR + '.tmp-%s-%d' % (data_version(), os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        for rel in list_files(DATA_DIR):
+            os.makedirs(os.path.dirname(os.path.join(tmp, rel)),
+                        exist_ok=True)
+            shutil.copy2(os.path.join(DATA_DIR, rel), os.path.join(tmp, rel))
+            if OS != 'Windows':
+                os.chmod(os.path.join(tmp, rel), stat.S_IMODE(
+                    os.stat(os.path.join(tmp, rel)).st_mode) & ~0o222)
+        os.rename(tmp, version_dir[:-1])
+    except OSError:
+        # Published by another process meanwhile
+        if not os.path.isdir(version_dir):
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return version_dir
+
+
+def link_file(src, dst):
+    """Hardlink a file, or copy it if the filesystem doesn't support it.
+
+    :param src: Source file
+    :type src: str
+    :param dst: Link path, replaced if it exists
+    :type dst: str
+    """
+
+    # Renaming a link over another link of the same file does nothing
+    if same_file(src, dst):
+        return
+
+    tmp = os.path.join(os.path.dirname(dst),
+                       '.%s.tmp-%d' % (os.path.basename(dst), os.getpid()))
+    with contextlib.suppress(OSError):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp)
+        if OS != 'Windows':
+            os.chmod(tmp, stat.S_IMODE(os.stat(tmp).st_mode) | 0o200)
+    os.replace(tmp, dst)
+
+
+def cluster_version(cluster):
+    """Return the store version a cluster is linked to.
+
+    :param cluster: Cluster name
+    :type cluster: str
+    :return: The version, None for the clusters with copied files
+    :rtype: str
+    """
+
+    try:
+        with open(JUMBODIR + cluster + '/' + REF, 'r') as rf:
+            return rf.read().strip() or None
+    except OSError:
+        return None
+
+
+def same_file(path, other):
+    try:
+        return os.path.samefile(path, other)
+    except OSError:
+        return False
+
+
+def link_cluster(cluster):
+    """Link the files of a cluster to the current version of the store.
+
+    The files of a new cluster are hardlinks to the store, except the
+    `EDITABLE` ones which are copied. When the cluster is linked to an
+    older version, only the files still linked to it are switched: the
+    files generated by Jumbo or modified by the user are kept. The files of
+    clusters created with copies are linked when they are identical.
+
+    :param cluster: Cluster name
+    :type cluster: str
+    :return: The paths of the files switched to the current version
+    :rtype: list
+    """
+
+    version_dir = publish()
+    cluster_dir = JUMBODIR + cluster + '/'
+    old = cluster_version(cluster)
+    old_dir = STORE_DIR + old + '/' if old else None
+    if old_dir == version_dir:
+        return []
+
+    switched = []
+    files = list_files(version_dir)
+    for rel in files:
+        src = os.path.join(version_dir, rel)
+        dst = os.path.join(cluster_dir, rel)
+        if os.path.lexists(dst):
+            if rel in EDITABLE:
+                continue
+            if not (old_dir and same_file(dst, old_dir + rel)) \
+                    and not filecmp.cmp(src, dst, shallow=False):
+                continue
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if rel in EDITABLE:
+            shutil.copyfile(src, dst)
+        else:
+            link_file(src, dst)
+        switched.append(rel)
+
+    # Files removed since the old version
+    if old_dir and os.path.isdir(old_dir):
+        for rel in set(list_files(old_dir)) - set(files):
+            dst = os.path.join(cluster_dir, rel)
+            if same_file(dst, old_dir + rel):
+                os.remove(dst)
+
+    with open(cluster_dir + REF, 'w') as rf:
+        rf.write(data_version() + '\n')
+
+    return switched
+
+
+def prune():
+    """Remove the store versions no cluster is linked to, except the
+    current one.
+
+    :return: The removed versions
+    :rtype: list
+    """
+
+    if not os.path.isdir(STORE_DIR):
+        return []
+
+    used = {data_version()}
+    for entry in os.scandir(JUMBODIR):
+        if entry.is_dir() and not entry.name.startswith('.'):
+            used.add(cluster_version(entry.name))
+
+    removed = []
+    for entry in os.scandir(STORE_DIR):
+        if entry.is_dir() and not entry.name.startswith('.') \
+                and entry.name not in used:
+            with contextlib.suppress(OSError):
+                shutil.rmtree(entry.path)
+                removed.append(entry.name)
+    return removed
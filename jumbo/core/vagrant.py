@@ -1,19 +1,33 @@
 from jumbo.utils.settings import JUMBODIR
 from jumbo.utils.checks import valid_cluster
-from jumbo.utils import session as ss
+from jumbo.utils import session as ss, exceptions as ex
 
+import socket
 import subprocess
+import threading
 import time
 import os
 
+from concurrent.futures import ThreadPoolExecutor
+
+# Maximum time to wait for the SSH port of a VM, in seconds
+SSH_TIMEOUT = 600
+
+print_lock = threading.Lock()
+
 
 @valid_cluster
 def cmd(cmd, *, cluster):
     """Run a command in the vagrantfile folder and print output
     """
 
+    from jumbo.core import profile
+
     ss.load_config(cluster)
     ss.dump_config()
+    if cmd[1] == 'up':
+        profile.start_run(cluster, ' '.join(c for c in cmd[1:]
+                                            if c != '--color'))
     try:
         res = subprocess.Popen(cmd,
                                cwd=os.path.join(JUMBODIR, cluster),
@@ -22,7 +36,10 @@ def cmd(cmd, *, cluster):
                                )
 
         for line in res.stdout:
-            print(line.decode('utf-8').rstrip())
+            line = line.decode('utf-8').rstrip()
+            profile.track_output(line)
+            print(line)
+        profile.end_node_phases()
 
         if cmd[1] == 'up':
             # Start services after a vagrant up
@@ -30,59 +47,168 @@ def cmd(cmd, *, cluster):
 
     except KeyboardInterrupt:
         res.kill()
+    finally:
+        profile.finish_run(ansible_host())
+
+
+@valid_cluster
+def parallel_up(workers, *, cluster):
+    """Start the VMs of a cluster concurrently, then start and provision the
+    Ansible host once all the other VMs are reachable over SSH.
+
+    :param workers: Maximum number of VMs started at the same time
+    :type workers: int
+    :param cluster: Cluster name
+    :type cluster: str
+    :raises ex.CreationError: If some VMs failed to start
+    """
+
+    from jumbo.core import profile
+
+    ss.load_config(cluster)
+    ss.dump_config()
+    profile.start_run(cluster, 'up --parallel %d' % workers)
+    try:
+        parallel_up_nodes(workers, cluster)
+    finally:
+        profile.finish_run(ansible_host())
+
+
+def parallel_up_nodes(workers, cluster):
+    nodes = ss.get_ordered_nodes()
+    ansible_hosts = [m for m in nodes if 'ansiblehost' in m['groups']]
+    others = [m for m in nodes if 'ansiblehost' not in m['groups']]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(lambda m: up_node(m, cluster), others))
+
+    failed = [m['name'] for m, ok in zip(others, results) if not ok]
+    if failed:
+        raise ex.CreationError('cluster', cluster, 'nodes', failed,
+                               'StartFailed')
+
+    for m in ansible_hosts:
+        if not up_node(m, cluster):
+            raise ex.CreationError('cluster', cluster, 'nodes', [m['name']],
+                                   'StartFailed')
+
+    start_services()
+
+
+def up_node(node, cluster):
+    """Start a VM and wait until it is reachable over SSH.
+
+    :param node: Node configuration
+    :type node: dict
+    :param cluster: Cluster name
+    :type cluster: str
+    :return: True if the VM is up
+    :rtype: bool
+    """
+
+    from jumbo.core import profile
+
+    res = subprocess.Popen(['vagrant', 'up', '--color',
+                            '%s_%s' % (node['name'], cluster)],
+                           cwd=os.path.join(JUMBODIR, cluster),
+                           stdout=subprocess.PIPE,
+                           stderr=subprocess.STDOUT)
+    try:
+        for line in res.stdout:
+            line = line.decode('utf-8').rstrip()
+            profile.track_output(line)
+            with print_lock:
+                print('[%s] %s' % (node['name'], line))
+        res.wait()
+    except KeyboardInterrupt:
+        res.kill()
+        raise
+    finally:
+        profile.end_node_phases(node['name'])
+
+    if res.returncode != 0:
+        return False
+    with profile.phase('wait ssh', node['name']):
+        return wait_ssh(node['ip'])
+
+
+def ansible_host():
+    """Return the name of the Ansible host of the session's cluster.
+
+    :rtype: str
+    """
+
+    for m in ss.svars['nodes']:
+        if 'ansiblehost' in m['groups']:
+            return m['name']
+    return None
+
+
+def wait_ssh(ip, port=22, timeout=SSH_TIMEOUT):
+    """Wait until the SSH port of a host accepts connections.
+
+    :param ip: Host IP address
+    :type ip: str
+    :param port: SSH port, defaults to 22
+    :type port: int, optional
+    :param timeout: Maximum time to wait in seconds, defaults to SSH_TIMEOUT
+    :type timeout: int, optional
+    :return: True if the host is reachable
+    :rtype: bool
+    """
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection((ip, port), timeout=5):
+                return True
+        except OSError:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(2)
 
 
 def start_services():
-    """Call Ambari API to start all services
-       until Ambari server accepts the request
+    """Call Ambari API to start all services once the Ambari agents are
+    registered, and follow the progress of the request.
+
+    :raises ex.CreationError: If Ambari rejects the start request
     """
-    max_retries = 20
+
+    from jumbo.core import ambari, profile
 
     ip = None
-    for node in ss.svars['nodes']:
-        for comp in node['components']:
-            if comp == 'AMBARI_SERVER':
-                ip = node['ip']
-                break
-
-    if ip:
-        cmd = ('curl -u admin:admin -H "X-Requested-By: ambari" '
-               '-X PUT '
-               '-d \'{\"RequestInfo\": '
-               '{\"context\":\"Start all services\"}, '
-               '\"Body\":{\"ServiceInfo\": '
-               '{\"state\":\"STARTED\"}}}\' ' +
-               ip + ':8080/api/v1/clusters/' +
-               ss.svars['domain'].replace('.', '') + '/services')
-
-        retries = 0
-        accepted = False
-        res = subprocess.Popen(cmd,
-                               shell=True,
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.STDOUT)
-        for line in res.stdout:
-            if "Accepted" in line.decode('utf-8').rstrip():
-                accepted = True
-                break
-
-        while not accepted and retries < max_retries:
-            print('Server is not up yet. Retrying to start services...')
-            time.sleep(5)
-            res = subprocess.Popen(cmd,
-                                   shell=True,
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.STDOUT)
-            for line in res.stdout:
-                if "Accepted" in line.decode('utf-8').rstrip():
-                    accepted = True
-                    break
-            retries += 1
-
-        if accepted:
-            print('Services are starting. View progression at '
-                  'http://%s:8080 (admin/admin)' % ip)
-        else:
-            print('Timeout. Wait longer and start again, or '
-                  'start services manually at '
+    for name in ss.get_component_hosts('AMBARI_SERVER'):
+        ip = ss.get_node(name)['ip']
+        break
+
+    if not ip:
+        return
+
+    agents = [ss.fqdn(m['name']) for m in ss.svars['nodes']
+              if 'ambariclient' in m['groups']]
+    conn = ambari.connect(ip)
+    try:
+        print('Waiting for the Ambari agents to register...')
+        with profile.phase('wait ambari agents'):
+            ambari.wait_agents(conn, agents)
+        href = ambari.start_all_services(
+            conn, ss.svars['domain'].replace('.', ''))
+        if not href:
+            print('Services are already started. View them at '
                   'http://%s:8080 (admin/admin)' % ip)
+            return
+
+        print('Services are starting. View progression at '
+              'http://%s:8080 (admin/admin)' % ip)
+        with profile.phase('start services'):
+            state = ambari.wait_request(
+                conn, href,
+                progress=lambda p: print('Starting services: %d%%' % p))
+        print('Start of the services: %s' % state)
+    except ambari.RetryError as e:
+        print('Timeout (%s). Wait longer and start again, or '
+              'start services manually at '
+              'http://%s:8080 (admin/admin)' % (e, ip))
+    finally:
+        conn.close()
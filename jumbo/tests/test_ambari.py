@@ -0,0 +1,110 @@
+import unittest
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from jumbo.core import ambari
+from jumbo.utils import exceptions as ex
+
+
+class FakeAmbari(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=None):
+        data = json.dumps(body).encode('utf-8') if body else b''
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        server.clients.add(self.client_address)
+        if self.path.startswith('/api/v1/hosts'):
+            server.polls += 1
+            hosts = ['m01.test.local'] if server.polls < 2 \
+                else ['m01.test.local', 'm02.test.local']
+            states = {'m02.test.local': 'UNHEALTHY',
+                      'm03.test.local': 'HEARTBEAT_LOST'}
+            self.reply(200, {'items': [{'Hosts': {
+                'host_name': h, 'host_state': states.get(h, 'HEALTHY')}}
+                for h in hosts + ['m03.test.local']]})
+        elif self.path.startswith('/api/v1/clusters/testlocal/requests/12'):
+            if not server.invalid:
+                # Not JSON, as answered by a proxy or a restarting server
+                server.invalid = True
+                self.send_response(200)
+                self.send_header('Content-Length', '5')
+                self.end_headers()
+                self.wfile.write(b'Error')
+                return
+            server.progress += 50
+            self.reply(200, {'Requests': {
+                'request_status': 'COMPLETED' if server.progress >= 100
+                else 'IN_PROGRESS',
+                'progress_percent': server.progress}})
+        else:
+            self.reply(404)
+
+    def do_PUT(self):
+        self.server.clients.add(self.client_address)
+        self.rfile.read(int(self.headers['Content-Length']))
+        if '/clusters/testlocal/' not in self.path:
+            self.reply(400, {'status': 400,
+                             'message': 'Cluster not found'})
+            return
+        self.reply(202, {
+            'href': 'http://%s:%d/api/v1/clusters/testlocal/requests/12'
+            % self.server.server_address,
+            'Requests': {'id': 12, 'status': 'Accepted'}})
+
+
+class TestAmbari(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FakeAmbari)
+        self.server.clients = set()
+        self.server.polls = 0
+        self.server.progress = 0
+        self.server.invalid = False
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.conn = ambari.connect(*self.server.server_address)
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_start_all_services(self):
+        print('Test "start_all_services"')
+        ambari.wait_agents(self.conn, ['m01.test.local', 'm02.test.local'],
+                           timeout=10)
+        href = ambari.start_all_services(self.conn, 'testlocal')
+        self.assertEqual('/api/v1/clusters/testlocal/requests/12', href)
+        progress = []
+        state = ambari.wait_request(self.conn, href, progress.append,
+                                    interval=0)
+        self.assertEqual('COMPLETED', state)
+        self.assertEqual([50, 100], progress)
+        # All the requests used the same connection
+        self.assertEqual(1, len(self.server.clients))
+
+    def test_start_rejected(self):
+        print('Test "start_rejected"')
+        with self.assertRaises(ex.CreationError) as cm:
+            ambari.start_all_services(self.conn, 'unknown')
+        self.assertIn('HTTP 400', cm.exception.message)
+        self.assertIn('Cluster not found', cm.exception.message)
+
+    def test_retry_timeout(self):
+        print('Test "retry_timeout"')
+        self.assertRaises(ambari.RetryError, ambari.wait_agents, self.conn,
+                          ['m03.test.local'], timeout=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import os
+import random
+import shutil
+import string
+import tempfile
+
+import yaml
+
+from jumbo.core import bake, clusters, nodes
+from jumbo.utils import session as ss, checks
+from jumbo.utils.settings import JUMBODIR
+
+
+class TestBake(unittest.TestCase):
+    def setUp(self):
+        self.c_name = 'unittest' + ''.join(random.choices(
+            string.ascii_letters + string.digits,
+            k=5))
+        self.m_name = 'test01'
+        self.registry = bake.REGISTRY
+        self.tmp = tempfile.mkdtemp()
+        bake.REGISTRY = self.tmp + '/boxes.json'
+        clusters.create_cluster(domain=None,
+                                cluster=self.c_name)
+        print('\n\nCluster "%s" created' % self.c_name)
+
+    def tearDown(self):
+        bake.REGISTRY = self.registry
+        if os.path.isfile(self.tmp + '/boxes.json'):
+            os.remove(self.tmp + '/boxes.json')
+        os.rmdir(self.tmp)
+        if checks.check_cluster(self.c_name):
+            clusters.delete_cluster(cluster=self.c_name)
+            print('Cluster deleted\n')
+
+    def test_node_layers(self):
+        print('Test "node_layers"')
+        self.assertEqual(['base'], bake.node_layers({'components': []}))
+        self.assertEqual(['base', 'ambari', 'pgsql'], bake.node_layers(
+            {'components': ['PSQL_SERVER', 'AMBARI_SERVER', 'HDFS_CLIENT']}))
+        self.assertNotEqual(bake.box_key(['base']),
+                            bake.box_key(['base', 'pgsql']))
+        self.assertEqual(bake.box_key(['base']), bake.box_key(['base']))
+
+    def test_vagrantfile_boxes(self):
+        print('Test "vagrantfile_boxes"')
+        nodes.add_node(self.m_name, '10.10.10.10', 1024, ['edge'],
+                       cluster=self.c_name)
+        vagrantfile = JUMBODIR + self.c_name + '/Vagrantfile'
+        with open(vagrantfile) as vf:
+            self.assertIn('node.vm.box = box\n', vf.read())
+
+        name = bake.box_name(['base'], bake.box_key(['base'], self.c_name))
+        bake.save_registry({name: {'layers': ['base']}})
+        ss.dump_config()
+        with open(vagrantfile) as vf:
+            self.assertIn('node.vm.box = "%s"\n' % name, vf.read())
+
+    def test_bake_playbook(self):
+        print('Test "bake_playbook"')
+        work_dir = bake.render_bake('jumbo-unittest', ['base', 'pgsql'],
+                                    self.c_name)
+        try:
+            with open(work_dir + 'bake.yml') as bf:
+                play = yaml.safe_load(bf)[0]
+        finally:
+            shutil.rmtree(work_dir)
+
+        version = play['vars']['services']['POSTGRESQL']['version']
+        names = [t['name'] for t in play['tasks']]
+        self.assertIn('Download and install ambari-agent', names)
+        self.assertIn('Install version %s' % version, names)
+        self.assertNotIn('Initiate database', names)
+        self.assertTrue(all('yum' in t or 'get_url' in t
+                            for t in play['tasks']))
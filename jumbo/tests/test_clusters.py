@@ -1,10 +1,12 @@
 import unittest
+import json
 import os
 import random
 import string
 
-from jumbo.core import clusters
-from jumbo.utils import session as ss, checks, exceptions as ex
+from jumbo.core import clusters, nodes, services
+from jumbo.utils import session as ss, checks, exceptions as ex, artifacts
+from jumbo.utils import versions as vs
 from jumbo.utils.settings import JUMBODIR
 
 
@@ -51,9 +53,151 @@ class TestClusters(unittest.TestCase):
                                 cluster=self.c_name)
         self.assertTrue(clusters.check_config(self.c_name))
 
+    def test_dump_config_incremental(self):
+        print('Test "dump_config_incremental"')
+        group_vars = (JUMBODIR + self.c_name +
+                      '/playbooks/inventory/group_vars/all')
+        mtime = os.stat(group_vars).st_mtime_ns
+        ss.dump_config()
+        self.assertEqual(mtime, os.stat(group_vars).st_mtime_ns)
+        ss.svars['domain'] = 'incremental.local'
+        ss.dump_config()
+        with open(group_vars, 'r') as gva:
+            self.assertIn('incremental.local', gva.read())
+
+    def test_dump_config_atomic(self):
+        print('Test "dump_config_atomic"')
+        cluster_dir = JUMBODIR + self.c_name + '/'
+        with open(cluster_dir + 'jumbo_config') as jc:
+            config = jc.read()
+        generation = artifacts.generation(self.c_name)
+
+        batch = artifacts.open_batch(self.c_name)
+        artifacts.write_artifact(batch, 'jumbo_config', '{}')
+        artifacts.abort_batch(batch)
+        with open(cluster_dir + 'jumbo_config') as jc:
+            self.assertEqual(config, jc.read())
+        self.assertFalse([f for f in os.listdir(cluster_dir)
+                          if '.tmp-' in f])
+
+        ss.svars['domain'] = 'atomic.local'
+        ss.dump_config()
+        self.assertEqual(generation + 1, artifacts.generation(self.c_name))
+
+    def test_write_artifact_stream(self):
+        print('Test "write_artifact_stream"')
+        cluster_dir = JUMBODIR + self.c_name + '/'
+        chunks = ['node%d\n' % i for i in range(100)]
+
+        batch = artifacts.open_batch(self.c_name)
+        self.assertTrue(artifacts.write_artifact(batch, 'streamed',
+                                                 iter(chunks)))
+        artifacts.commit_batch(batch)
+        with open(cluster_dir + 'streamed') as sf:
+            self.assertEqual(''.join(chunks), sf.read())
+
+        batch = artifacts.open_batch(self.c_name)
+        self.assertFalse(artifacts.write_artifact(batch, 'streamed',
+                                                  ''.join(chunks)))
+        self.assertFalse(artifacts.write_artifact(batch, 'streamed',
+                                                  iter(chunks)))
+        artifacts.commit_batch(batch)
+        self.assertFalse([f for f in os.listdir(cluster_dir)
+                          if '.tmp-' in f])
+
+    def test_inventory(self):
+        print('Test "inventory"')
+        nodes.add_node(self.m_name, '10.10.10.10', 1024, ['edge'],
+                       cluster=self.c_name)
+        services.add_service('ANSIBLE', cluster=self.c_name)
+        services.auto_assign('ANSIBLE', False, cluster=self.c_name)
+        with open(JUMBODIR + self.c_name + '/' + ss.HOSTS_PATH) as hf:
+            inventory = json.load(hf)['all']
+        self.assertEqual({self.m_name: {'ansible_host': '10.10.10.10',
+                                        'ansible_user': 'vagrant'}},
+                         inventory['hosts'])
+        self.assertEqual({self.m_name: None},
+                         inventory['children']['ansiblehost']['hosts'])
+        self.assertEqual({}, inventory['children']['ipaserver']['hosts'])
+
+    def test_transaction(self):
+        print('Test "transaction"')
+        with open(JUMBODIR + self.c_name + '/jumbo_config') as jc:
+            config = jc.read()
+
+        ss.begin()
+        nodes.add_node(self.m_name, '10.10.10.10', 1024, ['edge'],
+                       cluster=self.c_name)
+        with open(JUMBODIR + self.c_name + '/jumbo_config') as jc:
+            self.assertEqual(config, jc.read())
+        ss.rollback()
+        self.assertIsNone(ss.get_node(self.m_name))
+
+        ss.begin()
+        nodes.add_node(self.m_name, '10.10.10.10', 1024, ['edge'],
+                       cluster=self.c_name)
+        self.assertTrue(ss.commit())
+        ss.clear()
+        ss.load_config(self.c_name)
+        self.assertIsNotNone(ss.get_node(self.m_name))
+
+    def test_run_script_failure(self):
+        print('Test "run_script_failure"')
+        from click.testing import CliRunner
+        from jumbo.cli.main import jumbo
+
+        # listcomponents without node reports the error with click.secho
+        res = CliRunner().invoke(jumbo, ['run', '-c', self.c_name, '-'],
+                                 input='addnode %s -t edge -i 10.10.10.10 '
+                                 '-r 1024\nlistcomponents\n' % self.m_name)
+        self.assertEqual(1, res.exit_code)
+        self.assertIn('Line 2', res.output)
+        ss.clear()
+        ss.load_config(self.c_name)
+        self.assertIsNone(ss.get_node(self.m_name))
+
+    def test_versions_file_not_rewritten(self):
+        print('Test "versions_file_not_rewritten"')
+        ss.load_config(self.c_name)
+        versions_file = JUMBODIR + 'versions.json'
+        mtime = os.stat(versions_file).st_mtime_ns
+        ss.load_config(self.c_name)
+        self.assertEqual(mtime, os.stat(versions_file).st_mtime_ns)
+
+    def test_versions_cache_namespace(self):
+        print('Test "versions_cache_namespace"')
+        self.assertNotEqual(vs.resolved_cache_path(None),
+                            vs.resolved_cache_path('global'))
+
     def test_list_clusters(self):
         print('Test "list_clusters"')
-        self.assertIn(ss.svars, clusters.list_clusters())
+        summaries, _ = clusters.summarize_clusters()
+        self.assertIn(self.c_name, [c['cluster'] for c in summaries])
+
+    def test_summarize_clusters(self):
+        print('Test "summarize_clusters"')
+        nodes.add_node(self.m_name, '10.10.10.10', 1024, ['edge'],
+                       cluster=self.c_name)
+        summary = {'cluster': self.c_name, 'domain': ss.svars['domain'],
+                   'nodes': 1, 'services': []}
+        self.assertEqual(summary, {
+            k: v for k, v in clusters.load_summary_index()[self.c_name]
+            .items() if k != 'stat'})
+
+        # Changed outside of Jumbo: parsed again
+        ss.svars['domain'] = 'other.local'
+        with open(JUMBODIR + self.c_name + '/jumbo_config', 'w') as cfg:
+            cfg.write(json.dumps(ss.svars) + '\n')
+        broken = JUMBODIR + self.c_name + 'broken'
+        os.mkdir(broken)
+        try:
+            summaries, errors = clusters.summarize_clusters()
+        finally:
+            os.rmdir(broken)
+        self.assertIn(dict(summary, domain='other.local'), summaries)
+        self.assertEqual('NoConfFile', errors[self.c_name + 'broken'])
+        self.assertEqual('other.local',
+                         clusters.load_summary_index()[self.c_name]['domain'])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,119 @@
+import unittest
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from jumbo.core import mirror
+
+
+class TestMirror(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        with open(os.path.join(self.root, 'package.rpm'), 'w') as pf:
+            pf.write('rpm')
+        with open(os.path.join(self.root, 'test.repo'), 'w') as rf:
+            rf.write('baseurl=http://example.com/repo/\n')
+
+        root = self.root
+        hits = self.hits = []
+
+        class Upstream(SimpleHTTPRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=root, **kwargs)
+
+            def do_GET(self):
+                hits.append(self.path)
+                # Let the concurrent requests miss the cache together
+                time.sleep(0.2)
+                super().do_GET()
+
+            def log_message(self, *args):
+                pass
+
+        mirror.allowed_hosts.add('127.0.0.1')
+        handler = mirror.mirror_handler()
+        handler.log_message = lambda *args: None
+        self.servers = [ThreadingHTTPServer(('127.0.0.1', 0), Upstream),
+                        ThreadingHTTPServer(('127.0.0.1', 0), handler)]
+        for server in self.servers:
+            threading.Thread(target=server.serve_forever,
+                             daemon=True).start()
+        self.upstream = 'http://127.0.0.1:%d' % \
+            self.servers[0].server_address[1]
+        self.base = 'http://127.0.0.1:%d' % self.servers[1].server_address[1]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(self.root)
+        mirror.allowed_hosts.discard('127.0.0.1')
+        shutil.rmtree(os.path.dirname(mirror.cache_path(self.upstream +
+                                                        '/package.rpm')),
+                      ignore_errors=True)
+
+    def test_mirror_cache(self):
+        print('Test "mirror_cache"')
+        url = mirror.mirror_url(self.upstream + '/package.rpm', self.base)
+        for _ in range(2):
+            with urllib.request.urlopen(url) as res:
+                self.assertEqual(b'rpm', res.read())
+        self.assertEqual(['/package.rpm'], self.hits)
+
+    def test_mirror_single_flight(self):
+        print('Test "mirror_single_flight"')
+        url = mirror.mirror_url(self.upstream + '/package.rpm', self.base)
+        bodies = []
+
+        def get():
+            with urllib.request.urlopen(url) as res:
+                bodies.append(res.read())
+
+        threads = [threading.Thread(target=get) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([b'rpm'] * 5, bodies)
+        self.assertEqual(['/package.rpm'], self.hits)
+        self.assertEqual({}, mirror.fetch_locks)
+
+    def test_mirror_repo_file(self):
+        print('Test "mirror_repo_file"')
+        url = mirror.mirror_url(self.upstream + '/test.repo', self.base)
+        with urllib.request.urlopen(url) as res:
+            self.assertEqual('baseurl=%s/http/example.com/repo/\n'
+                             % self.base, res.read().decode('utf-8'))
+
+    def test_mirror_forbidden(self):
+        print('Test "mirror_forbidden"')
+        url = mirror.mirror_url('http://example.invalid/package.rpm',
+                                self.base)
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            urllib.request.urlopen(url)
+        self.assertEqual(403, cm.exception.code)
+
+        with socket.create_connection(self.servers[1].server_address) as s:
+            s.sendall(b'CONNECT example.invalid:443 HTTP/1.1\r\n\r\n')
+            self.assertIn(b' 403 ', s.recv(1024).split(b'\r\n')[0])
+
+    def test_mirror_listen(self):
+        print('Test "mirror_listen"')
+        self.assertTrue(mirror.can_bind('127.0.0.1'))
+        # TEST-NET-1 address, not configured on the host
+        self.assertFalse(mirror.can_bind('192.0.2.1'))
+        self.assertEqual('10.10.10.1', mirror.listen_address(
+            mirror.DEFAULT_CONF, [{'ip': '10.10.10.11'}]))
+        self.assertEqual('127.0.0.1',
+                         mirror.listen_address(mirror.DEFAULT_CONF, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
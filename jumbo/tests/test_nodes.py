@@ -62,6 +62,22 @@ class TestMachines(unittest.TestCase):
         self.assertFalse(nodes.check_node(cluster=self.c_name,
                                           node=self.m_name))
 
+    def test_edit_node_ip(self):
+        print('Test "edit_node_ip"')
+        nodes.add_node(name=self.m_name,
+                       ip='10.10.10.11',
+                       ram=2048,
+                       types=['master'],
+                       cpus=1,
+                       cluster=self.c_name)
+        nodes.edit_node(name=self.m_name,
+                        ip='10.10.10.12',
+                        cluster=self.c_name)
+
+        self.assertFalse(nodes.check_ip('10.10.10.11', cluster=self.c_name))
+        self.assertEqual(nodes.check_ip('10.10.10.12', cluster=self.c_name),
+                         self.m_name)
+
     def test_add_node_same_name(self):
         print('Test add_node_same_ip')
         nodes.add_node(name=self.m_name,
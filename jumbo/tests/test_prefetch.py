@@ -0,0 +1,128 @@
+import unittest
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from jumbo.core import prefetch
+
+REPOMD = '''<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="http://linux.duke.edu/metadata/repo">
+  <data type="primary">
+    <checksum type="sha256">{}</checksum>
+    <location href="repodata/primary.xml.gz"/>
+  </data>
+</repomd>
+'''
+
+PRIMARY = '''<?xml version="1.0" encoding="UTF-8"?>
+<metadata xmlns="http://linux.duke.edu/metadata/common" packages="1">
+  <package type="rpm">
+    <checksum type="sha256">{}</checksum>
+    <location href="Packages/test.rpm"/>
+  </package>
+</metadata>
+'''
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        rpm = b'rpm content' * 100
+        primary = gzip.compress(PRIMARY.format(
+            hashlib.sha256(rpm).hexdigest()).encode('utf-8'))
+        self.files = {
+            '/repo/Packages/test.rpm': rpm,
+            '/repo/repodata/primary.xml.gz': primary,
+            '/repo/repodata/repomd.xml': REPOMD.format(
+                hashlib.sha256(primary).hexdigest()).encode('utf-8')
+        }
+        files = self.files
+        ranges = self.ranges = []
+
+        class Upstream(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                data = files.get(self.path)
+                if data is None:
+                    self.send_error(404)
+                    return
+                status = 200
+                if self.headers['Range']:
+                    start = int(self.headers['Range'][6:-1])
+                    ranges.append(start)
+                    data = data[start:]
+                    status = 206
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = HTTPServer(('127.0.0.1', 0), Upstream)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.base = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.blobs_dir = prefetch.BLOBS_DIR
+        prefetch.BLOBS_DIR = tempfile.mkdtemp() + '/'
+        prefetch.PARTIAL_DIR = prefetch.BLOBS_DIR + 'partial/'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(prefetch.BLOBS_DIR)
+        prefetch.BLOBS_DIR = self.blobs_dir
+        prefetch.PARTIAL_DIR = self.blobs_dir + 'partial/'
+
+    def test_download_resume(self):
+        print('Test "download_resume"')
+        url = self.base + '/repo/Packages/test.rpm'
+        rpm = self.files['/repo/Packages/test.rpm']
+        os.makedirs(prefetch.PARTIAL_DIR)
+        partial = prefetch.PARTIAL_DIR + hashlib.sha1(
+            url.encode('utf-8')).hexdigest()
+        with open(partial, 'wb') as pf:
+            pf.write(rpm[:100])
+
+        index = {}
+        path = prefetch.download(url, index,
+                                 hashlib.sha256(rpm).hexdigest())
+        self.assertEqual([100], self.ranges)
+        with open(path, 'rb') as bf:
+            self.assertEqual(rpm, bf.read())
+        self.assertEqual(path, prefetch.lookup(url, index))
+
+    def test_download_checksum(self):
+        print('Test "download_checksum"')
+        self.assertRaises(IOError, prefetch.download,
+                          self.base + '/repo/Packages/test.rpm', {}, '0' * 64)
+
+    def test_repo_packages(self):
+        print('Test "repo_packages"')
+        files = prefetch.repo_packages(self.base + '/repo', {})
+        self.assertEqual([self.base + '/repo/repodata/primary.xml.gz',
+                          self.base + '/repo/Packages/test.rpm'],
+                         [f[0] for f in files])
+
+    def test_resources_urls(self):
+        print('Test "resources_urls"')
+        self.assertFalse(prefetch.is_file_url(
+            'http://public-repo-1.hortonworks.com/HDP/centos7/2.x/updates/'
+            '2.6.4.0'))
+        self.assertFalse(prefetch.is_file_url(self.base + '/repo/'))
+        self.assertTrue(prefetch.is_file_url(
+            self.base + '/ambari/2.6.2.2/ambari.repo'))
+        self.assertTrue(prefetch.is_file_url(
+            self.base + '/download/postgresql-42.2.1.jar'))
+
+        files, repos = prefetch.resources_urls()
+        self.assertTrue(all(prefetch.is_file_url(u) for u in files))
+        self.assertTrue([u for u in repos if '/HDP/' in u])
+
+
+if __name__ == '__main__':
+    unittest.main()
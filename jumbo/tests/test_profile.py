@@ -0,0 +1,71 @@
+import unittest
+import random
+import string
+
+from jumbo.core import clusters, profile
+from jumbo.utils import checks
+
+
+class TestProfile(unittest.TestCase):
+    def setUp(self):
+        self.c_name = 'unittest' + ''.join(random.choices(
+            string.ascii_letters + string.digits,
+            k=5))
+        clusters.create_cluster(domain=None,
+                                cluster=self.c_name)
+        print('\n\nCluster "%s" created' % self.c_name)
+
+    def tearDown(self):
+        if checks.check_cluster(self.c_name):
+            clusters.delete_cluster(cluster=self.c_name)
+            print('Cluster deleted\n')
+
+    def test_vagrant_phases(self):
+        print('Test "vagrant_phases"')
+        profile.start_run(self.c_name, 'up')
+        for line in ['Bringing machine \'m1_%s\' up' % self.c_name,
+                     '==> m1_%s: Importing base box' % self.c_name,
+                     '\x1b[0m==> m1_%s: Running provisioner: Import '
+                     'playbook (file)...' % self.c_name,
+                     '==> m1_%s: Running provisioner: Install ansible and '
+                     'run playbook (ansible_local)...' % self.c_name]:
+            profile.track_output(line)
+        with profile.phase('start services'):
+            pass
+        path = profile.finish_run()
+
+        self.assertIsNone(profile.current_run)
+        self.assertEqual([path], profile.list_runs(self.c_name))
+        run = profile.load_run(path)
+        self.assertEqual([('boot', 'm1'),
+                          ('provision: Import playbook', 'm1'),
+                          ('provision: Install ansible and run playbook',
+                           'm1'),
+                          ('start services', None)],
+                         [(p['name'], p['node']) for p in run['phases']])
+        self.assertTrue(all(p['duration'] is not None
+                            for p in run['phases']))
+
+    def test_summarize_compare(self):
+        print('Test "summarize_compare"')
+        run = {'start': 0, 'end': 100, 'phases': [], 'tasks': [
+            {'play': 'init', 'role': None, 'task': 'yum', 'host': 'm1',
+             'status': 'changed', 'start': 10, 'duration': 30},
+            {'play': 'init', 'role': None, 'task': 'yum', 'host': 'm2',
+             'status': 'changed', 'start': 12, 'duration': 40},
+            {'play': 'ambari', 'role': 'ambariserver', 'task': 'setup',
+             'host': 'm1', 'status': 'ok', 'start': 60, 'duration': 5}]}
+        summary = profile.summarize(run, top=2)
+        self.assertEqual(100, summary['total'])
+        self.assertEqual([40, 30], [t['duration'] for t in summary['tasks']])
+        self.assertEqual([('m2', 40), ('m1', 35)], summary['nodes'])
+        self.assertEqual([('init', 42), ('ambari', 5)], summary['plays'])
+
+        faster = dict(run, end=80, tasks=run['tasks'][2:])
+        self.assertEqual([('total', 100, 80), ('play: ambari', 5, 5),
+                          ('play: init', 42, None)],
+                         profile.compare(run, faster))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,12 @@
 import unittest
+import json
+import pickle
 import random
 import string
 
-from jumbo.core import clusters, nodes, services
+from jumbo.core import clusters, nodes, placement, services
 from jumbo.utils import session as ss, exceptions as ex
+from jumbo.utils.settings import JUMBODIR
 
 
 class TestServices(unittest.TestCase):
@@ -12,7 +15,7 @@ class TestServices(unittest.TestCase):
             string.ascii_letters + string.digits,
             k=5))
         self.m_names = ['master', 'master',
-                        'sidemaster_edge', 'worker', 'ldap']
+                        'sidemaster_edge', 'edge', 'worker', 'ldap']
         clusters.create_cluster(domain=None,
                                 cluster=self.c_name)
         print('\n\nCluster "%s" created' % self.c_name)
@@ -30,6 +33,52 @@ class TestServices(unittest.TestCase):
         clusters.delete_cluster(cluster=self.c_name)
         print('Cluster deleted')
 
+    def test_catalog(self):
+        print('Test "catalog"')
+        catalog = services.compile_catalog(services.load_services_conf())
+        for s in services.config['services']:
+            for c in s['components']:
+                self.assertEqual(catalog['component_service'][c['name']],
+                                 s['name'])
+            for req_s in s['requirements']['services']['default']:
+                self.assertIn(s['name'],
+                              catalog['dependents']['default'][req_s])
+            for dep in catalog['closure']['default'][s['name']]:
+                self.assertLess(catalog['order'].index(dep),
+                                catalog['order'].index(s['name']))
+
+    def test_catalog_stale_cache(self):
+        print('Test "catalog_stale_cache"')
+        with open(services.SERVICES_CONF, 'rb') as cfg:
+            cache = services.catalog_cache_path(cfg.read())
+        # Pickle of a class that doesn't exist anymore
+        with open(cache, 'wb') as cf:
+            cf.write(b'cjumbo.core.services\nRemovedClass\n.')
+        config, catalog = services.load_catalog()
+        self.assertEqual(services.compile_catalog(config), catalog)
+        with open(cache, 'rb') as cf:
+            self.assertEqual((config, catalog), pickle.load(cf))
+
+    def test_catalog_cycle(self):
+        print('Test "catalog_cycle"')
+
+        def service(name, default, ha=[]):
+            return {'name': name, 'components': [], 'requirements': {
+                'services': {'default': default, 'ha': ha}}}
+
+        conf = {'services': [service('A', []), service('B', ['A']),
+                             service('C', ['B'])]}
+        catalog = services.compile_catalog(conf)
+        self.assertEqual(['A', 'B'], catalog['closure']['default']['C'])
+        self.assertEqual(['A', 'B', 'C'], catalog['order'])
+
+        conf['services'][0] = service('A', [], ['C'])
+        with self.assertRaises(ex.LoadError):
+            services.compile_catalog(conf)
+        conf['services'][0] = service('A', ['C'])
+        with self.assertRaises(ex.LoadError):
+            services.compile_catalog(conf)
+
     def test_add_indep_services(self):
         print('Test "add_indep_services"')
         indep_serv = [s for s in services.config['services']
@@ -108,6 +157,123 @@ class TestServices(unittest.TestCase):
         for s in services.config['services']:
             self.assertFalse(services.check_service_cluster(name=s['name']))
 
+    def test_placement(self):
+        print('Test "placement"')
+        placement.clear()
+        self.recursive_add('ZOOKEEPER', False)
+        self.recursive_add('HDFS', True)
+        self.assertEqual(['master0', 'master1'],
+                         ss.get_component_hosts('NAMENODE'))
+        self.assertEqual(['master0'],
+                         ss.get_component_hosts('ZOOKEEPER_SERVER'))
+        self.recursive_add('YARN', False)
+        # master0 has less free RAM because of the ZooKeeper server
+        self.assertEqual(['master1'],
+                         ss.get_component_hosts('RESOURCEMANAGER'))
+        decision = [d for d in placement.decisions
+                    if d['component'] == 'RESOURCEMANAGER'][0]
+        self.assertIn('master0', decision['reason'])
+
+    def test_services_view(self):
+        print('Test "services_view"')
+
+        def rebuild():
+            return {s: {c: ss.get_component_hosts(c)
+                        for c in services.get_service_components(s)
+                        if ss.get_component_hosts(c)}
+                    for s in ss.svars['services']}
+
+        def as_lists(view):
+            return {s: {c: list(h) for c, h in comps.items()}
+                    for s, comps in view.items()}
+
+        self.recursive_add('ZOOKEEPER', False)
+        self.recursive_add('HDFS', True)
+        services.remove_component('DATANODE', node='worker4',
+                                  cluster=self.c_name)
+        services.add_component('DATANODE', node='edge3',
+                               cluster=self.c_name)
+        view = services.get_services_components_hosts()
+        self.assertEqual(rebuild(), as_lists(view))
+        self.assertEqual(list(rebuild()['HDFS']), list(view['HDFS']))
+
+        services.remove_service('HDFS', cluster=self.c_name)
+        self.assertNotIn('HDFS', services.get_services_components_hosts())
+        ss.load_config(self.c_name)
+        self.assertEqual(rebuild(), as_lists(
+            services.get_services_components_hosts()))
+        with self.assertRaises(TypeError):
+            services.get_services_components_hosts()['HDFS'] = {}
+
+    def test_list_cluster_components(self):
+        print('Test "list_cluster_components"')
+        self.recursive_add('ZOOKEEPER', False)
+        nodes_components = services.list_cluster_components(
+            cluster=self.c_name)
+        self.assertEqual([m['name'] for m in ss.svars['nodes']],
+                         list(nodes_components))
+        for m in ss.svars['nodes']:
+            self.assertEqual(m['components'],
+                             list(nodes_components[m['name']]))
+            for c, desc in nodes_components[m['name']].items():
+                service = services.check_component(c)
+                self.assertEqual({'service': service,
+                                  'abbr': services.get_abbr(c, service)},
+                                 desc)
+
+    def test_blueprint_conf(self):
+        print('Test "blueprint_conf"')
+        ss.clear_bp()
+        ss.bp_create_conf_section('core-site')
+        ss.bp_set_conf('core-site', {'a': '1', 'b': '1'}, 'template')
+        ss.bp_create_conf_section('core-site')
+        ss.bp_set_conf_prop('core-site', 'a', '2', 'user')
+        ss.bp_set_conf('core-site', {'a': '3', 'b': '3'})
+        self.assertFalse(ss.bp_set_conf_prop('hdfs-site', 'c', '1'))
+        self.assertEqual([{'core-site': {'properties': {'a': '2', 'b': '3'}}}],
+                         ss.serialize_blueprint()['configurations'])
+
+        self.recursive_add('ZOOKEEPER', False)
+        self.recursive_add('HDFS', False)
+        ss.svars['configurations'] = {
+            'core-site': {'fs.trash.interval': '60'},
+            'hdfs-site': {'dfs.replication': '2'}
+        }
+        ss.dump_config(services.get_services_components_hosts())
+        with open(JUMBODIR + self.c_name + '/' + ss.BLUEPRINT_PATH) as bf:
+            conf = {k: v['properties'] for c in json.load(bf)['configurations']
+                    for k, v in c.items()}
+        self.assertEqual('60', conf['core-site']['fs.trash.interval'])
+        self.assertEqual('2', conf['hdfs-site']['dfs.replication'])
+        self.assertIn('dfs.namenode.http-address', conf['hdfs-site'])
+
+    def test_blueprint_hostgroups(self):
+        print('Test "blueprint_hostgroups"')
+        nodes.add_node(name='worker6', ip='10.10.10.17', ram=2048,
+                       types=['worker'], cpus=1, cluster=self.c_name)
+        self.recursive_add('ZOOKEEPER', False)
+        self.recursive_add('HDFS', False)
+        cluster_dir = JUMBODIR + self.c_name + '/'
+        with open(cluster_dir + ss.BLUEPRINT_PATH) as bf:
+            host_groups = json.load(bf)['host_groups']
+        with open(cluster_dir + ss.CLUSTER_PATH) as cf:
+            cluster_groups = json.load(cf)['host_groups']
+
+        workers = [hg for hg in cluster_groups
+                   if len(hg['hosts']) == 2][0]
+        self.assertEqual([{'fqdn': ss.fqdn('worker4')},
+                          {'fqdn': ss.fqdn('worker6')}], workers['hosts'])
+        self.assertEqual([hg['name'] for hg in host_groups],
+                         [hg['name'] for hg in cluster_groups])
+        for hg, cg in zip(host_groups, cluster_groups):
+            self.assertEqual(str(len(cg['hosts'])), hg['cardinality'])
+            for h in cg['hosts']:
+                self.assertEqual(
+                    sorted(c['name'] for c in hg['components']),
+                    sorted(c for c in ss.get_node(
+                        h['fqdn'].split('.')[0])['components']
+                        if ss.blueprint_component(c)))
+
     def recursive_add(self, service, ha):
         if not services.check_service_cluster(service):
             m_serv, _ = services.check_service_req_service(service, ha)
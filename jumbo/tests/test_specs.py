@@ -0,0 +1,123 @@
+import unittest
+import json
+import random
+import string
+import tempfile
+
+from jumbo.core import clusters, specs
+from jumbo.utils import session as ss, checks, exceptions as ex
+
+
+class TestSpecs(unittest.TestCase):
+    def setUp(self):
+        self.c_name = 'unittest' + ''.join(random.choices(
+            string.ascii_letters + string.digits,
+            k=5))
+        self.spec = {
+            'cluster': self.c_name,
+            'nodes': [
+                {
+                    'name': 'edge01',
+                    'ip': '10.10.10.10',
+                    'ram': 1024,
+                    'types': ['edge'],
+                    'components': ['ANSIBLE_CLIENT']
+                },
+                {
+                    'name': 'sidemaster01',
+                    'ip': '10.10.10.11',
+                    'ram': 2048,
+                    'types': ['sidemaster'],
+                    'components': ['PSQL_SERVER', 'AMBARI_SERVER']
+                }
+            ],
+            'services': ['ANSIBLE', 'POSTGRESQL', {'name': 'AMBARI'}]
+        }
+
+    def tearDown(self):
+        if checks.check_cluster(self.c_name):
+            clusters.delete_cluster(cluster=self.c_name)
+            print('Cluster deleted\n')
+
+    def test_apply_spec(self):
+        print('Test "apply_spec"')
+        diff = specs.apply_spec(self.spec)
+        self.assertTrue(checks.check_cluster(self.c_name))
+        self.assertEqual(['edge01', 'sidemaster01'], diff['nodes']['add'])
+        self.assertEqual(['sidemaster01'],
+                         ss.get_component_hosts('AMBARI_SERVER'))
+
+        self.spec['nodes'][1]['ram'] = 4096
+        self.spec['nodes'].append({
+            'name': 'worker01',
+            'ip': '10.10.10.12',
+            'ram': 2048,
+            'types': ['worker']
+        })
+        diff = specs.apply_spec(self.spec)
+        self.assertEqual(['worker01'], diff['nodes']['add'])
+        self.assertEqual([['sidemaster01', [['ram', 2048, 4096]]]],
+                         diff['nodes']['edit'])
+
+        ss.clear()
+        ss.load_config(self.c_name)
+        self.assertEqual(4096, ss.get_node('sidemaster01')['ram'])
+        self.assertTrue(specs.is_empty(specs.apply_spec(self.spec)))
+
+    def test_apply_spec_keeps_configurations(self):
+        print('Test "apply_spec_keeps_configurations"')
+        specs.apply_spec(self.spec)
+        configurations = {'core-site': {'fs.trash.interval': '60'}}
+        ss.svars['configurations'] = configurations
+        ss.dump_config()
+
+        self.spec['nodes'][1]['ram'] = 4096
+        specs.apply_spec(self.spec)
+        ss.clear()
+        ss.load_config(self.c_name)
+        self.assertEqual(4096, ss.get_node('sidemaster01')['ram'])
+        self.assertEqual(configurations, ss.svars['configurations'])
+
+    def test_apply_spec_invalid(self):
+        print('Test "apply_spec_invalid"')
+        self.spec['services'].remove('POSTGRESQL')
+        self.spec['nodes'][1]['components'].remove('PSQL_SERVER')
+        self.assertRaises(ex.CreationError, specs.apply_spec, self.spec)
+        self.assertFalse(checks.check_cluster(self.c_name))
+
+    def test_apply_spec_malformed(self):
+        print('Test "apply_spec_malformed"')
+        del self.spec['nodes'][0]['ram']
+        self.assertRaises(ex.LoadError, specs.apply_spec, self.spec)
+        self.spec['nodes'][0]['ram'] = '1024'
+        self.assertRaises(ex.LoadError, specs.apply_spec, self.spec)
+        self.spec['nodes'][0] = 'edge01'
+        self.assertRaises(ex.LoadError, specs.apply_spec, self.spec)
+        self.spec['nodes'] = {'edge01': {}}
+        self.assertRaises(ex.LoadError, specs.apply_spec, self.spec)
+        self.spec['nodes'] = []
+        self.spec['services'][2] = {'ha': True}
+        self.assertRaises(ex.LoadError, specs.apply_spec, self.spec)
+        self.assertFalse(checks.check_cluster(self.c_name))
+
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as sf:
+            json.dump({'cluster': self.c_name, 'nodes': [{'name': 'm'}]},
+                      sf)
+            sf.flush()
+            with self.assertRaises(ex.LoadError) as e:
+                specs.load_spec(sf.name)
+            self.assertIn('"ip"', e.exception.message)
+
+    def test_apply_spec_too_many_ha(self):
+        print('Test "apply_spec_too_many_ha"')
+        self.spec['services'].append('HDFS')
+        self.spec['nodes'][0]['components'].append('NAMENODE')
+        self.spec['nodes'][1]['components'].extend(['NAMENODE',
+                                                    'SECONDARY_NAMENODE'])
+        with self.assertRaises(ex.CreationError) as e:
+            specs.apply_spec(self.spec)
+        self.assertEqual('TooManyHA', e.exception.type)
+
+
+if __name__ == '__main__':
+    unittest.main()
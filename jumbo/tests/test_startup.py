@@ -0,0 +1,37 @@
+import unittest
+import subprocess
+import sys
+
+
+class TestStartup(unittest.TestCase):
+    def test_lazy_imports(self):
+        print('Test "lazy_imports"')
+        heavy = ['yaml', 'jinja2', 'prettytable', 'click_shell']
+        out = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, jumbo.cli.main\n'
+            'print(",".join(m for m in %r if m in sys.modules))' % heavy])
+        self.assertEqual(out.decode('utf-8').strip(), '')
+
+    def test_services_conf_lazy(self):
+        print('Test "services_conf_lazy"')
+        out = subprocess.check_output([
+            sys.executable, '-c',
+            'import jumbo.cli.main\n'
+            'from jumbo.core import services\n'
+            'print("catalog" in vars(services))'])
+        self.assertEqual(out.decode('utf-8').strip(), 'False')
+
+    def test_types_help(self):
+        print('Test "types_help"')
+        from click.testing import CliRunner
+        from jumbo.cli.main import jumbo
+        from jumbo.core import services
+
+        res = CliRunner().invoke(jumbo, ['addnode', '--help'])
+        self.assertIn('[%s]' % '|'.join(services.get_available_types()),
+                      res.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import os
+import random
+import shutil
+import string
+
+from jumbo.core import clusters, store
+from jumbo.utils import checks
+from jumbo.utils.settings import JUMBODIR
+
+
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.c_name = 'unittest' + ''.join(random.choices(
+            string.ascii_letters + string.digits,
+            k=5))
+        clusters.create_cluster(domain=None,
+                                cluster=self.c_name)
+        self.c_dir = JUMBODIR + self.c_name + '/'
+        print('\n\nCluster "%s" created' % self.c_name)
+
+    def tearDown(self):
+        if checks.check_cluster(self.c_name):
+            clusters.delete_cluster(cluster=self.c_name)
+            print('Cluster deleted\n')
+
+    def test_linked_cluster(self):
+        print('Test "linked_cluster"')
+        version_dir = store.publish()
+        self.assertEqual(store.data_version(),
+                         store.cluster_version(self.c_name))
+        self.assertTrue(os.path.samefile(
+            version_dir + 'playbooks/ambari.yml',
+            self.c_dir + 'playbooks/ambari.yml'))
+        self.assertFalse(os.path.samefile(version_dir + 'versions.json',
+                                          self.c_dir + 'versions.json'))
+        self.assertEqual([], store.link_cluster(self.c_name))
+
+    def test_upgrade_cluster(self):
+        print('Test "upgrade_cluster"')
+        # Make the cluster linked to an older version of the store
+        old_dir = store.STORE_DIR + 'unittest-old/'
+        shutil.rmtree(old_dir, ignore_errors=True)
+        shutil.copytree(store.publish(), old_dir)
+        with open(old_dir + 'playbooks/removed.yml', 'w') as rf:
+            rf.write('---\n')
+        for rel in store.list_files(old_dir):
+            if rel not in store.EDITABLE:
+                store.link_file(old_dir + rel, self.c_dir + rel)
+        with open(self.c_dir + store.REF, 'w') as rf:
+            rf.write('unittest-old\n')
+        os.remove(self.c_dir + 'playbooks/ambari.yml')
+        with open(self.c_dir + 'playbooks/ambari.yml', 'w') as af:
+            af.write('# Modified\n')
+
+        switched = store.link_cluster(self.c_name)
+        self.assertIn('playbooks/kerberos.yml', switched)
+        self.assertNotIn('playbooks/ambari.yml', switched)
+        self.assertFalse(os.path.exists(self.c_dir + 'playbooks/removed.yml'))
+        with open(self.c_dir + 'playbooks/ambari.yml', 'r') as af:
+            self.assertEqual('# Modified\n', af.read())
+        self.assertEqual(store.data_version(),
+                         store.cluster_version(self.c_name))
+        self.assertIn('unittest-old', store.prune())
+        self.assertFalse(os.path.isdir(old_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
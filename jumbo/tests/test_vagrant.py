@@ -0,0 +1,20 @@
+import unittest
+import socket
+
+from jumbo.core import vagrant
+
+
+class TestVagrant(unittest.TestCase):
+    def test_wait_ssh(self):
+        print('Test "wait_ssh"')
+        with socket.socket() as server:
+            server.bind(('127.0.0.1', 0))
+            server.listen(1)
+            port = server.getsockname()[1]
+            self.assertTrue(vagrant.wait_ssh('127.0.0.1', port, timeout=5))
+
+        self.assertFalse(vagrant.wait_ssh('127.0.0.1', port, timeout=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
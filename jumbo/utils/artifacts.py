@@ -0,0 +1,320 @@
+import contextlib
+import hashlib
+import json
+import os
+
+from jumbo.utils.settings import JUMBODIR, OS
+
+MANIFEST = '.jumbo_manifest'
+LOCK = '.jumbo_lock'
+
+
+@contextlib.contextmanager
+def lock(cluster, shared=False):
+    """Lock the generated files of a cluster against concurrent Jumbo
+    processes. No-op on Windows.
+
+    :param cluster: Cluster name
+    :type cluster: str
+    :param shared: Take a shared (read) lock, defaults to False
+    :type shared: bool, optional
+    """
+
+    if OS == 'Windows' or not os.path.isdir(JUMBODIR + cluster):
+        yield
+        return
+
+    import fcntl
+
+    with open(JUMBODIR + cluster + '/' + LOCK, 'a') as lf:
+        fcntl.flock(lf, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lf, fcntl.LOCK_UN)
+
+
+def fsync_dir(path):
+    """Persist the entries of a directory (renames). No-op on Windows.
+
+    :param path: Directory path
+    :type path: str
+    """
+
+    if OS == 'Windows':
+        return
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def temp_path(path):
+    head, tail = os.path.split(path)
+    return os.path.join(head, '.%s.tmp-%d' % (tail, os.getpid()))
+
+
+def atomic_write(path, content):
+    """Write a file through a temporary file and a rename, so that readers
+    see either the old or the new content.
+
+    :param path: File path
+    :type path: str
+    :param content: File content
+    :type content: str
+    """
+
+    tmp = temp_path(path)
+    try:
+        with open(tmp, 'w') as tf:
+            tf.write(content)
+            tf.flush()
+            os.fsync(tf.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+    fsync_dir(os.path.dirname(path))
+
+
+def load_manifest(cluster):
+    """Load the manifest of the artifacts generated for a cluster.
+
+    :param cluster: Cluster name
+    :type cluster: str
+    :return: The generation of the cluster files and the artifacts
+             (path -> hashes and stat)
+    :rtype: dict
+    """
+
+    try:
+        with open(JUMBODIR + cluster + '/' + MANIFEST, 'r') as mf:
+            manifest = json.load(mf)
+    except (IOError, ValueError):
+        manifest = {}
+
+    if 'artifacts' not in manifest:
+        manifest = {'generation': 0, 'artifacts': {}}
+    return manifest
+
+
+def save_manifest(cluster, manifest):
+    """Write the manifest of the artifacts generated for a cluster.
+
+    :param cluster: Cluster name
+    :type cluster: str
+    :param manifest: The manifest returned by `load_manifest`
+    :type manifest: dict
+    """
+
+    atomic_write(JUMBODIR + cluster + '/' + MANIFEST,
+                 json.dumps(manifest, indent=2, sort_keys=True))
+
+
+def generation(cluster):
+    """Return the generation of the files of a cluster, incremented on each
+    dump that changes them.
+
+    :param cluster: Cluster name
+    :type cluster: str
+    :rtype: int
+    """
+
+    return load_manifest(cluster)['generation']
+
+
+def digest(data):
+    """Return the hash of a string.
+
+    :type data: str
+    :rtype: str
+    """
+
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def inputs_hash(*inputs):
+    """Return the hash of the slices of the session an artifact depends on.
+
+    :param inputs: JSON serializable values or read-only views of dicts
+    :rtype: str
+    """
+
+    return digest(json.dumps(inputs, sort_keys=True, default=dict))
+
+
+def file_stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def open_batch(cluster):
+    """Start a group of artifacts writes for a cluster.
+
+    The files are written to temporary files by `write_artifact` and only
+    replace the artifacts on `commit_batch`. The batch holds the cluster lock
+    until it is committed or aborted.
+
+    :param cluster: Cluster name
+    :type cluster: str
+    :return: The batch
+    :rtype: dict
+    """
+
+    batch_lock = lock(cluster)
+    batch_lock.__enter__()
+    manifest = load_manifest(cluster)
+
+    return {
+        'cluster': cluster,
+        'lock': batch_lock,
+        'manifest': manifest,
+        'previous': json.dumps(manifest, sort_keys=True),
+        'staged': []
+    }
+
+
+def is_fresh(batch, path, inputs):
+    """Check if an artifact is up to date with its inputs.
+
+    The artifact is fresh if it was generated from the same inputs and has not
+    been modified on disk since.
+
+    :param batch: The batch returned by `open_batch`
+    :type batch: dict
+    :param path: Path of the artifact, relative to the cluster directory
+    :type path: str
+    :param inputs: Hash of the inputs of the artifact
+    :type inputs: str
+    :rtype: bool
+    """
+
+    entry = batch['manifest']['artifacts'].get(path)
+    if not entry or entry.get('inputs') != inputs:
+        return False
+
+    return entry.get('stat') == file_stat(
+        JUMBODIR + batch['cluster'] + '/' + path)
+
+
+def write_artifact(batch, path, content, inputs=None):
+    """Stage an artifact unless its content is unchanged.
+
+    The content can be streamed: its chunks are written to the staged file
+    as they are generated, and the file is dropped if the content turns out
+    unchanged.
+
+    :param batch: The batch returned by `open_batch`
+    :type batch: dict
+    :param path: Path of the artifact, relative to the cluster directory
+    :type path: str
+    :param content: Content of the artifact, or iterable of its chunks
+    :type content: str or iterable
+    :param inputs: Hash of the inputs of the artifact, defaults to None
+    :type inputs: str, optional
+    :return: True if the file will be written
+    :rtype: bool
+    """
+
+    full_path = JUMBODIR + batch['cluster'] + '/' + path
+    entry = batch['manifest']['artifacts'].get(path, {})
+
+    def unchanged(content_hash):
+        batch['manifest']['artifacts'][path] = {
+            'inputs': inputs,
+            'content': content_hash,
+            'stat': entry.get('stat')
+        }
+        return entry.get('content') == content_hash \
+            and entry.get('stat') == file_stat(full_path)
+
+    if isinstance(content, str):
+        if unchanged(digest(content)):
+            return False
+        content = [content]
+
+    tmp = temp_path(full_path)
+    tf = open(tmp, 'w')
+    try:
+        content_digest = hashlib.sha1()
+        for chunk in content:
+            tf.write(chunk)
+            content_digest.update(chunk.encode('utf-8'))
+        tf.flush()
+    except BaseException:
+        tf.close()
+        os.remove(tmp)
+        raise
+
+    if unchanged(content_digest.hexdigest()):
+        tf.close()
+        os.remove(tmp)
+        return False
+
+    batch['staged'].append((path, tmp, tf))
+    return True
+
+
+def commit_batch(batch):
+    """Persist the staged artifacts and release the cluster lock.
+
+    The staged files are synced together, renamed over the artifacts, then the
+    manifest is written with a new generation. The manifest is written last:
+    after a crash, the artifacts that don't match it are regenerated.
+
+    :param batch: The batch returned by `open_batch`
+    :type batch: dict
+    :return: True if files have been written
+    :rtype: bool
+    """
+
+    cluster_dir = JUMBODIR + batch['cluster'] + '/'
+    manifest = batch['manifest']
+    try:
+        for _, _, tf in batch['staged']:
+            os.fsync(tf.fileno())
+            tf.close()
+
+        dirs = set()
+        for path, tmp, _ in batch['staged']:
+            os.replace(tmp, cluster_dir + path)
+            manifest['artifacts'][path]['stat'] = file_stat(
+                cluster_dir + path)
+            dirs.add(os.path.dirname(cluster_dir + path))
+        for d in dirs:
+            fsync_dir(d)
+
+        written = bool(batch['staged'])
+        batch['staged'] = []
+        if written:
+            manifest['generation'] += 1
+        if written or json.dumps(manifest, sort_keys=True) \
+                != batch['previous']:
+            save_manifest(batch['cluster'], manifest)
+    except BaseException:
+        abort_batch(batch)
+        raise
+
+    batch['lock'].__exit__(None, None, None)
+    return written
+
+
+def abort_batch(batch):
+    """Drop the staged artifacts and release the cluster lock.
+
+    :param batch: The batch returned by `open_batch`
+    :type batch: dict
+    """
+
+    for _, tmp, tf in batch['staged']:
+        tf.close()
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+    batch['staged'] = []
+    batch['lock'].__exit__(None, None, None)
@@ -69,7 +69,17 @@ class CreationError(Error):
                                .format(self.object['name'],
                                        self.object['type'],
                                        self.conflict['value'])),
-            'LDAPNotCompatible': 'A "ldap" node cannot be of another type.'
+            'LDAPNotCompatible': 'A "ldap" node cannot be of another type.',
+            'StartFailed': ('These {} of the {} "{}" failed to start:\n - {}'
+                            .format(self.conflict['property'],
+                                    self.object['type'],
+                                    self.object['name'],
+                                    '\n - '.join(self.conflict['value']))),
+            'Rejected': ('The {} of the {} "{}" was rejected: {}'
+                         .format(self.conflict['property'],
+                                 self.object['type'],
+                                 self.object['name'],
+                                 self.conflict['value']))
         }
 
         return switcher.get(self.type, self.type)
@@ -96,6 +106,8 @@ class LoadError(Error):
                              self.object['name'])),
             'NoConfFile': ('Couldn\'t find the file "jumbo_config" for cluster'
                            ' "{}".\nAll cluster configuration has been lost.'
-                           .format(self.object['name']))
+                           .format(self.object['name'])),
+            'Cycle': ('The {} form a cycle: {}'
+                      .format(self.object['type'], self.object['name']))
         }
         return switcher.get(self.type, self.type)
@@ -1,11 +1,12 @@
-from jinja2 import Environment, PackageLoader
+import copy
+import itertools
 import json
-import yaml
 import os
+import types
 
-from jumbo.utils import exceptions as ex, checks, versions as vs
+from jumbo.utils import exceptions as ex, checks, versions as vs, artifacts
 from jumbo.utils.settings import JUMBODIR, NOT_HADOOP_COMP, POOLNAME
-from jumbo.core import clusters
+from jumbo.core import bake, clusters, mirror
 
 svars = {
     'cluster': None,
@@ -14,15 +15,96 @@ svars = {
     'services': [],
 }
 
-jinja_env = Environment(
-    loader=PackageLoader('jumbo.utils', 'templates'),
-    trim_blocks=True,
-    lstrip_blocks=True
-)
+index = {
+    'name': {},
+    'ip': {},
+    'component': {},
+    'type': {},
+    'order': {},
+    'seq': itertools.count(),
+    'service': {},
+    'services': {},
+    'dirty': set()
+}
+index['view'] = types.MappingProxyType(index['services'])
+
+jinja_env = None
+TEMPLATES_CACHE = JUMBODIR + '.cache/templates/'
+# Number of template statements rendered per chunk
+STREAM_BUFFER = 64
+
+# Deferred persistence of the session (see `begin`)
+transaction = None
+
+HOSTS_PATH = 'playbooks/inventory/hosts'
+VARS_PATH = 'playbooks/inventory/group_vars/all'
+BLUEPRINT_PATH = 'playbooks/roles/postblueprint/files/blueprint.json'
+CLUSTER_PATH = 'playbooks/roles/postblueprint/files/cluster.json'
+KRB5_PATH = 'playbooks/roles/kerberos-part1/files/krb5-conf.json'
+
+# Groups of the Ansible inventory, and the node group of their members
+INVENTORY_GROUPS = [
+    ('ansiblehost', 'ansiblehost'),
+    ('pgsqlserver', 'pgsqlserver'),
+    ('ipaserver', 'ipaserver'),
+    ('ipaclients', 'ipaclient'),
+    ('ambariserver', 'ambariserver'),
+    ('ambariclients', 'ambariclient')
+]
+
+# Template of /etc/krb5.conf, rendered by Ambari
+KRB5_CONF_CONTENT = '''
+              [libdefaults]
+                renew_lifetime = 7d
+                forwardable = true
+                default_realm = {{realm}}
+                ticket_lifetime = 24h
+                dns_lookup_realm = false
+                dns_lookup_kdc = false
+                default_ccache_name = /tmp/krb5cc_%{uid}
+                # default_tgs_enctypes = {{encryption_types}}
+                # default_tkt_enctypes = {{encryption_types}}
+              {% if domains %}
+              [domain_realm]
+              {%- for domain in domains.split(',') %}
+                {{domain|trim()}} = {{realm}}
+              {%- endfor %}
+              {% endif %}
+              [logging]
+                default = FILE:/var/log/krb5kdc.log
+                admin_server = FILE:/var/log/kadmind.log
+                kdc = FILE:/var/log/krb5kdc.log
+
+              [realms]
+                {{realm}} = {
+              {%- if master_kdc %}
+                  master_kdc = {{master_kdc|trim()}}
+              {%- endif -%}
+              {%- if kdc_hosts > 0 -%}
+              {%- set kdc_host_list = kdc_hosts.split(',')  -%}
+              {%- if kdc_host_list and kdc_host_list|length > 0 %}
+                  admin_server = {{admin_server_host|default(kdc_host_list[0]|trim(), True)}}
+              {%- if kdc_host_list -%}
+              {%- if master_kdc and (master_kdc not in kdc_host_list) %}
+                  kdc = {{master_kdc|trim()}}
+              {%- endif -%}
+              {% for kdc_host in kdc_host_list %}
+                  kdc = {{kdc_host|trim()}}
+              {%- endfor -%}
+              {% endif %}
+              {%- endif %}
+              {%- endif %}
+                }
+
+              {# Append additional realm declarations below #}
+              '''
+
+# Layers of the blueprint properties, by increasing priority
+BP_LAYERS = ['template', 'derived', 'user']
 
 bp = {
-    'configurations': [],
-    'host_groups': [],
+    'configurations': {},
+    'host_groups': {},
     'settings': [],
     'Blueprints': {
         'stack_name': 'HDP',
@@ -31,54 +113,162 @@ bp = {
 }
 
 
+def get_jinja_env():
+    """Return the Jinja environment of Jumbo templates, created on first use.
+
+    The compiled templates are cached in `TEMPLATES_CACHE`, so that they are
+    only compiled again when their source changes.
+
+    :rtype: jinja2.Environment
+    """
+
+    global jinja_env
+    if not jinja_env:
+        from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader
+
+        try:
+            os.makedirs(TEMPLATES_CACHE, exist_ok=True)
+            cache = FileSystemBytecodeCache(TEMPLATES_CACHE)
+        except OSError:
+            cache = None
+        jinja_env = Environment(
+            loader=PackageLoader('jumbo.utils', 'templates'),
+            bytecode_cache=cache,
+            trim_blocks=True,
+            lstrip_blocks=True
+        )
+    return jinja_env
+
+
+def stream_template(name, **context):
+    """Render a template of Jumbo by chunks.
+
+    :param name: Template name
+    :type name: str
+    :return: The chunks of the rendered template
+    :rtype: jinja2.environment.TemplateStream
+    """
+
+    stream = get_jinja_env().get_template(name).stream(**context)
+    stream.enable_buffering(STREAM_BUFFER)
+    return stream
+
+
 def dump_config(services_components_hosts=None):
     """Dump the session's cluster config and generates the project.
 
+    Only the artifacts whose inputs changed since the last dump are
+    regenerated, and only the files whose content changed are rewritten.
+    The files are replaced atomically, under the cluster lock, then the
+    cluster's summary is updated in the summary index (see
+    `clusters.summarize_clusters`).
+
+    Inside a transaction, the dump is deferred to the next checkpoint.
+
     :return: True on success
     """
 
+    if transaction is not None:
+        transaction['dirty'] = True
+        transaction['blueprint'] |= bool(services_components_hosts)
+        return True
+
+    cluster = svars['cluster']
     try:
-        generate_ansible_groups()
-        with open(JUMBODIR + svars['cluster'] + '/jumbo_config', 'w') as cfg:
-            json.dump(svars, cfg)
-
-        vagrant_temp = jinja_env.get_template('Vagrantfile.j2')
-        with open(JUMBODIR + svars['cluster'] + '/Vagrantfile', 'w') as vf:
-            vf.write(vagrant_temp.render(hosts=get_ordered_nodes(),
-                                         domain=svars['domain'],
-                                         cluster=svars['cluster'],
-                                         pool_name=POOLNAME))
-
-        hosts_temp = jinja_env.get_template('hosts.j2')
-        with open(JUMBODIR + svars['cluster'] + '/playbooks/inventory/hosts',
-                  'w') as vf:
-            vf.write(hosts_temp.render(hosts=svars['nodes']))
-
-        with open(JUMBODIR + svars['cluster'] +
-                  '/playbooks/inventory/group_vars/all', 'w') as gva:
-            yaml.dump(generate_ansible_vars(), gva, default_flow_style=False,
-                      explicit_start=True)
-
-        if services_components_hosts:
+        batch = artifacts.open_batch(cluster)
+        try:
+            write_artifacts(batch, services_components_hosts)
+        except BaseException:
+            artifacts.abort_batch(batch)
+            raise
+        artifacts.commit_batch(batch)
+    except IOError:
+        return False
+    clusters.update_summary(svars)
+
+
+def write_artifacts(batch, services_components_hosts=None):
+    """Stage the generated files of the session's cluster that are outdated.
+
+    :param batch: The batch returned by `artifacts.open_batch`
+    :type batch: dict
+    """
+
+    generate_ansible_groups()
+    cluster = svars['cluster']
+
+    boxes = bake.node_boxes(svars['nodes'], cluster)
+    inputs = artifacts.inputs_hash(
+        nodes_slice('name', 'ip', 'ram', 'cpus', 'groups'),
+        svars['domain'], cluster, POOLNAME, boxes)
+    if not artifacts.is_fresh(batch, 'Vagrantfile', inputs):
+        artifacts.write_artifact(
+            batch, 'Vagrantfile',
+            stream_template('Vagrantfile.j2',
+                            hosts=get_ordered_nodes(),
+                            domain=svars['domain'],
+                            cluster=cluster,
+                            pool_name=POOLNAME,
+                            boxes=boxes),
+            inputs)
+
+    inputs = artifacts.inputs_hash(nodes_slice('name', 'ip', 'groups'),
+                                   INVENTORY_GROUPS)
+    if not artifacts.is_fresh(batch, HOSTS_PATH, inputs):
+        artifacts.write_artifact(batch, HOSTS_PATH,
+                                 json.dumps(generate_inventory(),
+                                            separators=(',', ':')),
+                                 inputs)
+
+    inputs = artifacts.inputs_hash(nodes_slice('name', 'groups'),
+                                   svars['domain'], svars['services'],
+                                   vs.versions_stamp(cluster),
+                                   mirror.base_url(svars['nodes']))
+    if not artifacts.is_fresh(batch, VARS_PATH, inputs):
+        import yaml
+
+        artifacts.write_artifact(
+            batch, VARS_PATH,
+            yaml.dump(generate_ansible_vars(), default_flow_style=False,
+                      explicit_start=True),
+            inputs)
+
+    if services_components_hosts:
+        inputs = artifacts.inputs_hash(
+            nodes_slice('name', 'ram', 'components', 'groups'),
+            svars['domain'], services_components_hosts,
+            svars.get('configurations', {}))
+        if not artifacts.is_fresh(batch, BLUEPRINT_PATH, inputs) \
+                or not artifacts.is_fresh(batch, CLUSTER_PATH, inputs):
             clear_bp()
             generate_blueprint(services_components_hosts)
-            with open(JUMBODIR + svars['cluster'] +
-                      '/playbooks/roles/postblueprint/files/blueprint.json',
-                      'w') as bpf:
-                json.dump(bp, bpf)
-            with open(JUMBODIR + svars['cluster'] +
-                      '/playbooks/roles/postblueprint/files/cluster.json',
-                      'w') as clf:
-                json.dump(generate_cluster(), clf)
-
-        if 'KERBEROS' in svars['services']:
-            with open(JUMBODIR + svars['cluster'] +
-                      '/playbooks/roles/kerberos-part1/files/krb5-conf.json',
-                      'w') as krbf:
-                json.dump(generate_krb5_conf(), krbf)
+            artifacts.write_artifact(batch, BLUEPRINT_PATH,
+                                     json.dumps(serialize_blueprint()),
+                                     inputs)
+            artifacts.write_artifact(batch, CLUSTER_PATH,
+                                     json.dumps(generate_cluster()), inputs)
+
+    if 'KERBEROS' in svars['services']:
+        inputs = artifacts.inputs_hash(nodes_slice('name', 'groups'),
+                                       svars['domain'])
+        if not artifacts.is_fresh(batch, KRB5_PATH, inputs):
+            artifacts.write_artifact(batch, KRB5_PATH,
+                                     json.dumps(generate_krb5_conf()),
+                                     inputs)
+
+    # Renamed last: the other files are generated from it
+    artifacts.write_artifact(batch, 'jumbo_config', json.dumps(svars))
+
+
+def nodes_slice(*keys):
+    """Return the values of some properties of the session's nodes.
+
+    :param keys: The node properties
+    :type keys: str
+    :rtype: list
+    """
 
-    except IOError:
-        return False
+    return [[n[k] for k in keys] for n in svars['nodes']]
 
 
 def load_config(cluster):
@@ -90,6 +280,10 @@ def load_config(cluster):
     """
     global svars
 
+    # The session is the reference inside a transaction
+    if transaction is not None and svars['cluster'] == cluster:
+        return True
+
     if not checks.check_cluster(cluster):
         raise ex.LoadError('cluster', cluster, 'NotExist')
 
@@ -97,10 +291,12 @@ def load_config(cluster):
         raise ex.LoadError('cluster', cluster, 'NoConfFile')
     else:
         try:
-            with open(JUMBODIR + cluster + '/jumbo_config', 'r') as jc:
+            with artifacts.lock(cluster, shared=True), \
+                    open(JUMBODIR + cluster + '/jumbo_config', 'r') as jc:
                 svars = json.load(jc)
         except IOError as e:
             raise ex.LoadError('cluster', cluster, e.strerror)
+        reindex()
 
     vs.update_versions_file()
 
@@ -117,9 +313,10 @@ def clear():
         'nodes': [],
         'services': []
     }
+    reindex()
     bp = {
-        'configurations': [],
-        'host_groups': [],
+        'configurations': {},
+        'host_groups': {},
         'settings': [],
         'Blueprints': {
             'stack_name': 'HDP',
@@ -128,14 +325,82 @@ def clear():
     }
 
 
+def begin():
+    """Start a transaction on the session.
+
+    Until `commit` or `rollback`, the commands work on the in-memory session
+    only: `load_config` keeps the session and `dump_config` is deferred.
+    """
+
+    global transaction
+    transaction = {
+        'snapshot': copy.deepcopy(svars),
+        'dirty': False,
+        'blueprint': False
+    }
+
+
+def checkpoint():
+    """Persist the session changes made since the last checkpoint, and keep
+    the transaction open.
+
+    :return: True if the cluster has been dumped
+    :rtype: bool
+    """
+
+    global transaction
+    if transaction is None or not transaction['dirty']:
+        return False
+
+    pending = transaction
+    transaction = None
+    try:
+        if pending['blueprint']:
+            from jumbo.core import services
+
+            dump_config(services.get_services_components_hosts())
+        else:
+            dump_config()
+    finally:
+        begin()
+
+    return True
+
+
+def commit():
+    """Persist the session changes and end the transaction.
+
+    :return: True if the cluster has been dumped
+    :rtype: bool
+    """
+
+    global transaction
+    dumped = checkpoint()
+    transaction = None
+    return dumped
+
+
+def rollback():
+    """Restore the session as of the last checkpoint and end the transaction.
+    """
+
+    global svars, transaction
+    if transaction is None:
+        return
+
+    svars = transaction['snapshot']
+    transaction = None
+    reindex()
+
+
 def clear_bp():
     """Reset the blueprint configuration.
     """
 
     global bp
     bp = {
-        'configurations': [],
-        'host_groups': [],
+        'configurations': {},
+        'host_groups': {},
         'settings': [],
         'Blueprints': {
             'stack_name': 'HDP',
@@ -144,6 +409,125 @@ def clear_bp():
     }
 
 
+def reindex():
+    """Rebuild the indexes of the session's nodes and services.
+
+    Must be called each time `svars` is replaced.
+    """
+
+    global index
+    index = {
+        'name': {},
+        'ip': {},
+        'component': {},
+        'type': {},
+        'order': {},
+        'seq': itertools.count(),
+        'service': {},
+        'services': {},
+        'dirty': set()
+    }
+    index['view'] = types.MappingProxyType(index['services'])
+    for node in svars['nodes']:
+        index_node(node)
+    for service in svars['services']:
+        index_service(service)
+    index['dirty'].clear()
+
+
+def index_node(node):
+    index['name'][node['name']] = node
+    index['ip'][node['ip']] = node
+    if node['name'] not in index['order']:
+        index['order'][node['name']] = next(index['seq'])
+    for c in node['components']:
+        index['component'].setdefault(c, {})[node['name']] = None
+        index_component(c)
+    for t in node['types']:
+        index['type'].setdefault(t, {})[node['name']] = None
+
+
+def unindex_node(node):
+    index['name'].pop(node['name'], None)
+    if index['ip'].get(node['ip']) is node:
+        index['ip'].pop(node['ip'])
+    for c in node['components']:
+        index['component'].get(c, {}).pop(node['name'], None)
+        index_component(c)
+    for t in node['types']:
+        index['type'].get(t, {}).pop(node['name'], None)
+
+
+def sort_nodes(names):
+    """Sort node names in the order of the session's nodes.
+
+    :param names: Node names
+    :type names: iterable
+    :rtype: list
+    """
+
+    return sorted(names, key=index['order'].get)
+
+
+def get_node(name):
+    """Return the node with a specified name.
+
+    :param name: Machine name
+    :type name: str
+    :return: The node configuration, or None if it doesn't exist
+    :rtype: dict
+    """
+
+    return index['name'].get(name)
+
+
+def get_node_by_ip(ip):
+    """Return the node using a specified IP.
+
+    :param ip: IP address
+    :type ip: str
+    :return: The node configuration, or None if the IP is not used
+    :rtype: dict
+    """
+
+    return index['ip'].get(ip)
+
+
+def get_nodes_by_type(node_type):
+    """Return the nodes of a specified type, in the session's order.
+
+    :param node_type: Node type
+    :type node_type: str
+    :rtype: list
+    """
+
+    return [index['name'][n]
+            for n in sort_nodes(index['type'].get(node_type, ()))]
+
+
+def get_component_hosts(component):
+    """Return the names of the nodes hosting a component, in the session's
+    order.
+
+    :param component: Component name
+    :type component: str
+    :rtype: list
+    """
+
+    return sort_nodes(index['component'].get(component, ()))
+
+
+def count_component(component):
+    """Return the number of instances of a component.
+
+    :param component: Component name
+    :type component: str
+    :rtype: int
+    """
+
+    return len(index['component'].get(component, ()))
+
+
 def add_node(m):
     """Add a node to the current session.
 
@@ -151,13 +535,162 @@ def add_node(m):
     :type m: dict
     """
 
-    added = False
-    for i, node in enumerate(svars['nodes']):
-        if node['name'] == m['name']:
-            svars['nodes'][i] = m
-            added = True
-    if not added:
+    current = get_node(m['name'])
+    if current:
+        unindex_node(current)
+        svars['nodes'][svars['nodes'].index(current)] = m
+    else:
         svars['nodes'].append(m)
+    index_node(m)
+
+
+def remove_node(name):
+    """Remove a node of the current session.
+
+    :param name: Machine name
+    :type name: str
+    """
+
+    node = get_node(name)
+    if node:
+        unindex_node(node)
+        index['order'].pop(name, None)
+        svars['nodes'].remove(node)
+
+
+def set_node_ip(name, ip):
+    """Change the IP of a node of the current session.
+
+    :param name: Machine name
+    :type name: str
+    :param ip: New IP address
+    :type ip: str
+    """
+
+    node = get_node(name)
+    if index['ip'].get(node['ip']) is node:
+        index['ip'].pop(node['ip'])
+    node['ip'] = ip
+    index['ip'][ip] = node
+
+
+def add_component(name, component):
+    """Add a component to a node of the current session.
+
+    :param name: Machine name
+    :type name: str
+    :param component: Component name
+    :type component: str
+    """
+
+    get_node(name)['components'].append(component)
+    index['component'].setdefault(component, {})[name] = None
+    index_component(component)
+
+
+def remove_component(name, component):
+    """Remove a component of a node of the current session.
+
+    :param name: Machine name
+    :type name: str
+    :param component: Component name
+    :type component: str
+    """
+
+    get_node(name)['components'].remove(component)
+    index['component'].get(component, {}).pop(name, None)
+    index_component(component)
+
+
+def add_service(name):
+    """Add a service to the current session.
+
+    :param name: Service name
+    :type name: str
+    """
+
+    svars['services'].append(name)
+    index_service(name)
+
+
+def remove_service(name):
+    """Remove a service of the current session.
+
+    :param name: Service name
+    :type name: str
+    """
+
+    svars['services'].remove(name)
+    index['service'].pop(name, None)
+    index['services'].pop(name, None)
+
+
+def service_components(service):
+    from jumbo.core import services
+
+    return services.get_catalog()['service_components'].get(service, [])
+
+
+def index_service(service):
+    hosts = {}
+    index['service'][service] = hosts
+    for c in service_components(service):
+        if index['component'].get(c):
+            hosts[c] = tuple(get_component_hosts(c))
+    index['services'][service] = types.MappingProxyType(hosts)
+
+
+def index_component(component):
+    """Mark the hosts of a component as changed in the services view, which
+    is updated when it is read.
+
+    :param component: Component name
+    :type component: str
+    """
+
+    index['dirty'].add(component)
+
+
+def refresh_view():
+    """Update the hosts of the changed components in the services view.
+    """
+
+    from jumbo.core import services
+
+    component_service = services.get_catalog()['component_service']
+    for component in index['dirty']:
+        service = component_service.get(component)
+        hosts = index['service'].get(service)
+        if hosts is None:
+            continue
+
+        if not index['component'].get(component):
+            hosts.pop(component, None)
+        elif component in hosts:
+            hosts[component] = tuple(get_component_hosts(component))
+        else:
+            hosts[component] = tuple(get_component_hosts(component))
+            # Keep the components in the order of the catalog
+            for c in service_components(service):
+                if c in hosts:
+                    hosts[c] = hosts.pop(c)
+    index['dirty'].clear()
+
+
+def get_services_components_hosts():
+    """Return the view services->components->hosts of the session cluster.
+
+    The view is updated with the components changed since the last call,
+    each changed component being sorted once, and is read-only: the hosts
+    are tuples, in the session's order, and only the components having
+    hosts are listed.
+
+    :return: The services->components->hosts view
+    :rtype: types.MappingProxyType
+    """
+
+    refresh_view()
+    return index['view']
 
 
 def get_ordered_nodes():
@@ -210,6 +743,40 @@ def generate_ansible_groups():
                 node['groups'].append('ipaclient')
 
 
+def generate_inventory():
+    """Generate the Ansible inventory of the session's cluster in one pass
+    over the nodes.
+
+    The inventory is in the format of Ansible's `yaml` inventory plugin,
+    and is dumped as JSON: Ansible reads it as is, whatever the number of
+    groups.
+
+    :return: The hosts with their variables, and the members of each group
+    :rtype: dict
+    """
+
+    hosts = {}
+    children = {group: {'hosts': {}} for group, _ in INVENTORY_GROUPS}
+    members = {node_group: children[group]['hosts']
+               for group, node_group in INVENTORY_GROUPS}
+
+    for node in svars['nodes']:
+        hosts[node['name']] = {
+            'ansible_host': node['ip'],
+            'ansible_user': 'vagrant'
+        }
+        for group in node['groups']:
+            if group in members:
+                members[group][node['name']] = None
+
+    return {
+        'all': {
+            'hosts': hosts,
+            'children': children
+        }
+    }
+
+
 def get_pgsqlserver_host():
     """Return the fqdn of the node hosting the PSQL_SERVER.
     """
@@ -257,43 +824,86 @@ def generate_ansible_vars():
         'kerberos_enabled': ('KERBEROS' in svars['services'])
     }
 
-    ansible_vars.update(vs.get_yaml_config(svars['cluster']))
+    yaml_versions = vs.get_yaml_config(svars['cluster'])
+    mirror_base = mirror.base_url(svars['nodes'])
+    if mirror_base:
+        mirror.rewrite_versions(yaml_versions, mirror_base)
+    ansible_vars.update(yaml_versions)
 
     return ansible_vars
 
 
 def bp_create_conf_section(section):
-    bp.get('configurations').append({
-        section: {
-            'properties': {}
-        }
-    })
+    """Add a section to the blueprint 'configurations' if it isn't yet.
 
+    :param section: Section name
+    :type section: str
+    """
+
+    bp['configurations'].setdefault(section, {})
 
-def bp_set_conf_prop(section, prop, value):
+
+def bp_set_conf_prop(section, prop, value, layer='derived'):
     """Set a property in a specified section of the blueprint 'configurations'.
 
+    A property set by a layer of higher priority (see `BP_LAYERS`) is kept.
+
     :param section: Section in which the property to set is
     :type section: str
     :param prop: The property to set
     :type prop: str
     :param value: The value of the property
     :type value: str
+    :param layer: 'template', 'derived' or 'user'
+    :type layer: str
     :return: True on success
     """
 
-    for i, item in enumerate(bp.get('configurations')):
-        if item.get(section):
-            bp.get('configurations')[i] \
-                .get(section) \
-                .get('properties')[prop] = value
-            return True
-    return False
+    props = bp['configurations'].get(section)
+    if props is None:
+        return False
+    rank = BP_LAYERS.index(layer)
+    if prop in props and props[prop][0] > rank:
+        return False
+    props[prop] = (rank, value)
+    return True
 
 
-def bp_set_conf(section, prop_dict):
+def bp_set_conf(section, prop_dict, layer='derived'):
     for k, v in prop_dict.items():
-        bp_set_conf_prop(section, k, v)
+        bp_set_conf_prop(section, k, v, layer)
+
+
+def bp_set_user_conf():
+    """Apply the properties of the cluster's 'configurations' over the
+    generated ones.
+    """
+
+    for section, prop_dict in svars.get('configurations', {}).items():
+        bp_create_conf_section(section)
+        bp_set_conf(section, prop_dict, 'user')
+
+
+def serialize_blueprint():
+    """Return the blueprint in the format of Ambari, with the
+    'configurations' as a list of sections and the 'host_groups' as a list
+    of groups.
+
+    :rtype: dict
+    """
+
+    return dict(bp, configurations=[
+        {section: {'properties': {k: v for k, (_, v) in props.items()}}}
+        for section, props in bp['configurations'].items()
+    ], host_groups=[
+        {
+            'cardinality': str(len(hg['hosts'])),
+            'components': [{'name': c} for c in hg['components']],
+            'configurations': [],
+            'name': name
+        }
+        for name, hg in bp['host_groups'].items()
+    ])
 
 
 def fqdn(host):
@@ -326,7 +936,7 @@ def generate_blueprint_conf(serv_comp_hosts):
 
     bp_create_conf_section('core-site')
 
-    bp_set_conf_prop('core-site', 'fs.trash.interval', '360')
+    bp_set_conf_prop('core-site', 'fs.trash.interval', '360', 'template')
 
     if 'HDFS' in serv_comp_hosts:
         bp_create_conf_section('hdfs-site')
@@ -360,6 +970,8 @@ def generate_blueprint_conf(serv_comp_hosts):
     if 'ZOOKEEPER' in serv_comp_hosts:
         complete_conf_zookeeper(serv_comp_hosts)
 
+    bp_set_user_conf()
+
 
 def complete_conf_zookeeper(serv_comp_hosts):
     if 'ZOOKEEPER_SERVER' in serv_comp_hosts['ZOOKEEPER']:
@@ -467,10 +1079,10 @@ def generate_yarnsite(yarn_comp):
     container_max_memory = 1536
     node_max_containers = 100
     if 'NODEMANAGER' in yarn_comp:
-        for m in svars['nodes']:
-            if m['name'] in yarn_comp['NODEMANAGER']:
-                if node_max_containers > int(m['ram'] / 1536):
-                    node_max_containers = int(m['ram'] / 1536)
+        for name in yarn_comp['NODEMANAGER']:
+            m = get_node(name)
+            if node_max_containers > int(m['ram'] / 1536):
+                node_max_containers = int(m['ram'] / 1536)
     node_max_memory = node_max_containers * container_max_memory
 
     prop_dict = {
@@ -506,10 +1118,10 @@ def generate_yarnsite_ha(yarn_comp):
     container_max_memory = 1536
     node_max_containers = 100
     if 'NODEMANAGER' in yarn_comp:
-        for m in svars['nodes']:
-            if m['name'] in yarn_comp['NODEMANAGER']:
-                if node_max_containers > int(m['ram'] / 1536):
-                    node_max_containers = int(m['ram'] / 1536)
+        for name in yarn_comp['NODEMANAGER']:
+            m = get_node(name)
+            if node_max_containers > int(m['ram'] / 1536):
+                node_max_containers = int(m['ram'] / 1536)
     node_max_memory = node_max_containers * container_max_memory
 
     prop_dict = {
@@ -592,7 +1204,7 @@ def generate_hiveenv(hive_comp):
         'hive_database_name': 'hive',
         'hive_database_type': 'postgres'
     }
-    bp_set_conf('hive-env', prop_dict)
+    bp_set_conf('hive-env', prop_dict, 'template')
 
 
 def generate_webhcatsite(hive_comp):
@@ -628,14 +1240,15 @@ def generate_hbasesite(hbase_comp):
         'hbase.zookeeper.property.clientPort': '2181',
         'zookeeper.znode.parent': '/hbase-unsecure'
     }
-    bp_set_conf('hbase-site', prop_dict)
+    bp_set_conf('hbase-site', prop_dict, 'template')
 
 
 def generate_hbaseenv(hbase_comp):
     env = 'hbase-env'
     bp_set_conf_prop(env,
                      'hbase_user',
-                     'hbase')
+                     'hbase',
+                     'template')
 
 
 def generate_hbasesite_ha(hbase_comp):
@@ -674,7 +1287,7 @@ def generate_spark2env(spark2_comp):
         'spark_log_dir': '/var/log/spark2',
         'spark_daemon_memory': '1024'
     }
-    bp_set_conf('spark2-env', prop_dict)
+    bp_set_conf('spark2-env', prop_dict, 'template')
 
 
 def complete_conf_zeppelin(serv_comp_hosts):
@@ -709,7 +1322,7 @@ def generate_zeppelinconfig():
         'zeppelin.interpreter.dir': 'interpreter',
         'zeppelin.config.fs.dir': 'conf'
     }
-    bp_set_conf('zeppelin-config', prop_dict)
+    bp_set_conf('zeppelin-config', prop_dict, 'template')
 
 
 def generate_zeppelinenv():
@@ -719,28 +1332,28 @@ def generate_zeppelinenv():
         'zeppelin_user': 'zeppelin',
         'zeppelin_group': 'zeppelin'
     }
-    bp_set_conf('zeppelin-env', prop_dict)
+    bp_set_conf('zeppelin-env', prop_dict, 'template')
 
 
 def generate_blueprint_hostgroups():
     """Complete the 'host_groups' section of the blueprint.
 
+    The nodes with the same Hadoop components share a host group, named
+    after the order of its first node in the cluster.
     """
 
+    groups = {}
     for m in svars['nodes']:
-        comp = []
-        for c in m['components']:
-            if blueprint_component(c):
-                comp.append({
-                    'name': c
-                })
+        comp = [c for c in m['components'] if blueprint_component(c)]
         if comp:
-            bp.get('host_groups').append({
-                "cardinality": "1",
-                "components": comp,
-                "configurations": [],
-                "name": "%s_group" % m['name']
-            })
+            key = frozenset(comp)
+            if key not in groups:
+                groups[key] = 'host_group_%d' % (len(groups) + 1)
+                bp['host_groups'][groups[key]] = {
+                    'components': comp,
+                    'hosts': []
+                }
+            bp['host_groups'][groups[key]]['hosts'].append(m['name'])
 
 
 def blueprint_component(component):
@@ -758,14 +1371,10 @@ def generate_cluster():
     """
 
     host_groups = []
-    for hg in bp['host_groups']:
+    for name, hg in bp['host_groups'].items():
         host_groups.append({
-            'name': '%s' % hg['name'],
-            'hosts': [
-                {
-                    'fqdn': fqdn(hg['name'].split('_')[0])
-                }
-            ]
+            'name': name,
+            'hosts': [{'fqdn': fqdn(h)} for h in hg['hosts']]
         })
 
     return {
@@ -807,51 +1416,7 @@ def generate_krb5_conf():
                             'domains': '',
                             'manage_krb5_conf': 'true',
                             'conf_dir': '/etc',
-                            'content': '''
-              [libdefaults]
-                renew_lifetime = 7d
-                forwardable = true
-                default_realm = {{realm}}
-                ticket_lifetime = 24h
-                dns_lookup_realm = false
-                dns_lookup_kdc = false
-                default_ccache_name = /tmp/krb5cc_%{uid}
-                # default_tgs_enctypes = {{encryption_types}}
-                # default_tkt_enctypes = {{encryption_types}}
-              {% if domains %}
-              [domain_realm]
-              {%- for domain in domains.split(',') %}
-                {{domain|trim()}} = {{realm}}
-              {%- endfor %}
-              {% endif %}
-              [logging]
-                default = FILE:/var/log/krb5kdc.log
-                admin_server = FILE:/var/log/kadmind.log
-                kdc = FILE:/var/log/krb5kdc.log
-
-              [realms]
-                {{realm}} = {
-              {%- if master_kdc %}
-                  master_kdc = {{master_kdc|trim()}}
-              {%- endif -%}
-              {%- if kdc_hosts > 0 -%}
-              {%- set kdc_host_list = kdc_hosts.split(',')  -%}
-              {%- if kdc_host_list and kdc_host_list|length > 0 %}
-                  admin_server = {{admin_server_host|default(kdc_host_list[0]|trim(), True)}}
-              {%- if kdc_host_list -%}
-              {%- if master_kdc and (master_kdc not in kdc_host_list) %}
-                  kdc = {{master_kdc|trim()}}
-              {%- endif -%}
-              {% for kdc_host in kdc_host_list %}
-                  kdc = {{kdc_host|trim()}}
-              {%- endfor -%}
-              {% endif %}
-              {%- endif %}
-              {%- endif %}
-                }
-
-              {# Append additional realm declarations below #}
-              '''
+                            'content': KRB5_CONF_CONTENT
                         }
                     }
                 }
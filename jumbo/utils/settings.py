@@ -3,7 +3,9 @@ import platform
 
 OS = platform.system()
 
-JUMBODIR = os.path.expanduser('~/.jumbo/')
+# Directory of the clusters and caches, overridable with JUMBO_HOME
+JUMBODIR = os.path.join(
+    os.path.expanduser(os.environ.get('JUMBO_HOME', '~/.jumbo')), '')
 POOLNAME = 'jumbo-storage'
 
 NOT_HADOOP_COMP = [
@@ -12,3 +14,6 @@ NOT_HADOOP_COMP = [
     'AMBARI_SERVER',
     'IPA_SERVER'
 ]
+
+# Maximum import time of the CLI, in milliseconds
+STARTUP_BUDGET = 150
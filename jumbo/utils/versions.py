@@ -1,3 +1,5 @@
+import copy
+import hashlib
 import json
 import os
 import pathlib
@@ -5,32 +7,110 @@ import pathlib
 from shutil import copyfile
 
 from jumbo.utils.settings import JUMBODIR
-from jumbo.utils import exceptions as ex
+from jumbo.utils import exceptions as ex, artifacts
 
+PACKAGED_VERSIONS = (os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))) + '/core/config/versions.json')
+CACHE_DIR = JUMBODIR + '.cache/'
+MERGE_STAMP = CACHE_DIR + 'versions.merged'
 
-if not os.path.isfile(JUMBODIR + 'versions.json'):
-    if not os.path.isdir(JUMBODIR):
-        pathlib.Path(JUMBODIR).mkdir()
-    copyfile(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) +
-             '/core/config/versions.json', JUMBODIR + 'versions.json')
+# Resolved versions of this process, by cluster
+resolved = {}
+
+
+def init_versions_file():
+    """Copy the default versions.json in ~/.jumbo/ if it doesn't exist yet.
+    """
+
+    if not os.path.isfile(JUMBODIR + 'versions.json'):
+        pathlib.Path(JUMBODIR).mkdir(parents=True, exist_ok=True)
+        copyfile(PACKAGED_VERSIONS, JUMBODIR + 'versions.json')
 
 
 def get_yaml_config(cluster=None):
     """Get the versions to use for each service/platform/ressource
 
+    The resolved versions are cached (in memory and in ~/.jumbo/.cache) until
+    one of the versions.json files in use is modified.
+
     :raises ex.LoadError: If the file versions.json doesn't exist
     :return: The versions to use
     :rtype: dict
     """
 
+    init_versions_file()
+    if not os.path.isfile(JUMBODIR + 'versions.json'):
+        raise ex.LoadError('file', JUMBODIR + 'versions.json', 'NotExist')
+
+    stamp = versions_stamp(cluster)
+    cached = resolved.get(cluster)
+    if not cached or cached['stamp'] != stamp:
+        cached = load_resolved_cache(cluster)
+    if not cached or cached['stamp'] != stamp:
+        cached = {
+            'stamp': stamp,
+            'versions': resolve_versions(cluster)
+        }
+        save_resolved_cache(cluster, cached)
+    resolved[cluster] = cached
+
+    return copy.deepcopy(cached['versions'])
+
+
+def resolved_cache_path(cluster):
+    # Clusters have their own namespace: a cluster can be named 'global'
+    if cluster:
+        return CACHE_DIR + 'versions-cluster-%s.json' % cluster
+    return CACHE_DIR + 'versions-global.json'
+
+
+def load_resolved_cache(cluster):
+    try:
+        with open(resolved_cache_path(cluster), 'r') as rc:
+            return json.load(rc)
+    except (IOError, ValueError):
+        return None
+
+
+def save_resolved_cache(cluster, cached):
+    path = resolved_cache_path(cluster)
+    try:
+        pathlib.Path(CACHE_DIR).mkdir(parents=True, exist_ok=True)
+        with open(path + '.%d' % os.getpid(), 'w') as rc:
+            json.dump(cached, rc)
+        os.replace(path + '.%d' % os.getpid(), path)
+    except OSError:
+        pass
+
+
+def clear_resolved_cache(cluster):
+    """Remove the cached resolved versions of a cluster.
+
+    :param cluster: Cluster name
+    :type cluster: str
+    """
+
+    resolved.pop(cluster, None)
+    try:
+        os.remove(resolved_cache_path(cluster))
+    except OSError:
+        pass
+
+
+def resolve_versions(cluster=None):
+    """Merge the global and cluster versions.json files.
+
+    :param cluster: Cluster name, defaults to None
+    :type cluster: str, optional
+    :return: The versions to use
+    :rtype: dict
+    """
+
     yaml_versions = {
         'services': {},
         'platform': {}
     }
 
-    if not os.path.isfile(JUMBODIR + 'versions.json'):
-        raise ex.LoadError('file', JUMBODIR + 'versions.json', 'NotExist')
-
     # Global versions settings
     with open(JUMBODIR + 'versions.json', 'r') as vs:
         jumbo_versions = json.load(vs)
@@ -51,6 +131,30 @@ def get_yaml_config(cluster=None):
     return yaml_versions
 
 
+def versions_stamp(cluster=None):
+    """Return the modification stamps of the versions.json files in use.
+
+    :param cluster: Cluster name, defaults to None
+    :type cluster: str, optional
+    :return: The (path, mtime, size) of each versions.json file
+    :rtype: list
+    """
+
+    paths = [JUMBODIR + 'versions.json']
+    if cluster:
+        paths.append(JUMBODIR + cluster + '/versions.json')
+
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        stamp.append([path, st.st_mtime_ns, st.st_size])
+
+    return stamp
+
+
 def update_yaml_versions(yaml_versions, json_versions):
     """
     Update the versions dictionnary to be printed in YAML with values from 
@@ -76,6 +180,8 @@ def update_yaml_versions(yaml_versions, json_versions):
             })
 
     if json_versions.get('platforms', False):
+        resources_urls = {r['name']: r['versions']
+                          for r in json_versions['resources']}
         for platform in json_versions['platforms']:
             version, resources = [(v, r) for (v, r)
                                   in platform['versions'].items()
@@ -83,9 +189,7 @@ def update_yaml_versions(yaml_versions, json_versions):
             platform_resources = {}
 
             for item in resources:
-                url = [r for r in json_versions['resources']
-                       if r['name'] == item['resource']][0]['versions'][
-                           item['version']]
+                url = resources_urls[item['resource']][item['version']]
                 platform_resources.update({
                     item['resource']: {
                         'version': item['version'],
@@ -108,44 +212,63 @@ def update_versions_file():
     Update the versions.json file found in ~/.jumbo/ with the newest 
     available versions
 
+    The merge is only done when the packaged versions.json has changed since
+    the last merge.
+
+    :return: True if ~/.jumbo/versions.json has been rewritten
+    :rtype: bool
     """
 
-    config_dir = os.path.dirname(
-        os.path.dirname(os.path.abspath(__file__))) + '/core/config/'
+    init_versions_file()
+
+    with open(PACKAGED_VERSIONS, 'rb') as u_vs:
+        raw = u_vs.read()
+    packaged_hash = hashlib.sha1(raw).hexdigest()
+
+    try:
+        with open(MERGE_STAMP, 'r') as ms:
+            if ms.read().strip() == packaged_hash:
+                return False
+    except IOError:
+        pass
 
-    with open(config_dir + 'versions.json', 'r') as u_vs:
-        up_to_date_versions = json.load(u_vs)
+    up_to_date_versions = json.loads(raw.decode('utf-8'))
 
     with open(JUMBODIR + 'versions.json', 'r') as c_vs:
         current_versions = json.load(c_vs)
 
     # Merge current services config
+    current_services = {s['name']: s for s in current_versions['services']}
     for service in up_to_date_versions['services']:
-        current_service = [s for s in current_versions['services']
-                           if s['name'] == service['name']]
+        current_service = current_services.get(service['name'])
         if current_service:
             for vers, _ in service['versions'].items():
-                current_url = current_service[0]['versions'].get(vers, False)
+                current_url = current_service['versions'].get(vers, False)
                 if current_url:
                     service['versions'][vers] = current_url
-            service['default'] = current_service[0]['default']
+            service['default'] = current_service['default']
 
     # Merge current platforms config
+    current_platforms = {p['name']: p for p in current_versions['platforms']}
     for platform in up_to_date_versions['platforms']:
-        current_platform = [p for p in current_versions['platforms']
-                            if p['name'] == platform['name']]
+        current_platform = current_platforms.get(platform['name'])
         if current_platform:
-            platform['default'] = current_platform[0]['default']
+            platform['default'] = current_platform['default']
 
     # Merge current resources config
+    current_resources = {r['name']: r for r in current_versions['resources']}
     for resource in up_to_date_versions['resources']:
-        current_resource = [r for r in current_versions['resources']
-                            if r['name'] == resource['name']]
+        current_resource = current_resources.get(resource['name'])
         if current_resource:
             for vers, _ in resource['versions'].items():
-                current_url = current_resource[0]['versions'].get(vers, False)
+                current_url = current_resource['versions'].get(vers, False)
                 if current_url:
                     resource['versions'][vers] = current_url
 
-    with open(JUMBODIR + 'versions.json', 'w') as c_vs:
-        json.dump(up_to_date_versions, c_vs, indent=2)
+    artifacts.atomic_write(JUMBODIR + 'versions.json',
+                           json.dumps(up_to_date_versions, indent=2))
+
+    pathlib.Path(CACHE_DIR).mkdir(parents=True, exist_ok=True)
+    artifacts.atomic_write(MERGE_STAMP, packaged_hash)
+
+    return True